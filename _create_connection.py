@@ -3,6 +3,7 @@
 """
 import sqlite3
 from debug.mylogging import g_logger
+from partsize import DEFAULT_PART_SIZE
 
 # maxcount being deprecated
 def _partition(total, maxsize=None):
@@ -21,7 +22,7 @@ def _partition(total, maxsize=None):
     Called By: _partitionRanges
     """
     if maxsize == None:
-        maxsize = 64 * 2**20
+        maxsize = DEFAULT_PART_SIZE
     rv = []
     measure_count = total // maxsize
     if measure_count == 0:
@@ -72,7 +73,7 @@ def _partitionRanges(target_length, maxsize=None):
     return ranges
 
 
-def _populate_connection(con, target_length, workDirectoryInfo):
+def _populate_connection(con, target_length, workDirectoryInfo, part_size=None):
     """add rows to tables to describe the work to be done given the size of the original file.
 
     Pre:
@@ -82,38 +83,58 @@ def _populate_connection(con, target_length, workDirectoryInfo):
         con: connection to database to insert records into
         target_length: size of the file to be compressed
         workDirectoryInfo: object providing information about the working directory specific to this work
+        part_size: the length of each part (None for the default)
 
     Post:
-        records inserted into |OriginalFile| and |Part| to record part count and ranges to be worked on
+        records inserted into |OriginalFile| and |Part| to record part count, size and ranges to be worked on
+        along with the hash of each part if workDirectoryInfo computed them (tree hash)
 
     Returns: None
 
     called by: create_connection
     """
 
-    ranges = _partitionRanges(target_length, None)
+    if part_size is None:
+        part_size = DEFAULT_PART_SIZE
+    ranges = _partitionRanges(target_length, part_size)
 
     con.execute(
         """
-            INSERT INTO OriginalFile(file_hash, part_count) VALUES (?,?)""",
+            INSERT INTO OriginalFile(file_hash, part_count, part_size) VALUES (?,?,?)""",
         (
             workDirectoryInfo.path_to_target_wdir.name,
             len(ranges),
+            part_size,
         ),
     )
 
-    con.executemany("INSERT INTO Part(start, end) VALUES (?,?)", ranges)
+    if workDirectoryInfo.part_hashes is not None:
+        con.executemany(
+            "INSERT INTO Part(start, end, hash) VALUES (?,?,?)",
+            [
+                (*read_range, part_hash)
+                for read_range, part_hash in zip(ranges, workDirectoryInfo.part_hashes)
+            ],
+        )
+    else:
+        con.executemany("INSERT INTO Part(start, end) VALUES (?,?)", ranges)
 
 
-def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo):
+def create_connection(
+    path_to_connection_file,
+    path_to_target,
+    workDirectoryInfo,
+    part_size=None,
+    target_length=None,
+):
     """create a new database and return the connection.
 
     Every job to compress shall have a database to keep information about the work
     incuding the ranges of the target file to be compressed independently |Part|,
-    the expected checksum (hash or length) as text of the downloaded part to verify
-    the downloaded part |Checksum|, the paths to the processed parts before they are
-    concatenated |OutputFile|, and the hash identifying the file to be compressed
-    |OriginalFile|.
+    the expected checksum (hash or length) as text of the downloaded part along with
+    its sha256 digest to verify the downloaded part |Checksum|, the paths to the
+    processed parts before they are concatenated |OutputFile|, and the hash identifying
+    the file to be compressed |OriginalFile|.
 
     Pre:
         None
@@ -123,6 +144,9 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
         path_to_targer: the Path to the target that will be compressed
         workDirectoryInfo: the WorkDirectoryInfo object to prepare the working directory
             including to create it before creating the database in it
+        part_size: the length of the parts to divide the target into (None for the default)
+        target_length: the length of the target (None for that of the file at
+            path_to_target, which is None for a streamed archive)
 
     Post:
         the working directory for the target has been created and the initial database
@@ -137,18 +161,21 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
     originalFileId {pk}
     file_hash TEXT
     part_count INT
+    part_size INT (NULL if begun before part sizes were configurable, i.e. 64MiB)
 
     Part
     ------------
     partId {pk}
     start INT
     end INT
+    hash TEXT (blake2b of the range, NULL unless computed)
 
     Checksum
     ------------
     checksumId {pk}
     partId INTEGER {fk}
     hash TEXT
+    digest TEXT (sha256 of the compressed part as reported by xz.sh, NULL if not)
 
     OutputFile
     -------------
@@ -156,6 +183,17 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
     partId INTEGER {fk}
     pathStr TEXT
 
+    PartTiming
+    -------------
+    partTimingId {pk}
+    partId INTEGER {fk}
+    session REAL (unix time the session recording it began)
+    source TEXT (name of the provider, or local)
+    stage TEXT (read, precompress, upload, xz, download or commit, see timing)
+    start REAL (unix time)
+    end REAL (unix time)
+    length INTEGER (bytes the stage went through, NULL for commit)
+
 
     Example:
         the target file is /tmp/blah.raw. $WORKDIR/<hash of target file> will be created along
@@ -166,13 +204,16 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
 
     workDirectoryInfo.create_skeleton()
 
-    con = sqlite3.connect(str(path_to_connection_file), isolation_level=None)
+    con = sqlite3.connect(
+        str(path_to_connection_file), isolation_level=None, check_same_thread=False
+    )
     con.execute(
         """
         CREATE TABLE OriginalFile(
             originalFileId INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
             file_hash TEXT NOT NULL,
-            part_count INTEGER NOT NULL
+            part_count INTEGER NOT NULL,
+            part_size INTEGER
         )"""
     )
 
@@ -181,7 +222,8 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
         CREATE TABLE Part(
             partId INTEGER PRIMARY KEY NOT NULL,
             start INTEGER NOT NULL,
-            end INTEGER NOT NULL
+            end INTEGER NOT NULL,
+            hash TEXT
             )"""
     )
 
@@ -190,7 +232,8 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
         CREATE TABLE Checksum(
             checksumId INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
             partId INTEGER NOT NULL,
-            hash)"""
+            hash,
+            digest TEXT)"""
     )
 
     con.execute(
@@ -201,6 +244,53 @@ def create_connection(path_to_connection_file, path_to_target, workDirectoryInfo
             pathStr TEXT NOT NULL)"""
     )
 
-    _populate_connection(con, path_to_target.stat().st_size, workDirectoryInfo)
+    _create_timing_table(con)
+
+    if target_length is None:
+        target_length = path_to_target.stat().st_size
+    _populate_connection(con, target_length, workDirectoryInfo, part_size)
 
     return con
+
+
+def _create_timing_table(con):
+    """create the PartTiming table (see create_connection) unless it exists"""
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS PartTiming(
+            partTimingId INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            partId INTEGER NOT NULL,
+            session REAL NOT NULL,
+            source TEXT,
+            stage TEXT NOT NULL,
+            start REAL NOT NULL,
+            end REAL NOT NULL,
+            length INTEGER)"""
+    )
+
+
+def upgrade_connection(con):
+    """add any columns missing from a database created by an earlier version of gompress.
+
+    Args:
+        con: connection to an existing job database
+
+    Post:
+        the tables have all columns documented in create_connection, added columns are NULL
+
+    called by: CTX when resuming
+    """
+
+    def _columns(table):
+        return [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+
+    if "part_size" not in _columns("OriginalFile"):
+        g_logger.debug("upgrading OriginalFile with column part_size")
+        con.execute("ALTER TABLE OriginalFile ADD COLUMN part_size INTEGER")
+    if "hash" not in _columns("Part"):
+        g_logger.debug("upgrading Part with column hash")
+        con.execute("ALTER TABLE Part ADD COLUMN hash TEXT")
+    if "digest" not in _columns("Checksum"):
+        g_logger.debug("upgrading Checksum with column digest")
+        con.execute("ALTER TABLE Checksum ADD COLUMN digest TEXT")
+    _create_timing_table(con)
@@ -9,16 +9,54 @@ requirements:
     the list passed to tar shall contain unique elements only
     for multiple files, a common root is identified and the list is reinterpreted as relative to that root
 
+the tar is built in-process by tarfile (in the GNU format, like tar) rather than by an external
+tar given every path as an argument, so there is no limit on how many files are archived. the
+trees are walked without recursion and a pool of threads opens the files (reading small files
+whole) a window ahead of the member being written, so that archiving many small files is not
+held up by the latency of each lookup and open (see _add_members).
+
+alternatively stream_archive produces the tar stream in-process and cuts it into chunk files
+as long as the parts of the job while it is being produced, hashing it on the fly (sha1 of
+the whole and a blake2b hash of each chunk, see workdirectoryinfo). the tar then never
+exists as one temporary file to be read again to be hashed and divided.
+
+
+Typical usage example:
+
+streamedArchive = stream_archive(["/some/dir"], Path("./workdir"), 2**26)
+...
+streamedArchive.cleanup()
 """
 
 # authored by krunch3r (https://www.github.com/krunch3r76)
 # license GPL 3.0
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from subprocess import run
 from tempfile import TemporaryDirectory
+import hashlib
+import io
+import os
+import stat
+import struct
 import sys
+import tarfile
 from debug.mylogging import g_logger
+from workdirectoryinfo import HASH_READ_SIZE, TREE_HASH_DIGEST_SIZE
+
+try:
+    import grp
+    import pwd
+except ImportError:  # windows
+    grp = pwd = None
+
+TAR_BLOCK_SIZE = 512
+PREFETCH_WORKERS = 16
+# members opened ahead of the member being written (bounds the open files)
+PREFETCH_DEPTH = 256
+# files no longer than this are read whole by the thread opening them
+SMALL_FILE_SIZE = 2**16
 
 
 def _find_common_root(paths):
@@ -47,25 +85,13 @@ def _find_common_root(paths):
 
     Raises: None
     """
-    from functools import reduce
-
     paths = [Path(path) for path in paths]  # vestigial to list+rewrap into Path
     pathToSharedRoot = None
-    depth = 0
 
     if len(paths) > 1:
-        whetherLevelIsShared = True
-        while whetherLevelIsShared:
-            partsListAtLevel = [path.parts[depth] for path in paths]
-            reduced1 = reduce(lambda a, b: a if a == b else None, partsListAtLevel)
-            if reduced1 is None:
-                whetherLevelIsShared = False
-            else:
-                whetherLevelIsShared = True
-                depth += 1
-        shared_depth = depth - 1
-        root = Path(paths[0].parts[0])
-        pathToSharedRoot = root.joinpath(*paths[0].parts[1 : shared_depth + 1])
+        # compared part by part in one pass (a path may also be the root of another)
+        pathToSharedRoot = Path(os.path.commonpath(paths))
+        shared_depth = len(pathToSharedRoot.parts) - 1
     else:
         pathToSharedRoot = paths[0].parents[0]
         shared_depth = len(paths[0].parts)
@@ -81,7 +107,6 @@ def _strip_root_from_paths(paths, pathToCommonRoots):
 
     Process:
         map relative common
-        normalize from Path #review
 
     Returns:
         the paths input with the common root remapped to "."
@@ -90,13 +115,8 @@ def _strip_root_from_paths(paths, pathToCommonRoots):
         None
     """
 
-    stripped_paths_str = []
     pathToCommonRootsStr = str(pathToCommonRoots)
-    for path in paths:
-        path_stripped = str(path).replace(str(pathToCommonRoots), ".")
-        stripped_paths_str.append(path_stripped)
-
-    return [str(Path(stripped_path_str)) for stripped_path_str in stripped_paths_str]
+    return [os.path.relpath(path, pathToCommonRootsStr) for path in paths]
 
 
 class UserTempPath:
@@ -109,6 +129,10 @@ class UserTempPath:
         self.tempDir = TemporaryDirectory(prefix="gompress_")
         self.data = Path(self.tempDir.name) / file
 
+    def cleanup(self):
+        """remove the temporary directory and the child"""
+        self.tempDir.cleanup()
+
 
 def _establish_temporary_tar(files: list, target_basename):
     """formats a name for the target tar file and returns a temporary directory for it.
@@ -139,6 +163,12 @@ def _establish_temporary_tar(files: list, target_basename):
     Raises:
         None
     """
+    tarFile = UserTempPath(_archive_name(files, target_basename))
+    return tarFile
+
+
+def _archive_name(files: list, target_basename):
+    """return the name of the tar file (see _establish_temporary_tar)"""
     # pick a basename for the tar file
     if target_basename is None:
         if len(files) > 1:
@@ -154,8 +184,7 @@ def _establish_temporary_tar(files: list, target_basename):
         if not target_basename.endswith(".tar"):
             target_basename += ".tar"
         target_path = Path(target_basename)
-    tarFile = UserTempPath(target_path)
-    return tarFile
+    return target_path
 
 
 def _normalize_input_files(files: list):
@@ -201,6 +230,305 @@ def _normalize_input_files(files: list):
     return remapped_list
 
 
+def _relative_input_paths(files):
+    """return the common root of the (normalized) files and the files relative to it
+
+    the files are made unique and sorted (see archive)
+    """
+    paths = {
+        Path(file).resolve() for file in files
+    }  # string form consistently hashable
+    paths = list(paths)  # removes any duplicates
+    paths.sort()
+    g_logger.debug(f"paths input: {paths}")
+    pathToCommonRoot, level_end = _find_common_root(paths)
+    g_logger.debug(f"path to common root: {pathToCommonRoot}")
+    paths = _strip_root_from_paths(paths, pathToCommonRoot)
+    g_logger.debug(f"paths stripped of root: {paths}")
+    return pathToCommonRoot, paths
+
+
+def _walk_members(pathToCommonRoot, paths):
+    """yield the path, name in the archive and whether a regular file of each member
+
+    each path is followed by what is under it (if a directory, not a link to one) depth
+    first with the entries of a directory sorted by name, as tarfile.add would order
+    them, but without recursion (deep trees) and from the file types scandir reports.
+    """
+    for path in paths:
+        stack = [(os.path.join(pathToCommonRoot, path), path, None)]
+        while len(stack) > 0:
+            path_to_member, arcname, entry = stack.pop()
+            if entry is None:
+                is_dir = os.path.isdir(path_to_member) and not os.path.islink(
+                    path_to_member
+                )
+                is_file = os.path.isfile(path_to_member) and not os.path.islink(
+                    path_to_member
+                )
+            else:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = entry.is_file(follow_symlinks=False)
+            yield path_to_member, arcname, is_file
+            if is_dir:
+                with os.scandir(path_to_member) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+                stack.extend(
+                    (entry.path, os.path.join(arcname, entry.name), entry)
+                    for entry in reversed(entries)
+                )
+
+
+def _prefetch_member(path_to_member, is_file):
+    """stat a member ahead of its being archived, reading a small regular file whole and
+    opening a larger one
+
+    Returns:
+        (stat result, open file or None, content or None, link target or None)
+        None if the member was removed meanwhile
+    """
+    try:
+        if not is_file:
+            stat_result = os.lstat(path_to_member)
+            linkname = None
+            if stat.S_ISLNK(stat_result.st_mode):
+                linkname = os.readlink(path_to_member)
+            return stat_result, None, None, linkname
+        open_file = open(path_to_member, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        stat_result = os.fstat(open_file.fileno())
+        if stat_result.st_size <= SMALL_FILE_SIZE:
+            with open_file:
+                return stat_result, None, open_file.read(), None
+        return stat_result, open_file, None, None
+    except BaseException:
+        open_file.close()
+        raise
+
+
+def _owner_name(module, lookup, id):
+    """return the name of a user or group id ("" if unknown or on windows)"""
+    if module is None:
+        return ""
+    try:
+        return getattr(module, lookup)(id)[0]
+    except KeyError:
+        return ""
+
+
+class _TarWriter:
+    """write members to a file object in the GNU tar format as tarfile.TarFile would
+
+    unlike TarFile the TarInfo of each member is not kept once written (there may be
+    millions), the TarInfo is made from a stat result taken ahead (see _prefetch_member)
+    with the names of owners looked up once, the header of a member whose fields fit
+    their octal fields is packed directly (else by TarInfo.tobuf) and what is written is
+    gathered into blocks of bufsize before being passed on.
+
+    Attributes:
+        fileobj: the file object written to
+        offset: the count of bytes written (or gathered to be)
+    """
+
+    _HEADER = struct.Struct("100s8s8s8s12s12s8sc100s8s32s32s8s8s155s12x")
+
+    def __init__(self, fileobj, bufsize=HASH_READ_SIZE):
+        self.fileobj = fileobj
+        self.bufsize = bufsize
+        self.offset = 0
+        self.encoding = sys.getfilesystemencoding()
+        self.errors = "surrogateescape"
+        self._buffer = bytearray()
+        # the names archived by inode of regular files with several links
+        self._inodes = {}
+        self._owner_names = {}
+
+    def tarinfo(self, arcname, stat_result, linkname=None):
+        """return the TarInfo of a member as TarFile.gettarinfo would from its stat result,
+        or None if its type cannot be archived (e.g. a socket)"""
+        arcname = arcname.replace(os.sep, "/").lstrip("/")
+        mode = stat_result.st_mode
+        tarinfo = tarfile.TarInfo(arcname)
+        if stat.S_ISREG(mode):
+            inode = (stat_result.st_ino, stat_result.st_dev)
+            if stat_result.st_nlink > 1 and self._inodes.get(inode, arcname) != arcname:
+                # a hard link to a file archived already
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = self._inodes[inode]
+            else:
+                tarinfo.type = tarfile.REGTYPE
+                tarinfo.size = stat_result.st_size
+                if stat_result.st_nlink > 1 and inode[0]:
+                    self._inodes[inode] = arcname
+        elif stat.S_ISDIR(mode):
+            tarinfo.type = tarfile.DIRTYPE
+        elif stat.S_ISFIFO(mode):
+            tarinfo.type = tarfile.FIFOTYPE
+        elif stat.S_ISLNK(mode):
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = linkname
+        elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+            tarinfo.type = tarfile.CHRTYPE if stat.S_ISCHR(mode) else tarfile.BLKTYPE
+            if hasattr(os, "major") and hasattr(os, "minor"):
+                tarinfo.devmajor = os.major(stat_result.st_rdev)
+                tarinfo.devminor = os.minor(stat_result.st_rdev)
+        else:
+            return None
+        tarinfo.mode = mode
+        tarinfo.uid = stat_result.st_uid
+        tarinfo.gid = stat_result.st_gid
+        tarinfo.mtime = stat_result.st_mtime
+        if ("u", tarinfo.uid) not in self._owner_names:
+            self._owner_names[("u", tarinfo.uid)] = _owner_name(
+                pwd, "getpwuid", tarinfo.uid
+            )
+        if ("g", tarinfo.gid) not in self._owner_names:
+            self._owner_names[("g", tarinfo.gid)] = _owner_name(
+                grp, "getgrgid", tarinfo.gid
+            )
+        tarinfo.uname = self._owner_names[("u", tarinfo.uid)]
+        tarinfo.gname = self._owner_names[("g", tarinfo.gid)]
+        return tarinfo
+
+    def header(self, tarinfo):
+        """return the header block(s) of a member, the same as tarinfo.tobuf would"""
+        name = tarinfo.name
+        if tarinfo.type == tarfile.DIRTYPE and not name.endswith("/"):
+            name += "/"
+        name = name.encode(self.encoding, self.errors)
+        linkname = tarinfo.linkname.encode(self.encoding, self.errors)
+        mtime = int(tarinfo.mtime)
+        if (
+            len(name) > tarfile.LENGTH_NAME
+            or len(linkname) > tarfile.LENGTH_LINK
+            or tarinfo.type in (tarfile.CHRTYPE, tarfile.BLKTYPE)
+            or not 0 <= tarinfo.size < 8**11
+            or not 0 <= mtime < 8**11
+            or not 0 <= tarinfo.uid < 8**7
+            or not 0 <= tarinfo.gid < 8**7
+        ):
+            # long names (a header of their own) and numbers out of octal range
+            return tarinfo.tobuf(tarfile.GNU_FORMAT, self.encoding, self.errors)
+        header = bytearray(
+            self._HEADER.pack(
+                name,
+                b"%07o\0" % (tarinfo.mode & 0o7777),
+                b"%07o\0" % tarinfo.uid,
+                b"%07o\0" % tarinfo.gid,
+                b"%011o\0" % tarinfo.size,
+                b"%011o\0" % mtime,
+                b" " * 8,  # counted as spaces in the checksum
+                tarinfo.type,
+                linkname,
+                tarfile.GNU_MAGIC,
+                tarinfo.uname.encode(self.encoding, self.errors),
+                tarinfo.gname.encode(self.encoding, self.errors),
+                b"",
+                b"",
+                b"",
+            )
+        )
+        header[148:155] = b"%06o\0" % sum(header)
+        return header
+
+    def write(self, data):
+        self._buffer += data
+        self.offset += len(data)
+        if len(self._buffer) >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        if len(self._buffer) > 0:
+            self.fileobj.write(self._buffer)
+            self._buffer = bytearray()
+
+    def add(self, tarinfo, content=None, open_file=None):
+        """write a member, with its content as read or to be read from open_file
+
+        Raises:
+            OSError if open_file ends before tarinfo.size
+        """
+        if content is not None and tarinfo.isreg():
+            # the content as read (should the file have changed since)
+            tarinfo.size = len(content)
+        self.write(self.header(tarinfo))
+        if not tarinfo.isreg() or tarinfo.size == 0:
+            return
+        if content is not None:
+            self.write(content)
+        else:
+            self.flush()
+            remaining = tarinfo.size
+            while remaining > 0:
+                data = open_file.read(min(self.bufsize, remaining))
+                if not data:
+                    raise OSError(f"{open_file.name} ended while being archived")
+                self.fileobj.write(data)
+                self.offset += len(data)
+                remaining -= len(data)
+        remainder = tarinfo.size % TAR_BLOCK_SIZE
+        if remainder > 0:
+            self.write(bytes(TAR_BLOCK_SIZE - remainder))
+
+    def close(self):
+        """write the end of the archive (two zero blocks, padded to a full record)"""
+        self.write(bytes(2 * TAR_BLOCK_SIZE))
+        remainder = self.offset % tarfile.RECORDSIZE
+        if remainder > 0:
+            self.write(bytes(tarfile.RECORDSIZE - remainder))
+        self.flush()
+
+
+def _add_members(tarWriter, pathToCommonRoot, paths, max_workers=PREFETCH_WORKERS):
+    """add paths (relative to pathToCommonRoot) and what is under them to a _TarWriter
+
+    the members are written in order by the calling thread (so hard links are recognized
+    as tarfile.add would) while a pool of threads stats, opens and reads (small files)
+    up to PREFETCH_DEPTH members ahead, so that the latency of each lookup is hidden.
+
+    Raises:
+        OSError when a member cannot be read (a member removed meanwhile is skipped)
+    """
+    members = _walk_members(pathToCommonRoot, paths)
+    # (member, future of _prefetch_member) in the order written
+    prefetching = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            while True:
+                while len(prefetching) < PREFETCH_DEPTH:
+                    member = next(members, None)
+                    if member is None:
+                        break
+                    prefetching.append(
+                        (member, pool.submit(_prefetch_member, member[0], member[2]))
+                    )
+                if len(prefetching) == 0:
+                    break
+                (path_to_member, arcname, _), future = prefetching.popleft()
+                prefetched = future.result()
+                if prefetched is None:
+                    print(f"{path_to_member} was removed before it was read, skipping")
+                    continue
+                stat_result, open_file, content, linkname = prefetched
+                try:
+                    tarinfo = tarWriter.tarinfo(arcname, stat_result, linkname)
+                    if tarinfo is None:
+                        g_logger.debug(f"not archiving {path_to_member} of its type")
+                        continue
+                    tarWriter.add(tarinfo, content, open_file)
+                finally:
+                    if open_file is not None:
+                        open_file.close()
+        finally:
+            for _, future in prefetching:
+                if not future.cancel() and future.exception() is None:
+                    prefetched = future.result()
+                    if prefetched is not None and prefetched[1] is not None:
+                        prefetched[1].close()
+
+
 def archive(files, target_basename=None):
     """archives files or single directory into a temporary tar file and returns
 
@@ -229,36 +557,233 @@ def archive(files, target_basename=None):
         a UserTempPath object that references the created tar file in a temporary directory
 
     Raises:
-        None
+        OSError when an input cannot be read
     """
 
     files = _normalize_input_files(files)
-    paths = {
-        Path(file).resolve() for file in files
-    }  # string form consistently hashable
-    paths = list(paths)  # removes any duplicates
-    paths.sort()
-    g_logger.debug(f"paths input: {paths}")
-    pathToCommonRoot, level_end = _find_common_root(paths)
-    g_logger.debug(f"path to common root: {pathToCommonRoot}")
-    paths = _strip_root_from_paths(paths, pathToCommonRoot)
-    g_logger.debug(f"paths stripped of root: {paths}")
+    pathToCommonRoot, paths = _relative_input_paths(files)
     tarFileTarget = _establish_temporary_tar(files, target_basename)
-    run(
-        [
-            "tar",
-            "-c",
-            "-C",
-            f"{str(pathToCommonRoot)}",
-            "-f",
-            str(tarFileTarget.data),
-            *paths,
-        ]
-    )
+    with open(tarFileTarget.data, "wb") as open_file:
+        tarWriter = _TarWriter(open_file)
+        _add_members(tarWriter, pathToCommonRoot, paths)
+        tarWriter.close()
     g_logger.debug(f"target archive file: {tarFileTarget.data}")
     return tarFileTarget
 
 
+class _ChunkWriter:
+    """a write only file object cutting what is written into consecutive chunk files
+
+    what is written is hashed as it passes, the whole by sha1 and each chunk by blake2b
+    (as workdirectoryinfo hashes the whole file and each part of it).
+
+    Attributes:
+        length: the count of bytes written
+        sha1: the sha1 hash object of the whole
+        chunk_hashes: list of the hex blake2b hashes of the chunks written so far
+    """
+
+    def __init__(self, path_to_directory, chunk_size):
+        self.path_to_directory = Path(path_to_directory)
+        self.chunk_size = chunk_size
+        self.length = 0
+        self.sha1 = hashlib.sha1()
+        self.chunk_hashes = []
+        self._chunk = None
+        self._chunk_hash = None
+        self._chunk_remaining = 0
+
+    def _open_chunk(self):
+        self._chunk = open(
+            self.path_to_directory / f"chunk_{len(self.chunk_hashes)}", "wb"
+        )
+        self._chunk_hash = hashlib.blake2b(digest_size=TREE_HASH_DIGEST_SIZE)
+        self._chunk_remaining = self.chunk_size
+
+    def _close_chunk(self):
+        self._chunk.close()
+        self._chunk = None
+        self.chunk_hashes.append(self._chunk_hash.hexdigest())
+
+    def write(self, data):
+        with memoryview(data) as view:
+            return self._write(view.cast("B"))
+
+    def _write(self, view):
+        written = 0
+        while written < len(view):
+            if self._chunk is None:
+                self._open_chunk()
+            count = min(self._chunk_remaining, len(view) - written)
+            piece = view[written : written + count]
+            self._chunk.write(piece)
+            self._chunk_hash.update(piece)
+            self.sha1.update(piece)
+            self._chunk_remaining -= count
+            written += count
+            if self._chunk_remaining == 0:
+                self._close_chunk()
+        self.length += written
+        return written
+
+    def close(self):
+        """close the last (partial) chunk"""
+        if self._chunk is not None:
+            self._close_chunk()
+
+
+class StreamedArchive:
+    """the chunks of an archive streamed by stream_archive into a temporary directory
+
+    the archive is the concatenation of its chunks, each as long as chunk_size but the
+    last, so the part of the job [start, end) is chunk start // chunk_size as a whole.
+
+    Attributes:
+        name: the name of the archive (e.g. mydir.tar)
+        tempDir: the TemporaryDirectory holding the chunks
+        chunk_size: the length of the chunks (the part size of the job)
+        length: the length of the archive
+        sha1: the hex sha1 hash of the archive
+        chunk_hashes: list of the hex blake2b hashes of each chunk
+    """
+
+    def __init__(self, name, tempDir, chunk_size, length, sha1, chunk_hashes):
+        self.name = name
+        self.tempDir = tempDir
+        self.chunk_size = chunk_size
+        self.length = length
+        self.sha1 = sha1
+        self.chunk_hashes = chunk_hashes
+
+    def path_to_chunk(self, index):
+        """return the Path to the chunk at index (zero based)"""
+        return Path(self.tempDir.name) / f"chunk_{index}"
+
+    def open(self):
+        """return the archive opened for (buffered, seekable) reading across its chunks"""
+        return io.BufferedReader(_ChunkReader(self), HASH_READ_SIZE)
+
+    def cleanup(self):
+        """remove the chunks"""
+        self.tempDir.cleanup()
+
+
+class _ChunkReader(io.RawIOBase):
+    """read a StreamedArchive as one file, opening the chunk holding the position"""
+
+    def __init__(self, streamedArchive):
+        self._streamedArchive = streamedArchive
+        self._position = 0
+        self._chunk = None
+        self._chunk_index = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._streamedArchive.length
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self._streamedArchive.length:
+            return 0
+        index, offset_in_chunk = divmod(
+            self._position, self._streamedArchive.chunk_size
+        )
+        if index != self._chunk_index:
+            if self._chunk is not None:
+                self._chunk.close()
+            self._chunk = open(self._streamedArchive.path_to_chunk(index), "rb")
+            self._chunk_index = index
+        self._chunk.seek(offset_in_chunk)
+        count = self._chunk.readinto(buffer)
+        self._position += count
+        return count
+
+    def close(self):
+        if self._chunk is not None:
+            self._chunk.close()
+            self._chunk = None
+        super().close()
+
+
+def estimate_archive_length(files):
+    """return about how long the archive of files would be (e.g. to size parts by)
+
+    each file or directory counts one tar header and its length rounded up to a block.
+    """
+    files = _normalize_input_files(files)
+    length = 2 * TAR_BLOCK_SIZE  # end of archive
+    for file in {Path(file).resolve() for file in files}:
+        for dirpath, dirnames, filenames in (
+            os.walk(file) if file.is_dir() else [(file.parent, [], [file.name])]
+        ):
+            length += TAR_BLOCK_SIZE * (1 + len(dirnames))
+            for filename in filenames:
+                size = os.lstat(Path(dirpath) / filename).st_size
+                length += TAR_BLOCK_SIZE * (1 + -(-size // TAR_BLOCK_SIZE))
+    return length
+
+
+def stream_archive(files, path_to_parent_directory, chunk_size, target_basename=None):
+    """archive files or a single directory into chunks as the tar stream is produced
+
+    the files are taken and archived as by archive but into a writer that cuts the
+    stream into chunk files of chunk_size and hashes it on the way.
+
+    Args:
+        files: a Path castable sequence of file(s) or on windows glob expressions
+        path_to_parent_directory: the directory the temporary directory of chunks is
+            created in (e.g. the workdir, so that the chunks are on the same disk)
+        chunk_size: the length of each chunk, which shall be the part size of the job
+        target_basename: optional name of tar file with or without tar extension
+
+    Returns:
+        a StreamedArchive
+
+    Raises:
+        OSError when an input cannot be read
+    """
+    name = _archive_name(files, target_basename).name
+    files = _normalize_input_files(files)
+    pathToCommonRoot, paths = _relative_input_paths(files)
+    tempDir = TemporaryDirectory(prefix="gompress_", dir=path_to_parent_directory)
+    writer = _ChunkWriter(tempDir.name, chunk_size)
+    try:
+        tarWriter = _TarWriter(writer)
+        _add_members(tarWriter, pathToCommonRoot, paths)
+        tarWriter.close()
+        writer.close()
+    except BaseException:
+        writer.close()
+        tempDir.cleanup()
+        raise
+    g_logger.debug(
+        f"streamed archive {name} of {writer.length} bytes into"
+        f" {len(writer.chunk_hashes)} chunks at {tempDir.name}"
+    )
+    return StreamedArchive(
+        name,
+        tempDir,
+        chunk_size,
+        writer.length,
+        writer.sha1.hexdigest(),
+        writer.chunk_hashes,
+    )
+
+
 if __name__ == "__main__":
     import argparse
 
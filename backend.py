@@ -0,0 +1,119 @@
+"""execution backends the parts of a job are dispatched to for compression.
+
+a backend takes parts from the PendingParts of a session (of one or more jobs, a part
+being keyed by the index of its job's CTX and its id) and yields the result of each part
+it compresses as the dictionary recorded by CTX.record_result ("checksum" (length),
+"digest", "walltime", "path" and "model"). main() in gompress is written against this
+interface only, so the same partitioning, recording, verification and concatenation
+run whichever backend does the compressing.
+
+GolemBackend (in golembackend, which alone needs yapapi) tasks providers on the golem
+network. LocalBackend compresses in a pool of local processes as xz.sh would, needing
+no network (nor yapapi), so a job can run fully offline and be compared against golem.
+
+
+Typical usage example:
+
+async with LocalBackend(max_workers=4) as backend:
+    async for key, result, description in backend.execute(ctxs, pendingParts):
+        ctxs[key[0]].record_result(key[1], result)
+        pendingParts.complete(key)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+
+from localcompress import local_worker, create_local_pool
+
+
+class Backend(ABC):
+    """interface to dispatch the parts of a job and collect the results
+
+    Attributes:
+        name: short name of the backend shown in the run summary
+    """
+
+    name = None
+
+    async def __aenter__(self):
+        """acquire what the backend needs to run (e.g. a golem session)"""
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """release what was acquired on entry"""
+        return None
+
+    @abstractmethod
+    async def execute(self, ctxs, pendingParts):
+        """claim parts from pendingParts, compress them and yield each result
+
+        :param ctxs: the CTX of each job of the session
+        :param pendingParts: the PendingParts (of keys (index of the job, part id))
+            shared with any other workers
+        :yields: (key, result dictionary, description of the task for display)
+
+        the caller completes each part yielded in pendingParts. the generator ends when
+        every part is completed or the backend can make no further progress.
+        """
+
+    def report(self):
+        """return lines to add to the run summary (e.g. statistics of the backend)"""
+        return []
+
+
+class LocalBackend(Backend):
+    """compress parts in a pool of local processes (see localcompress)
+
+    Attributes:
+        max_workers: the number of processes compressing at once
+    """
+
+    name = "local"
+
+    def __init__(self, max_workers=None):
+        """:param max_workers: number of processes, one per core if None"""
+        self.max_workers = max_workers if max_workers else os.cpu_count() or 1
+        self._pool = None
+
+    async def __aenter__(self):
+        self._pool = create_local_pool(self.max_workers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._pool.shutdown(cancel_futures=True)
+        self._pool = None
+
+    async def execute(self, ctxs, pendingParts):
+        """run max_workers local workers yielding their results as they complete
+
+        a worker whose part failed to compress releases the part and goes on with the
+        others, the generator ends once all workers have stopped (e.g. with parts
+        failed repeatedly left pending, which verify then reports).
+        """
+        results = asyncio.Queue()
+        workers = [
+            asyncio.create_task(
+                local_worker(
+                    ctxs,
+                    pendingParts,
+                    self._pool,
+                    lambda key, result: results.put_nowait((key, result)),
+                )
+            )
+            for _ in range(self.max_workers)
+        ]
+        try:
+            while not all(worker.done() for worker in workers) or not results.empty():
+                try:
+                    key, result = await asyncio.wait_for(results.get(), 1)
+                except asyncio.TimeoutError:
+                    continue
+                yield key, result, f"Task computed locally: part {key[1]}"
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# benchmark.py
+"""measure the throughput and peak memory of the local stages of a job.
+
+the stages run on the requestor rather than on the providers, so on a small server
+they bound how fast parts can be fed to the network and how soon a job finishes:
+
+    sha1        hashing the target to identify the job (sha1_hash)
+    view        viewing each part of the target for upload (view_to_temporary_file)
+    precompress compressing each part before upload at each level (precompress_range)
+    archive     tarring a wide (one directory of many files) and a deep tree (archive)
+    concat      concatenating the downloaded parts (concatenate_and_finalize)
+    verify      verifying the lengths and digests of the parts (verify)
+
+each stage runs on synthetic data of a given size and kind, incompressible (random),
+text-like (text) or zero-filled (zero), in a process of its own (spawned) so that the
+peak resident set size reported is of that stage alone. the results are printed and
+written as json to be compared across releases.
+
+
+Typical usage example:
+
+$ python3 benchmark.py --size 256M --kind random --kind text --output bench.json
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from partsize import parse_size, DEFAULT_PART_SIZE
+
+STAGES = ["sha1", "view", "precompress", "archive", "concat", "verify"]
+KINDS = ["random", "text", "zero"]
+WRITE_CHUNK_SIZE = 2**20
+TREE_DEPTH = 64
+
+# words from which text-like data is drawn
+_WORDS = (
+    b"the of and to in is that for it as was with be by on not he this are or his from"
+    b" at which but have an they you were her all she there would their we him been has"
+    b" when who will more no if out so said what up its about into than them can only"
+    b" other new some could time these two may then do first any my now such like our"
+    b" over man me even most made after also did many before must through back years"
+).split()
+
+
+def write_synthetic(path_to_file, size, kind, seed=0):
+    """write size bytes of synthetic data of a kind ("random", "text" or "zero")"""
+    rng = random.Random(seed)
+    with open(path_to_file, "wb") as dst:
+        remaining = size
+        while remaining > 0:
+            count = min(WRITE_CHUNK_SIZE, remaining)
+            if kind == "random":
+                chunk = rng.randbytes(count)
+            elif kind == "text":
+                words = []
+                length = 0
+                while length < count:
+                    word = rng.choice(_WORDS)
+                    words.append(word)
+                    length += len(word) + 1
+                    if rng.random() < 0.08:
+                        words.append(b".\n")
+                        length += 2
+                chunk = b" ".join(words)[:count]
+            elif kind == "zero":
+                chunk = bytes(count)
+            else:
+                raise ValueError(f"unknown kind of data: {kind}")
+            dst.write(chunk)
+            remaining -= count
+
+
+def _write_tree(path_to_root, size, kind, shape, file_count):
+    """write file_count files totalling size bytes in a wide or deep directory tree"""
+    path_to_root.mkdir(parents=True)
+    file_size = max(size // file_count, 1)
+    # the deep tree nests TREE_DEPTH directories with a share of the files in each
+    files_per_level = max(file_count // TREE_DEPTH, 1)
+    path_to_directory = path_to_root
+    for index in range(file_count):
+        if shape == "deep" and index % files_per_level == 0:
+            path_to_directory = path_to_directory / f"level_{index // files_per_level}"
+            path_to_directory.mkdir()
+        write_synthetic(
+            path_to_directory / f"file_{index}", file_size, kind, seed=index
+        )
+
+
+def _prepare_parts(path_to_workdir, path_to_target, part_size):
+    """compress each part of a target (lightly) and record it as a job's result"""
+    from ctx import CTX
+    from localcompress import compress_part_locally
+
+    ctx = CTX(path_to_workdir, path_to_target, -1, 1, part_size_in=part_size)
+    for partId in ctx.list_pending_ids():
+        read_range = ctx.lookup_partition_range(partId)
+        result = compress_part_locally(
+            str(path_to_target),
+            read_range[0],
+            read_range[1],
+            ["-T1", "-0"],
+            str(ctx.work_directory_info.path_to_parts_directory / f"part_{partId}.xz"),
+        )
+        ctx.record_result(partId, result)
+    ctx.con.commit()
+    ctx.close()
+
+
+def _peak_rss():
+    """return the peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac os x
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run_stage(stage, options, connection):
+    """(runs in a spawned process) time a stage sending back (seconds, bytes, detail)"""
+    from ctx import CTX
+
+    path_to_target = Path(options["path_to_target"])
+    part_size = options["part_size"]
+    detail = None
+    if stage == "sha1":
+        from workdirectoryinfo import sha1_hash
+
+        baseline_rss = _peak_rss()
+        start = time.perf_counter()
+        detail = sha1_hash(path_to_target)
+        seconds = time.perf_counter() - start
+        length = path_to_target.stat().st_size
+    elif stage == "view":
+        ctx = CTX(
+            Path(options["path_to_workdir"]),
+            path_to_target,
+            -1,
+            1,
+            None,
+            part_size_in=part_size,
+        )
+        baseline_rss = _peak_rss()
+        start = time.perf_counter()
+        length = 0
+        for partId in range(1, ctx.part_count + 1):
+            view = ctx.view_to_temporary_file(partId)
+            # touch a byte of each page as an upload reading the view would
+            sum(view[::4096])
+            length += len(view)
+            ctx.release_view(view)
+        seconds = time.perf_counter() - start
+        ctx.close()
+    elif stage == "precompress":
+        from precompress import precompress_range
+
+        level = options["level"]
+        length = path_to_target.stat().st_size
+        baseline_rss = _peak_rss()
+        start = time.perf_counter()
+        compressed_length = 0
+        for offset in range(0, length, part_size):
+            compressed_length += len(
+                precompress_range(
+                    str(path_to_target), offset, min(offset + part_size, length), level
+                )
+            )
+        seconds = time.perf_counter() - start
+        detail = {"level": level, "ratio": compressed_length / max(length, 1)}
+    elif stage == "archive":
+        from archive import archive
+
+        path_to_tree = Path(options["path_to_tree"])
+        length = sum(
+            path.stat().st_size for path in path_to_tree.rglob("*") if path.is_file()
+        )
+        baseline_rss = _peak_rss()
+        start = time.perf_counter()
+        tarFile = archive([str(path_to_tree)])
+        seconds = time.perf_counter() - start
+        detail = {"shape": options["shape"], "files": options["file_count"]}
+        tarFile.tempDir.cleanup()
+    elif stage in ("concat", "verify"):
+        ctx = CTX(
+            Path(options["path_to_workdir"]),
+            path_to_target,
+            -1,
+            1,
+            None,
+            part_size_in=part_size,
+        )
+        baseline_rss = _peak_rss()
+        start = time.perf_counter()
+        if stage == "verify":
+            detail = {"verified": ctx.verify()}
+            length = sum(
+                path.stat().st_size
+                for path in ctx.work_directory_info.path_to_parts_directory.iterdir()
+            )
+        else:
+            ctx.concatenate_and_finalize()
+            length = ctx.len_file(target=False)
+        seconds = time.perf_counter() - start
+        ctx.close()
+    else:
+        raise ValueError(f"unknown stage: {stage}")
+    connection.send((seconds, length, detail, baseline_rss, _peak_rss()))
+    connection.close()
+
+
+def run_stage(stage, options):
+    """run a stage in a spawned process returning its result dictionary"""
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage, args=(stage, options, sender))
+    process.start()
+    sender.close()
+    try:
+        seconds, length, detail, baseline_rss, peak_rss = receiver.recv()
+    except EOFError:
+        process.join()
+        raise RuntimeError(f"the {stage} stage failed (exit code {process.exitcode})")
+    process.join()
+    return {
+        "stage": stage,
+        "bytes": length,
+        "seconds": seconds,
+        "mb_per_s": length / 10**6 / max(seconds, 1e-9),
+        "baseline_rss": baseline_rss,
+        "peak_rss": peak_rss,
+        "detail": detail,
+    }
+
+
+def run_benchmarks(path_to_scratch, size, kinds, stages, levels, part_size, file_count):
+    """run each of stages on data of each of kinds returning the list of results"""
+    results = []
+
+    def report(result):
+        result["kind"] = kind
+        results.append(result)
+        print(
+            f"{result['stage']:>11} {kind:>6}"
+            f" {result['bytes'] / 2**20:10,.{2}f}MiB"
+            f" {result['seconds']:8.{3}f}s"
+            f" {result['mb_per_s']:10,.{1}f}MB/s"
+            f" peak rss {result['peak_rss'] / 2**20:8,.{1}f}MiB"
+            f"{' ' + json.dumps(result['detail']) if result['detail'] else ''}"
+        )
+
+    for kind in kinds:
+        path_to_kind = path_to_scratch / kind
+        path_to_kind.mkdir()
+        path_to_target = path_to_kind / f"{kind}.bin"
+        write_synthetic(path_to_target, size, kind)
+        options = {"path_to_target": str(path_to_target), "part_size": part_size}
+        for stage in stages:
+            if stage == "sha1":
+                report(run_stage(stage, options))
+            elif stage == "view":
+                path_to_workdir = path_to_kind / "workdir_view"
+                path_to_workdir.mkdir()
+                report(
+                    run_stage(
+                        stage, {**options, "path_to_workdir": str(path_to_workdir)}
+                    )
+                )
+            elif stage == "precompress":
+                for level in levels:
+                    report(run_stage(stage, {**options, "level": level}))
+            elif stage == "archive":
+                for shape in ("wide", "deep"):
+                    path_to_tree = path_to_kind / f"tree_{shape}"
+                    _write_tree(path_to_tree, size, kind, shape, file_count)
+                    report(
+                        run_stage(
+                            stage,
+                            {
+                                **options,
+                                "path_to_tree": str(path_to_tree),
+                                "shape": shape,
+                                "file_count": file_count,
+                            },
+                        )
+                    )
+                    shutil.rmtree(path_to_tree)
+            elif stage in ("concat", "verify"):
+                # parts are compressed ahead (and again for each, concat consumes them)
+                path_to_workdir = path_to_kind / f"workdir_{stage}"
+                path_to_workdir.mkdir()
+                _prepare_parts(path_to_workdir, path_to_target, part_size)
+                report(
+                    run_stage(
+                        stage, {**options, "path_to_workdir": str(path_to_workdir)}
+                    )
+                )
+                shutil.rmtree(path_to_workdir)
+        shutil.rmtree(path_to_kind)
+    return results
+
+
+def _levels_argument(arg):
+    """parse a list of levels e.g. 0,1,6 or a range e.g. 0-9"""
+    levels = []
+    for item in arg.split(","):
+        if "-" in item:
+            first, last = item.split("-")
+            levels.extend(range(int(first), int(last) + 1))
+        else:
+            levels.append(int(item))
+    return levels
+
+
+def add_arguments_to_command_line_parser():
+    """build command line parser arguments and parse the arguments returning parser object"""
+    parser = argparse.ArgumentParser(
+        description="benchmark the local stages of a gompress job"
+    )
+    parser.add_argument(
+        "--size",
+        type=parse_size,
+        default="64M",
+        help="length of the synthetic target (and trees); default: %(default)s",
+    )
+    parser.add_argument(
+        "--kind",
+        action="append",
+        choices=KINDS,
+        help="kind of synthetic data, may be repeated; default: all",
+    )
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=STAGES,
+        help="stage to benchmark, may be repeated; default: all",
+    )
+    parser.add_argument(
+        "--levels",
+        type=_levels_argument,
+        default="0-9",
+        help="precompression levels e.g. 0,1,6 or 0-9; default: %(default)s",
+    )
+    parser.add_argument(
+        "--part-size",
+        type=parse_size,
+        default=DEFAULT_PART_SIZE,
+        help="length of the parts; default: 64M",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=1000,
+        help="number of files in the archived trees; default: %(default)s",
+    )
+    parser.add_argument(
+        "--scratch",
+        default=None,
+        help="directory to write the synthetic data in (it should be on the disk jobs"
+        " run from); default: a temporary directory",
+    )
+    parser.add_argument("--output", default=None, help="path to write the json to")
+    return parser
+
+
+if __name__ == "__main__":
+    args = add_arguments_to_command_line_parser().parse_args()
+    path_to_scratch = Path(tempfile.mkdtemp(prefix="gompress_bench_", dir=args.scratch))
+    try:
+        results = run_benchmarks(
+            path_to_scratch,
+            args.size,
+            args.kind or KINDS,
+            args.stage or STAGES,
+            args.levels,
+            args.part_size,
+            args.files,
+        )
+    finally:
+        shutil.rmtree(path_to_scratch, ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(
+                {
+                    "date": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "processor": platform.processor() or platform.machine(),
+                    "cpu_count": os.cpu_count(),
+                    "size": args.size,
+                    "part_size": args.part_size,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
@@ -1,11 +1,26 @@
 import os
 import sqlite3
-import io
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import timedelta
 
-from workdirectoryinfo import WorkDirectoryInfo, checksum
-from _create_connection import create_connection, _partition
+from workdirectoryinfo import (
+    WorkDirectoryInfo,
+    checksum,
+    sha256_hash,
+    part_hashes,
+    recorded_tree_part_size,
+)
+from _create_connection import create_connection, upgrade_connection, _partition
+from filecopy import copy_range
+from partreader import PartReader, ChunkedPartReader
+from precompress import create_precompress_pool
+from partsize import resolve_part_size, DEFAULT_PART_SIZE
+from partcache import PartCache
+from xzpreset import xz_arguments
+from xzindex import write_index, path_to_index
 from debug.mylogging import g_logger
 from gs.playsound import play_sound
 
@@ -18,10 +33,20 @@ class CTX:
     ---------------------------
     min_threads                 minimum threads we expect from a provider
     precompression_level        0-9 (compression level of bytes in memory before upload) or -1
-    path_to_target              the file to be compressed
-    / target_open_file          file object wrapping target file
+    precompress_workers         size of the process pool precompressing parts (None all cores)
+    / precompress_pool          ProcessPoolExecutor precompressing parts (created on first use
+                                unless shared by the jobs of a session)
+    spool_uploads               whether parts are spooled to files and uploaded from them
+    path_to_target              the file to be compressed (None for a streamed archive)
+    streamed_archive            StreamedArchive whose chunks are compressed instead or None
+    / name_of_target            the name of the file (or streamed archive) to be compressed
+    / target_length             the length of the file (or streamed archive) to be compressed
+    / target_open_file          file object wrapping target file (None for a streamed archive)
+    / part_reader               PartReader serving views of target_open_file (or
+                                ChunkedPartReader serving views of the streamed archive)
     / name_of_final_file        the name to which the compressed result will be stored
-    / path_to_final_file        Path object to final file
+    / path_to_final_file        Path object to final file (indexed by <final>.idx)
+    / part_size                 the length of each division (the last may be shorter)
     / part_count                the total number of divisions of the target file worked on
     path_to_local_workdir       Path to local working directory
     / work_directory_info       WorkDirectoryInfo object containing information about the working (sub)dir
@@ -30,13 +55,25 @@ class CTX:
     total_vm_run_time           updated with cumulative vm run times
     / whether_resuming          indicates whether the session is a continuation of a previous
     hx_con                      connection to history database
+    part_cache                  PartCache shared across jobs or None
+    / duplicate_parts           part id dispatched -> ids of parts of identical content
+    / session_started           unix time the session began (the timings are recorded under)
+    / closed                    whether close() was called
     ---------------------------
-    concatenate_and_finalize()  merge downloaded parts
+    concatenate_and_finalize()  merge downloaded parts and index them
     list_pending_ids()          check the connection to identify any missing parts
+    list_dispatch_ids()         pending parts less those duplicating another's content
+    record_result()             record the checksum and path of a compressed part
+    record_timings()            record when the stages of a part began and ended
+    serve_from_part_cache()     record pending parts found in the part cache
     reset_workdir()             clear pending work, from tables, (and files if applicable)
     verify()                    ensure checksums match what was told by the provider
     view_to_temporary_file()    get a memory view of a part of the file to be worked on
+    release_view()              give back a view from view_to_temporary_file()
+    close()                     unmap and close the target file, stop precompression pool,
+                                close the connections
     lookup_partition_range()    get the range [beg, end) for a specific division
+    locate_part()               get the file holding a specific division and its range in it
     len_file()                  return the size of the file {target, final}
     update_last_run()           timestamps the last run (after a set interval)
     """
@@ -47,6 +84,15 @@ class CTX:
         path_to_target_in,
         precompression_level_in,
         min_threads_in,
+        precompress_workers_in=None,
+        spool_uploads_in=False,
+        tree_hash_in=False,
+        part_size_in=None,
+        target_task_count_in=None,
+        part_cache_size_in=None,
+        streamed_archive_in=None,
+        precompress_pool_in=None,
+        overwrite_final_in=False,
     ):
         """initialize the context
 
@@ -57,31 +103,86 @@ class CTX:
         :param path_to_target_in:           Path to the file to compress
         :param precompression_level_in:     level of compression to use in memory before uploading (-1 none)
         :param min_theads_in:               minimum number of threads a provider should have to be used
+        :param precompress_workers_in:      processes to precompress with (None for every core)
+        :param spool_uploads_in:            whether to upload parts from files spooled in the workdir
+        :param tree_hash_in:                whether to identify the job by the tree hash of its parts
+        :param part_size_in:                length of the parts in bytes, "auto" or None (default,
+                                            or as recorded by the job being resumed)
+        :param target_task_count_in:        number of parts aimed for when part_size_in is "auto"
+        :param part_cache_size_in:          budget in bytes of the cache of compressed parts shared
+                                            across jobs (None or 0 to not use the cache)
+        :param streamed_archive_in:         StreamedArchive to compress instead of a file (then
+                                            path_to_target_in is None and the parts are its
+                                            chunks, whatever part_size_in)
+        :param precompress_pool_in:         ProcessPoolExecutor to precompress in shared with
+                                            other jobs (left running on close) or None to
+                                            create one on first use
+        :param overwrite_final_in:          whether a final file already there is overwritten
+                                            without asking (e.g. when serving, where no one
+                                            is at the terminal to answer)
 
         """
 
         self.whether_resuming = False
+        self.closed = False
+        self.session_started = time.time()
         ###############################
         # assign input attributes     #
         ###############################
         self.min_threads = min_threads_in
         self.precompression_level = precompression_level_in
+        self.precompress_workers = precompress_workers_in
+        self._precompress_pool = precompress_pool_in
+        self._owns_precompress_pool = precompress_pool_in is None
+        self.spool_uploads = spool_uploads_in
         self.path_to_target = path_to_target_in
+        self.streamed_archive = streamed_archive_in
         self.path_to_local_workdir = path_to_local_workdir_in
+        self.part_cache = None
+        if part_cache_size_in:
+            self.part_cache = PartCache(self.path_to_local_workdir, part_cache_size_in)
+        self.duplicate_parts = {}
 
         ###############################
         # assign computed properties  #
         ###############################
         self.total_vm_run_time = timedelta()
+        if self.streamed_archive is not None:
+            # the archive was cut into chunks as long as the parts are to be
+            self.name_of_target = self.streamed_archive.name
+            target_length = self.streamed_archive.length
+            part_size_in = self.streamed_archive.chunk_size
+        else:
+            self.name_of_target = self.path_to_target.name
+            target_length = self.path_to_target.stat().st_size
+        self.target_length = target_length
+        if part_size_in is None and tree_hash_in and self.streamed_archive is None:
+            # the tree hash identifying the job depends on the part size, which is
+            # then looked up before the job (and the size it recorded) can be found
+            part_size_in = recorded_tree_part_size(
+                self.path_to_target, self.path_to_local_workdir
+            )
+        self.part_size = resolve_part_size(
+            part_size_in, target_length, target_task_count_in
+        )
         self.work_directory_info = WorkDirectoryInfo(
-            self.path_to_local_workdir, self.path_to_target
+            self.path_to_local_workdir,
+            self.path_to_target,
+            tree_hash=tree_hash_in,
+            part_size=self.part_size,
+            streamed_archive=self.streamed_archive,
         )
-        self.name_of_final_file = self.path_to_target.name + ".xz"
+        self.name_of_final_file = self.name_of_target + ".xz"
         self.path_to_final_file = (
             self.work_directory_info.path_to_final_directory / self.name_of_final_file
         )
-        self.target_open_file = self.path_to_target.open("rb")
-        self.part_count = len(_partition(self.path_to_target.stat().st_size, None))
+        if self.streamed_archive is not None:
+            self.target_open_file = None
+            self.part_reader = ChunkedPartReader(self.streamed_archive)
+        else:
+            self.target_open_file = self.path_to_target.open("rb")
+            self.part_reader = PartReader(self.target_open_file)
+        self.part_count = len(_partition(target_length, self.part_size))
         self.path_to_connection_file = (
             self.work_directory_info.path_to_target_wdir / "work.db"
         )
@@ -89,8 +190,12 @@ class CTX:
         ###############################
         # update history connection   #
         ###############################
+        # the connections are used by the thread finalizing the job once the session
+        # is done with it (see gompress.Session)
         self.hx_con = sqlite3.connect(
-            str(path_to_history_connection), isolation_level=None
+            str(path_to_history_connection),
+            isolation_level=None,
+            check_same_thread=False,
         )
         self.hx_con.execute(
             "CREATE TABLE IF NOT EXISTS lastrun (completed_time DATETIME)"
@@ -103,6 +208,8 @@ class CTX:
                 self.path_to_connection_file,
                 self.path_to_target,
                 self.work_directory_info,
+                self.part_size,
+                target_length=self.target_length,
             )
 
         #########################
@@ -117,14 +224,24 @@ class CTX:
             ###########################
             new_connection = False  # may become true by end
             self.con = sqlite3.connect(
-                str(self.path_to_connection_file), isolation_level=None
+                str(self.path_to_connection_file),
+                isolation_level=None,
+                check_same_thread=False,
             )
-            last_part_count = self.con.execute(
-                "SELECT part_count FROM OriginalFile"
-            ).fetchone()[0]
+            upgrade_connection(self.con)
+            last_part_count, last_part_size = self.con.execute(
+                "SELECT part_count, part_size FROM OriginalFile"
+            ).fetchone()
             g_logger.debug(f"parts remaining: {last_part_count}")
+            if last_part_size is None:  # recorded before part sizes were configurable
+                last_part_size = DEFAULT_PART_SIZE
+
+            if part_size_in is None and last_part_size != self.part_size:
+                # no size was asked for, keep dividing as the job was begun
+                self.part_size = last_part_size
+                self.part_count = len(_partition(target_length, self.part_size))
 
-            if last_part_count != self.part_count:
+            if last_part_count != self.part_count or last_part_size != self.part_size:
                 ##############################
                 # ! overwrite bad connection #
                 ##############################
@@ -141,7 +258,11 @@ class CTX:
             ).fetchone()[0]
             self.whether_resuming = bool(downloaded_parts_count > 0)
 
-        if self.path_to_final_file.exists():
+        if self.path_to_final_file.exists() and overwrite_final_in:
+            g_logger.debug(f"overwriting {self.path_to_final_file}")
+            self.path_to_final_file.unlink()
+            path_to_index(self.path_to_final_file).unlink(missing_ok=True)
+        elif self.path_to_final_file.exists():
             path_to_sound_file = Path(
                 projectdir / "gs" / "256543__debsound__r2d2-astro-droid.wav"
             )
@@ -160,6 +281,7 @@ class CTX:
                 sys.exit(1)
 
             self.path_to_final_file.unlink()
+            path_to_index(self.path_to_final_file).unlink(missing_ok=True)
 
     def lookup_partition_range(self, partId):
         """get the range [beg, end) for a specific division"""
@@ -172,20 +294,51 @@ class CTX:
         )
         return read_range
 
+    def locate_part(self, partId):
+        """get the path (string) of the file holding a specific division and the range
+        [beg, end) of the division within it (the chunk of a streamed archive as a whole)"""
+        read_range = self.lookup_partition_range(partId)
+        if self.streamed_archive is None:
+            return str(self.path_to_target), read_range[0], read_range[1]
+        index = read_range[0] // self.part_size
+        return (
+            str(self.streamed_archive.path_to_chunk(index)),
+            0,
+            read_range[1] - read_range[0],
+        )
+
     def view_to_temporary_file(self, partId):
         """get a memory view of a part of the file to be worked on"""
 
-        # record = self.con.execute(
-        #     f"SELECT start, end FROM Part WHERE partId = {partId}"
-        # ).fetchone()
-        # read_range = (record[0], record[1])
         read_range = self.lookup_partition_range(partId)
-        self.target_open_file.seek(read_range[0])
-        bytesIO = io.BytesIO(self.target_open_file.read(read_range[1] - read_range[0]))
-        # return bytesIO.getvalue()
-        return (
-            bytesIO.getbuffer()
-        )  # bytesIO is cleaned up only when view is destroyed...
+        return self.part_reader.view(read_range[0], read_range[1])
+
+    def release_view(self, view):
+        """give back a view obtained from view_to_temporary_file once it is not needed"""
+        self.part_reader.release(view)
+
+    @property
+    def precompress_pool(self):
+        if self._precompress_pool is None:
+            self._precompress_pool = create_precompress_pool(self.precompress_workers)
+        return self._precompress_pool
+
+    def close(self):
+        """unmap and close the target file, stop any precompression processes and close
+        the connections (once, later calls do nothing)"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.part_cache is not None:
+            self.part_cache.close()
+        if self._precompress_pool is not None and self._owns_precompress_pool:
+            self._precompress_pool.shutdown(cancel_futures=True)
+        self._precompress_pool = None
+        self.part_reader.close()
+        if self.target_open_file is not None:
+            self.target_open_file.close()
+        self.con.close()
+        self.hx_con.close()
 
     def list_pending_ids(self):
         """check the connection to identify any missing parts"""
@@ -197,20 +350,155 @@ class CTX:
         # g_logger.debug(f"There are {len(list_of_pending_ids)} partitions to work on")
         return list_of_pending_ids
 
+    def _ensure_part_hashes(self):
+        """hash (in parallel) the parts whose content hash has not been recorded"""
+        rows = self.con.execute(
+            "SELECT partId, start, end FROM Part WHERE hash IS NULL ORDER BY partId"
+        ).fetchall()
+        if len(rows) == 0:
+            return
+        print(f"hashing {len(rows)} part{'s' if len(rows) > 1 else ''}...")
+        if self.streamed_archive is not None:
+            # hashed as the archive was streamed
+            chunk_hashes = self.streamed_archive.chunk_hashes
+            hashes = [chunk_hashes[row[1] // self.part_size] for row in rows]
+        else:
+            hashes = part_hashes(
+                self.path_to_target, [(row[1], row[2]) for row in rows]
+            )
+        self.con.executemany(
+            "UPDATE Part SET hash = ? WHERE partId = ?",
+            [(part_hash, row[0]) for part_hash, row in zip(hashes, rows)],
+        )
+
+    def part_cache_key(self, partId):
+        """return the key of the part in the part cache (content hash and xz arguments)"""
+        start, end, part_hash = self.con.execute(
+            "SELECT start, end, hash FROM Part WHERE partId = ?", (partId,)
+        ).fetchone()
+        return PartCache.make_key(part_hash, xz_arguments(end - start))
+
+    def _path_to_part(self, partId):
+        return self.work_directory_info.path_to_parts_directory / f"part_{partId}.xz"
+
+    def _insert_result(self, partId, checksum, digest, pathStr):
+        self.con.execute(
+            "INSERT INTO Checksum(partId, hash, digest) VALUES (?, ?, ?)",
+            (partId, checksum, digest),
+        )
+        self.con.execute(
+            "INSERT INTO OutputFile(partId, pathStr) VALUES (?, ?)", (partId, pathStr)
+        )
+
+    def record_result(self, partId, result):
+        """record the checksum and path of a compressed part
+
+        the part is added to the part cache (if used) and copied to any pending parts of
+        identical content.
+
+        :param partId: the part compressed
+        :param result: dictionary with the keys "checksum", "digest" and "path"
+        """
+        ##########################################################
+        # record length (checksum), digest and path in model     #
+        ##########################################################
+        self._insert_result(
+            partId, result["checksum"], result["digest"], result["path"]
+        )
+        if self.part_cache is None:
+            return
+        self.part_cache.store(
+            self.part_cache_key(partId), result["path"], result["digest"]
+        )
+        for duplicateId in self.duplicate_parts.pop(partId, []):
+            path_to_duplicate = self._path_to_part(duplicateId)
+            entry = self.part_cache.fetch(
+                self.part_cache_key(partId), path_to_duplicate
+            )
+            if entry is None:  # larger than the budget, copy directly
+                with open(result["path"], "rb") as src, open(
+                    path_to_duplicate, "wb"
+                ) as dst:
+                    copy_range(src.fileno(), dst.fileno(), int(result["checksum"]))
+            self._insert_result(
+                duplicateId,
+                result["checksum"],
+                result["digest"],
+                str(path_to_duplicate.as_posix()),
+            )
+
+    def record_timings(self, partId, timings, source=None):
+        """record when the stages of a compressed part began and ended (see timing)
+
+        :param partId: the part compressed
+        :param timings: list of (stage, start, end, length) with start and end in unix time
+        :param source: the name of the provider (or local) the part was compressed by
+        """
+        self.con.executemany(
+            "INSERT INTO PartTiming(partId, session, source, stage, start, end, length)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(partId, self.session_started, source, *timing) for timing in timings],
+        )
+
+    def serve_from_part_cache(self):
+        """record the pending parts whose compressed stream is in the part cache
+
+        Returns:
+            the count of parts served from the cache
+        """
+        if self.part_cache is None:
+            return 0
+        self._ensure_part_hashes()
+        served_count = 0
+        for partId in self.list_pending_ids():
+            path_to_part = self._path_to_part(partId)
+            entry = self.part_cache.fetch(self.part_cache_key(partId), path_to_part)
+            if entry is not None:
+                self._insert_result(
+                    partId, str(entry[0]), entry[1], str(path_to_part.as_posix())
+                )
+                served_count += 1
+        return served_count
+
+    def list_dispatch_ids(self):
+        """list the pending parts to dispatch, leaving out parts whose content is identical
+        to that of a part listed (these are recorded when the latter's result is)"""
+        pending_ids = self.list_pending_ids()
+        if self.part_cache is None:
+            return pending_ids
+        self._ensure_part_hashes()
+        self.duplicate_parts = {}
+        first_by_key = {}
+        dispatch_ids = []
+        for partId in pending_ids:
+            key = self.part_cache_key(partId)
+            if key in first_by_key:
+                self.duplicate_parts[first_by_key[key]].append(partId)
+            else:
+                first_by_key[key] = partId
+                self.duplicate_parts[partId] = []
+                dispatch_ids.append(partId)
+        return dispatch_ids
+
     def verify(self):
-        """ensure checksums match what was told by the provider"""
+        """ensure checksums (and digests where reported) match what was told by the provider"""
 
         if len(self.list_pending_ids()) != 0:
             return False  # need all parts to verify
 
         recordset = self.con.execute(
-            "SELECT pathStr, hash, partId FROM OutputFile NATURAL JOIN Checksum ORDER BY partId"
+            "SELECT pathStr, hash, partId, digest FROM OutputFile NATURAL JOIN Checksum"
+            " ORDER BY partId"
         ).fetchall()
         OK = True
         PATH_FIELD_OFFSET = 0
         HASH_FIELD_OFFSET = 1
         PARTID_FIELD_OFFSET = 2
+        DIGEST_FIELD_OFFSET = 3
         verify_statement = ""
+        #########################################
+        # check existence and length of parts   #
+        #########################################
         for i, record in enumerate(recordset, 1):
             verify_statement = f"verifying part {i} of {record[PARTID_FIELD_OFFSET]}..."
             print(verify_statement, end="\r")
@@ -224,28 +512,110 @@ class CTX:
                 OK = False
                 print(f"\npart {record[PARTID_FIELD_OFFSET]} BAD")
                 break
+
+        ##############################################
+        # compare digests, parts hashed in parallel  #
+        ##############################################
+        records_with_digest = [
+            record for record in recordset if record[DIGEST_FIELD_OFFSET] is not None
+        ]
+        if OK and len(records_with_digest) > 0:
+            with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+                future_to_record = {
+                    pool.submit(sha256_hash, record[PATH_FIELD_OFFSET]): record
+                    for record in records_with_digest
+                }
+                for i, future in enumerate(as_completed(future_to_record), 1):
+                    record = future_to_record[future]
+                    verify_statement = (
+                        f"verifying digest {i} of {len(records_with_digest)}..."
+                    )
+                    print(verify_statement, end="\r")
+                    if future.result() != record[DIGEST_FIELD_OFFSET]:
+                        OK = False
+                        print(f"\npart {record[PARTID_FIELD_OFFSET]} DIGEST MISMATCH")
+                        for pending_future in future_to_record:
+                            pending_future.cancel()
+                        break
         if OK:
             print(f"{verify_statement}\033[32m\u2713\033[0m")
         return OK
 
     def concatenate_and_finalize(self):
-        """merge downloaded parts"""
+        """merge downloaded parts and write the index of their streams (see xzindex)"""
 
         recordset = self.con.execute(
-            "SELECT pathStr from OutputFile ORDER BY partId"
+            "SELECT pathStr, Part.start, Part.end, Part.hash FROM OutputFile"
+            " JOIN Part ON OutputFile.partId = Part.partId ORDER BY OutputFile.partId"
         ).fetchall()
         PATHSTR_FIELD_OFFSET = 0
+        START_FIELD_OFFSET = 1
+        END_FIELD_OFFSET = 2
+        HASH_FIELD_OFFSET = 3
         paths = [Path(record[PATHSTR_FIELD_OFFSET]) for record in recordset]
-        # open first part for appending
+        # the compressed range of each part's stream in the final file, the range of the
+        # target it decompresses to and its hash (for the index)
+        streams = []
+        # open first part for appending (at an explicit offset, the kernel copy
+        # routines do not accept a file descriptor opened in append mode)
         path_to_first = paths.pop(0)
-        with open(str(path_to_first), "ab") as concat:
-            for path in paths:
+        start_time = time.perf_counter()
+        methods_used = set()
+        with open(str(path_to_first), "r+b") as concat:
+            offset = concat.seek(0, os.SEEK_END)
+            streams.append(
+                (
+                    0,
+                    offset,
+                    recordset[0][START_FIELD_OFFSET],
+                    recordset[0][END_FIELD_OFFSET],
+                    recordset[0][HASH_FIELD_OFFSET],
+                )
+            )
+            for path, record in zip(paths, recordset[1:]):
                 g_logger.debug(f"concatenating {path} with {path_to_first}")
                 with open(str(path), "rb") as to_concat:
-                    concat.write(to_concat.read())
+                    length = os.fstat(to_concat.fileno()).st_size
+                    copied, method = copy_range(
+                        to_concat.fileno(), concat.fileno(), length, 0, offset
+                    )
+                    streams.append(
+                        (
+                            offset,
+                            offset + copied,
+                            record[START_FIELD_OFFSET],
+                            record[END_FIELD_OFFSET],
+                            record[HASH_FIELD_OFFSET],
+                        )
+                    )
+                    offset += copied
+                    methods_used.add(method)
+        elapsed = time.perf_counter() - start_time
         path_to_first.rename(self.path_to_final_file)
         self.reset_workdir(keep_final=True)
 
+        ############################################
+        # index the streams (and members of a tar) #
+        ############################################
+        if self.streamed_archive is not None:
+            open_target = self.streamed_archive.open
+        else:
+            open_target = partial(self.path_to_target.open, "rb")
+        member_count = write_index(
+            path_to_index(self.path_to_final_file), streams, open_target
+        )
+        g_logger.debug(f"indexed {len(streams)} streams and {member_count} members")
+
+        ##############################
+        # report finalize throughput #
+        ##############################
+        final_mib = offset / 2**20
+        print(
+            f"finalized {final_mib:,.{2}f}MiB from {len(paths) + 1} parts in"
+            f" {elapsed:.{2}f}s ({final_mib / max(elapsed, 1e-6):,.{1}f}MiB/s"
+            f"{', via ' + ', '.join(sorted(methods_used)) if methods_used else ''})"
+        )
+
     def reset_workdir(self, keep_final=False):
         """clear parts and associated sql records"""
 
@@ -259,15 +629,20 @@ class CTX:
         self.con.execute(
             "DELETE FROM OutputFile"
         )  # no outputfile can exist now that parts are gone
+        path_to_spool_directory = self.work_directory_info.path_to_spool_directory
+        if path_to_spool_directory.exists():
+            for path_to_spool_file in path_to_spool_directory.iterdir():
+                path_to_spool_file.unlink()
         if not keep_final:
             if self.path_to_final_file.exists():
                 self.path_to_final_file.unlink()
+            path_to_index(self.path_to_final_file).unlink(missing_ok=True)
 
     def len_file(self, target=True):
         """return length of target (default) or final file"""
         filelen_rv = None
         if target:
-            filelen_rv = self.path_to_target.stat().st_size
+            filelen_rv = self.target_length
         else:
             if self.path_to_final_file.exists():
                 filelen_rv = self.path_to_final_file.stat().st_size
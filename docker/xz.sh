@@ -1,6 +1,7 @@
 #!/bin/bash
 # authored by krunch3r (https://www.github.com/krunch3r76)
 # pre: script command is run from workdir as defined in dockerfile
+# post: on success prints OK---<length>---<walltime>---<sha256 of output>---<cpu model>
 TARGET_FILE="$1"
 NAMESTEM=$(basename $TARGET_FILE .xz)
 
@@ -21,6 +22,7 @@ fi
 if [[ $? == 0 ]]; then
     echo -n "OK---$(stat -c %s $OUTPUT_FILEPATH)---"
     cat $OUTPUT_DIR/${NAMESTEM}.tim | grep "Elapsed" | sed -En 's/(.*): (.*)$/\2/p' | tr -d "\n"
+    echo -n "---$(sha256sum $OUTPUT_FILEPATH | cut -d ' ' -f 1)"
     echo "---$MODEL"
 else
     echo "ERROR"
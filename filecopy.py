@@ -0,0 +1,138 @@
+"""copy a range of bytes between open files without pulling the range through python.
+
+gompress moves large amounts of already written data from one file into another, e.g.
+when appending the downloaded parts to form the final file. reading each part into
+memory first grows the footprint of the requestor with the size of the part, so the
+copy is delegated to the kernel where the platform allows:
+
+    os.copy_file_range  (linux; also reflinks/shares extents on btrfs, xfs etc)
+    os.sendfile         (linux; copies in kernel space)
+    chunked readinto    (everywhere; a single buffer of CHUNK_SIZE is reused)
+
+a method that fails with an error indicating it is unsupported for the given pair of
+files (e.g. they are on different filesystems) falls back to the next for that copy
+only. a method the kernel lacks altogether (ENOSYS) is not tried again for the
+remainder of the process.
+
+Typical usage example:
+
+with open(path_to_src, "rb") as src, open(path_to_dst, "r+b") as dst:
+    copied, method = copy_range(src.fileno(), dst.fileno(), length, 0, dst_offset)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import errno
+import io
+import os
+from debug.mylogging import g_logger
+
+CHUNK_SIZE = 2**20  # bytes held in memory at any time by the fallback
+
+# errors signifying the method cannot be used for the given pair of files
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EBADF,
+    errno.EOPNOTSUPP,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+    getattr(errno, "ENOTSOCK", errno.EINVAL),
+}
+
+# errors signifying the method cannot be used at all, on any pair of files
+_UNAVAILABLE_ERRNOS = {errno.ENOSYS}
+
+# the methods the kernel lacks (for the remainder of the process)
+_unsupported_methods = set()
+
+
+def _copy_with_copy_file_range(fd_src, fd_dst, count, offset_src, offset_dst):
+    """copy via copy_file_range returning the count of bytes copied."""
+    copied = 0
+    while copied < count:
+        n = os.copy_file_range(
+            fd_src, fd_dst, count - copied, offset_src + copied, offset_dst + copied
+        )
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_with_sendfile(fd_src, fd_dst, count, offset_src, offset_dst):
+    """copy via sendfile returning the count of bytes copied."""
+    os.lseek(fd_dst, offset_dst, os.SEEK_SET)
+    copied = 0
+    while copied < count:
+        n = os.sendfile(fd_dst, fd_src, offset_src + copied, count - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_with_buffer(fd_src, fd_dst, count, offset_src, offset_dst):
+    """copy through a single reused buffer returning the count of bytes copied."""
+    buffer = memoryview(bytearray(min(CHUNK_SIZE, max(count, 1))))
+    src = io.FileIO(fd_src, "rb", closefd=False)
+    dst = io.FileIO(fd_dst, "r+b", closefd=False)
+    src.seek(offset_src)
+    dst.seek(offset_dst)
+    copied = 0
+    while copied < count:
+        n = src.readinto(buffer[: min(len(buffer), count - copied)])
+        if not n:
+            break
+        written = 0
+        while written < n:
+            written += dst.write(buffer[written:n])
+        copied += n
+    return copied
+
+
+_METHODS = []
+if hasattr(os, "copy_file_range"):
+    _METHODS.append(("copy_file_range", _copy_with_copy_file_range))
+if hasattr(os, "sendfile"):
+    _METHODS.append(("sendfile", _copy_with_sendfile))
+_METHODS.append(("buffer", _copy_with_buffer))
+
+
+def copy_range(fd_src, fd_dst, count, offset_src=0, offset_dst=0):
+    """copy count bytes from offset_src of fd_src to offset_dst of fd_dst.
+
+    Args:
+        fd_src: file descriptor opened for reading
+        fd_dst: file descriptor opened for writing (not in append mode)
+        count: number of bytes to copy
+        offset_src: where to begin reading on fd_src
+        offset_dst: where to begin writing on fd_dst
+
+    Returns:
+        a pair of the count of bytes copied (less than count only if fd_src ended early)
+        and the name of the last method used
+
+    Raises:
+        OSError on errors other than those indicating a method is unsupported
+    """
+    copied = 0
+    method_name = None
+    for method_name, method in _METHODS:
+        if method_name in _unsupported_methods:
+            continue
+        try:
+            copied += method(
+                fd_src, fd_dst, count - copied, offset_src + copied, offset_dst + copied
+            )
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            g_logger.debug(f"{method_name} unavailable ({e}), falling back")
+            if e.errno in _UNAVAILABLE_ERRNOS:
+                _unsupported_methods.add(method_name)
+            # any bytes written by the failed method are rewritten by the next one
+            continue
+        break
+    return copied, method_name
@@ -0,0 +1,1018 @@
+"""the backend tasking providers on the golem network with the parts of a session.
+
+kept apart from gompress so that yapapi is only imported when the providers are to be
+tasked, the local backend and the offline commands (extract, test, decompress and
+stats) running without it. each provider is worked by worker, which uploads the part(s)
+of a task, runs xz.sh on them and downloads the results (see GolemBackend.execute).
+
+
+Typical usage example:
+
+async with GolemBackend("public", 1, "erc20", "polygon", False) as backend:
+    async for key, result, description in backend.execute(ctxs, pendingParts):
+        ctxs[key[0]].record_result(key[1], result)
+        pendingParts.complete(key)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+# skeleton and utils adopted from Golem yapapi's code
+
+
+MAX_PRICE_CPU_HR = "1.0446"
+MAX_PRICE_DUR_HR = "1.005"
+START_PRICE = "0.0"
+
+from datetime import timedelta
+
+MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE = 6
+MAX_TIMEOUT_FOR_TASK = timedelta(minutes=MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE)
+# seconds a pipelined worker waits on the next task before collecting a part meanwhile
+PIPELINE_TAKE_SECONDS = 1.0
+
+import asyncio
+import time
+from collections import deque
+from decimal import Decimal
+from pathlib import Path, PurePosixPath
+from types import SimpleNamespace
+
+import yapapi
+from yapapi import (
+    Golem,
+    Task,
+    WorkContext,
+)
+from yapapi.payload import vm
+from yapapi.rest.activity import BatchTimeoutError
+
+
+from utils import (
+    TEXT_COLOR_CYAN,
+    TEXT_COLOR_DEFAULT,
+    TEXT_COLOR_RED,
+    TEXT_COLOR_MAGENTA,
+    format_usage,
+    print_env_info,
+)
+from debug.mylogging import g_logger
+
+from workdirectoryinfo import sha256_hash
+from timing import ScriptTimer
+from precompress import precompress_range
+from xzpreset import xz_arguments
+from partsize import auto_batch_size, AUTO
+from spool import spool_range, spool_precompressed_range
+from backend import Backend
+from providerstats import ProviderScoredMS
+from pipeline import (
+    launch_command,
+    wait_command,
+    cleanup_command,
+    DEFAULT_PIPELINE_DEPTH,
+)
+from speculation import (
+    Speculation,
+    SpeculationLost,
+    path_to_download,
+    path_to_spool,
+)
+
+try:
+    moduleFilterProviderMS = False
+    from gc__filterms import FilterProviderMS
+except ModuleNotFoundError:
+    pass
+else:
+    moduleFilterProviderMS = True
+
+
+projectdir = Path(__file__).parent
+
+
+class MyTask(Task):
+    """Task class extended to store a reference to the caller (ctx)
+
+    data is the tuple of the keys (index of the job, part id) of the parts (of the job of
+    mainctx) batched in the task, whose result is a dictionary of the result of each part
+    accepted by its key.
+    copy is 0 for the task of parts, or the number of a speculative copy of a part
+    """
+
+    def __init__(self, mainctx, data, copy=0):
+        self.mainctx = mainctx
+        self.copy = copy
+        super().__init__(data)
+
+
+class GolemBackend(Backend):
+    """task providers on the golem network with compressing parts (see worker)
+
+    Attributes:
+        subnet_tag, min_cpu_threads, payment_driver, payment_network, show_usage: as
+            provided on the command line
+        golem: the Golem engine while the backend is entered
+    """
+
+    name = "golem"
+
+    def __init__(
+        self,
+        subnet_tag,
+        min_cpu_threads,
+        payment_driver,
+        payment_network,
+        show_usage,
+        task_timeout=MAX_TIMEOUT_FOR_TASK,
+        max_workers=None,
+        speculation=None,
+        providerStats=None,
+        score_providers=True,
+        batch_size=AUTO,
+        pipeline_depth=DEFAULT_PIPELINE_DEPTH,
+        metrics=None,
+    ):
+        """
+        :param subnet_tag: provided as a cli argument
+        :param min_cpu_threads: the thread count beneath which provider offers are rejected
+            which is provided as a cli argument (only useful to eliminate unwanted providers
+            but may important if segmentation is >=128 MiB per task in the future)
+        :param payment_network: provided as a cli argument
+        :param show_usage: provided as a cli argument
+        :param task_timeout: timedelta after which a task is a failure and retried
+        :param max_workers: most providers worked at once, one per part if None
+        :param speculation: Speculation launching copies of straggling parts, None for
+            no speculative execution
+        :param providerStats: ProviderStats the throughput, failures and timeouts of each
+            provider are recorded in, None to not record them
+        :param score_providers: whether offers are scored by the throughput on record of
+            their provider (see ProviderScoredMS) rather than by price alone
+        :param batch_size: count of parts batched in each task, or AUTO to choose as
+            each task is dispatched (see auto_batch_size)
+        :param pipeline_depth: most tasks staged on a provider at once, above 1 the next
+            task uploads and the last downloads while a part compresses (see pipeline)
+        :param metrics: Metrics the bytes transferred, failures, retries and payments
+            are counted in, None to not count them
+        """
+        self.subnet_tag = subnet_tag
+        self.min_cpu_threads = min_cpu_threads
+        self.payment_driver = payment_driver
+        self.payment_network = payment_network
+        self.show_usage = show_usage
+        self.task_timeout = task_timeout
+        self.max_workers = max_workers
+        self.speculation = speculation if speculation is not None else Speculation(0)
+        self.providerStats = providerStats
+        self.score_providers = score_providers
+        self.batch_size = batch_size
+        self.pipeline_depth = max(pipeline_depth, 1)
+        self.metrics = metrics
+        self.scoredStrategy = None
+        self.golem = None
+
+    def create_golem(self, strategy, event_consumer):
+        """return the (not yet entered) engine to execute tasks on"""
+        return Golem(
+            budget=10.0,
+            subnet_tag=self.subnet_tag,
+            payment_driver=self.payment_driver,
+            payment_network=self.payment_network,
+            strategy=strategy,
+            event_consumer=event_consumer,
+        )
+
+    async def create_payload(self):
+        """return the vm payload the providers run the tasks in"""
+        # identify vm that tasked nodes are to use to process the payload/instructions
+        return await vm.repo(
+            image_hash="8f2396e5a50c206e5eb671816f67976841007e6d759511cb552c4b3e",
+            # only run on provider nodes that have more than 1.0gb of RAM available
+            min_mem_gib=1.0,  # later set this to 1.5 when 128mb divisions allowed
+            # only run on provider nodes that have more than 2gb of storage space available
+            min_storage_gib=2.0,  # this is more than enough for a 64-128 mb segment
+            # since the work is mostly done in memory
+            # only run on provider nodes which a certain number of CPU threads (logical CPU cores) available
+            min_cpu_threads=self.min_cpu_threads,
+        )
+
+    async def __aenter__(self):
+        """start the Golem engine with a strategy capped at the max prices"""
+        payment_network = self.payment_network
+
+        # sane defaults for cpu and dur per hr
+        if payment_network == "rinkeby":
+            max_price_for_cpu = Decimal("inf")
+            max_price_for_dur = Decimal("inf")
+        else:
+            max_price_for_cpu = Decimal(MAX_PRICE_CPU_HR)
+            max_price_for_dur = Decimal(MAX_PRICE_DUR_HR)
+
+        strategy = yapapi.strategy.LeastExpensiveLinearPayuMS(
+            max_fixed_price=Decimal(START_PRICE),
+            max_price_for={
+                yapapi.props.com.Counter.CPU: max_price_for_cpu / Decimal("3600.0"),
+                yapapi.props.com.Counter.TIME: max_price_for_dur / Decimal("3600.0"),
+            },
+        )
+
+        # prefer the providers expected to compress the most per GLM over the cheapest
+        if self.providerStats is not None and self.score_providers:
+            self.scoredStrategy = ProviderScoredMS(strategy, self.providerStats)
+            strategy = self.scoredStrategy
+
+        # if gc__filterms has been successfully imported, wrap the strategy
+        if moduleFilterProviderMS:
+            strategy = FilterProviderMS(strategy)
+
+        metrics = self.metrics
+
+        # ----------------------------------------------
+        # --------------- emitter() --------------------
+        def emitter(event):
+            """sniff events before they reach the SummaryLogger on Golem
+
+            :param event: see reference to common event attributes and event types
+            reference: https://github.com/golemfactory/yapapi/blob
+                             /a1-reputation-prototype/yapapi/events.py
+            """
+
+            # the GLM accepted of each agreement (a debit note is of the total so far)
+            if metrics is not None and isinstance(
+                event, (yapapi.events.DebitNoteAccepted, yapapi.events.InvoiceAccepted)
+            ):
+                metrics.payment_accepted(event.agr_id, event.amount)
+
+            # if isinstance(event, yapapi.events.ProposalReceived)
+            event_name = event.__class__.__name__
+            if "Proposal" not in event_name and "DebitNote" not in event_name:
+                # g_logger.debug(f"\t\t{event}")
+                try:
+                    if "SendBytes" in event.commands:
+                        pass
+                except:
+                    pass
+
+        # interface with the payload (package defined in execute) to partition work
+        # to providers
+        self.golem = self.create_golem(strategy, yapapi.log.SummaryLogger(emitter).log)
+        await self.golem.__aenter__()
+
+        path_to_sound_file = Path(
+            projectdir / "gs" / "496703__dj-somar__chord-2-dj-somar.wav"
+        )
+        # play_sound(path_to_sound_file)
+        # show client the network options being used, e.g. subnet-tag
+        print_env_info(self.golem)
+
+        if payment_network != "rinkeby":
+            print(
+                f"Using max cpu/hr: \033[1;33m{MAX_PRICE_CPU_HR}\033[0m;"
+                f" max duration/hr: \033[1;33m{MAX_PRICE_DUR_HR}\033[0m;"
+                f" and fixed start rate: \033[1;33m{START_PRICE}\033[0m"
+                f" {'t' if payment_network == 'rinkeby' else ''}\033[1mGLM\033[0m"
+            )
+        if self.scoredStrategy is not None:
+            print(
+                f"Scoring offers by the throughput of the"
+                f" {self.providerStats.count()} providers on record"
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        golem, self.golem = self.golem, None
+        return await golem.__aexit__(*exc_info)
+
+    async def execute(self, ctxs, pendingParts):
+        """task providers with the parts not claimed by other (e.g. local) workers
+
+        :param ctxs: the class with contextual information useful to workers, of each
+            job (target) of the session
+        :param pendingParts: the PendingParts shared with any local workers, of the keys
+            (index of the job in ctxs, part id) of the parts
+
+        each task is given the context object of its job and the keys of the parts (each
+        a sequential part of a whole file) it shall work on. the keys are claimed from
+        pendingParts as the executor asks for tasks, so that a part is compressed by
+        whichever (provider or local process) asks first, and a provider moves on from
+        the parts of one job to those of the next without negotiating again.
+        """
+        show_usage = self.show_usage
+        task_timeout = self.task_timeout
+        speculation = self.speculation
+        providerStats = self.providerStats
+        pipeline_depth = self.pipeline_depth
+        pipelined = pipeline_depth > 1
+        metrics = self.metrics
+        # count of the workers (providers) taking tasks, auto batches are sized by it
+        active_workers = 0
+        if self.scoredStrategy is not None:
+            # the fixed price of an offer is spread over a part of these jobs
+            self.scoredStrategy.part_length = max(ctx.part_size for ctx in ctxs)
+
+        package = await self.create_payload()
+
+        def describe_part(key):
+            """name a part for display (with its target when there are several)"""
+            if len(ctxs) == 1:
+                return f"part {key[1]}"
+            return f"part {key[1]} of {ctxs[key[0]].name_of_target}"
+
+        def describe_parts(keys):
+            return f"part(s) {', '.join(describe_part(key) for key in keys)}"
+
+        async def worker(ctx: WorkContext, tasks):
+            """refers to the task data to lookup the range of bytes to work on
+
+            :param ctx: Provider node's work context (distinguised from gompress ctx)
+            :param tasks: iterable to pending work
+
+            a worker is associated with one and only one provider at a time via WorkContext
+            a worker that has gained access to a given node reads the range of bytes from
+            the file to compress given the part offset on the task's data property. it does
+            so via a query of the database table stored in the workdir.
+            a worker may compress the bytes in memory before uploaded as per client command
+            line arguments.
+            a remote script on the vm is invoked after the file has been uploaded to compress.
+            the worker downloads the result and places it in the local workdir.
+            the worker records the stdout to capture the checksum, which is the length of
+            the file by default, along with the sha256 digest of the file when reported.
+            a download whose digest does not match is rejected and retried, otherwise
+            a successful transfer is one in which all expected bytes were received.
+            a task may batch several (consecutive) parts, which are then uploaded, run
+            and downloaded in a single script and their results accepted together. a part
+            of a batch rejected is dispatched again on its own (see PendingParts.release).
+            the worker then moves on to the next task (part of file needing compression) if any
+            not already assigned elsewhere.
+            a part may be worked on by more than one provider when copies of stragglers are
+            launched (see speculation), the first attempt to download its result wins the
+            part and the others are discarded, or if still running, give up their provider.
+            a worker may disconnect from the provider if it is taking too long, as per the (global)
+            variable MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE (task_timeout). the executor then invokes worker on
+            the next available "worker" i.e. provider. note: max workers is computed per run
+            based on how many divisions of 64MiB there are.
+            """
+
+            def walltime_to_timedelta(walltime: str):
+                walltime_split_on_m = walltime.split("m")
+                minutes_str = walltime_split_on_m[0]
+                seconds_fract_str = walltime_split_on_m[1][:-1].strip()
+                return timedelta(
+                    minutes=int(minutes_str), seconds=float(seconds_fract_str)
+                )
+
+            def record_failure(timed_out=False):
+                """count a failed (or timed out) part against the provider"""
+                if providerStats is not None:
+                    providerStats.record_failure(
+                        ctx.provider_id, ctx.provider_name, timed_out
+                    )
+                if metrics is not None:
+                    metrics.failed(timed_out)
+
+            def retry(task, keys=None):
+                """reject a task to be retried (or release keys of it to be dispatched
+                again on their own)"""
+                if metrics is not None:
+                    metrics.retried(len(keys if keys is not None else task.data))
+                if keys is None:
+                    task.reject_result(retry=True)
+                    return
+                for key in keys:
+                    pendingParts.release(key)
+
+            def count_upload(future, length):
+                """count the bytes of an upload (command) once sent, returning its future"""
+                if metrics is not None:
+
+                    def on_done(_):
+                        if not future.cancelled() and future.exception() is None:
+                            metrics.uploaded(length)
+
+                    future.add_done_callback(on_done)
+                return future
+
+            async def add_part_to_script(
+                script, scriptTimer, mainctx, key, copy, after=None
+            ):
+                """upload a part, run xz.sh on it and download the result in script
+
+                the part is named on the provider after its key, so that the parts of
+                different jobs staged on a provider at once do not collide.
+
+                when pipelined xz.sh is instead launched in the background after the part
+                named after, and the result is left to be collected (see collect_part).
+                returns the part staged (remote name, read range, local path downloaded
+                to, view to release, spooled file to remove, future result of the run and
+                the timings of its stages, see timing)
+                """
+                view_to_temporary_file = None
+                path_to_local_segment_file = None
+                timings = []
+                partId = key[1]
+                stem = f"part_{key[0]}_{partId}"
+                read_range = mainctx.lookup_partition_range(partId)
+                loop = asyncio.get_running_loop()
+                # resolve to target
+                if mainctx.precompression_level >= 0:
+                    path_to_remote_target = (
+                        PurePosixPath("/golem/workdir") / f"{stem}.xz"
+                    )
+                else:
+                    path_to_remote_target = PurePosixPath("/golem/workdir") / stem
+
+                if mainctx.spool_uploads:
+                    # write the (precompressed) part to a file in the workdir chunk by chunk
+                    # and upload the file, so memory held per part is bounded by a chunk
+                    # (each attempt at the part spools to a file of its own)
+                    path_to_local_segment_file = path_to_spool(
+                        mainctx.work_directory_info.path_to_spool_directory,
+                        path_to_remote_target.name,
+                        copy,
+                    )
+                    prepare_start = time.time()
+                    if mainctx.precompression_level >= 0:
+                        await loop.run_in_executor(
+                            mainctx.precompress_pool,
+                            spool_precompressed_range,
+                            *mainctx.locate_part(partId),
+                            mainctx.precompression_level,
+                            str(path_to_local_segment_file),
+                        )
+                    else:
+                        await loop.run_in_executor(
+                            None,
+                            spool_range,
+                            *mainctx.locate_part(partId),
+                            str(path_to_local_segment_file),
+                        )
+                    timings.append(
+                        (
+                            "precompress"
+                            if mainctx.precompression_level >= 0
+                            else "read",
+                            prepare_start,
+                            time.time(),
+                            read_range[1] - read_range[0],
+                        )
+                    )
+                    upload_length = path_to_local_segment_file.stat().st_size
+                    upload_span = scriptTimer.track(
+                        count_upload(
+                            script.upload_file(
+                                str(path_to_local_segment_file), path_to_remote_target
+                            ),
+                            upload_length,
+                        )
+                    )
+                elif mainctx.precompression_level >= 0:
+                    # compress in the process pool so the event loop (other workers) is
+                    # not held up, the pool process reads the range from the target itself
+                    prepare_start = time.time()
+                    compressed_intermediate = await loop.run_in_executor(
+                        mainctx.precompress_pool,
+                        precompress_range,
+                        *mainctx.locate_part(partId),
+                        mainctx.precompression_level,
+                    )
+                    timings.append(
+                        (
+                            "precompress",
+                            prepare_start,
+                            time.time(),
+                            read_range[1] - read_range[0],
+                        )
+                    )
+                    upload_length = len(compressed_intermediate)
+                    upload_span = scriptTimer.track(
+                        count_upload(
+                            script.upload_bytes(
+                                compressed_intermediate,
+                                path_to_remote_target,
+                            ),
+                            upload_length,
+                        )
+                    )
+                else:
+                    # view the range of the target without copying it, the view is
+                    # uploaded as is with pages read from the page cache
+                    prepare_start = time.time()
+                    view_to_temporary_file = mainctx.view_to_temporary_file(partId)
+                    upload_length = len(view_to_temporary_file)
+                    timings.append(("read", prepare_start, time.time(), upload_length))
+                    upload_span = scriptTimer.track(
+                        count_upload(
+                            script.upload_bytes(
+                                view_to_temporary_file, path_to_remote_target
+                            ),
+                            upload_length,
+                        )
+                    )
+                # run script on uploaded target
+
+                # the preset is chosen for the length of the part (parts may be shorter
+                # than the largest dictionary when sized automatically) and -T1 is passed
+                # as the parallelism comes from the parts (see xz_arguments)
+                arguments = xz_arguments(read_range[1] - read_range[0])
+                # each attempt at a part downloads to a path of its own
+                local_output_file = path_to_download(
+                    mainctx.work_directory_info.path_to_parts_directory, partId, copy
+                )
+                staged = SimpleNamespace(
+                    stem=stem,
+                    name=path_to_remote_target.name,
+                    read_range=read_range,
+                    local_output_file=local_output_file,
+                    view_to_temporary_file=view_to_temporary_file,
+                    path_to_local_segment_file=path_to_local_segment_file,
+                    future_result=None,
+                    timings=timings,
+                    upload_length=upload_length,
+                    upload_span=upload_span,
+                    run_span=None,
+                    download_span=None,
+                )
+                if pipelined:
+                    # compress in the background after the part launched before it,
+                    # the result is collected by a later script (see collect_part)
+                    scriptTimer.track(
+                        script.run(*launch_command(staged.name, arguments, after=after))
+                    )
+                    return staged
+                staged.future_result = script.run(
+                    "/root/xz.sh",
+                    path_to_remote_target.name,  # shell script is run from workdir, expects
+                    # filename is local to workdir
+                    *arguments,
+                )  # output is stored by same name
+                staged.run_span = scriptTimer.track(staged.future_result)
+                # resolve to processed target
+                path_to_processed_target = PurePosixPath(f"/golem/output/{stem}.xz")
+                staged.download_span = scriptTimer.track(
+                    script.download_file(path_to_processed_target, local_output_file)
+                )
+                return staged
+
+            def collect_part(script, scriptTimer, staged):
+                """wait on the background run of a staged part and download its result"""
+                staged.future_result = script.run(*wait_command(staged.name))
+                staged.run_span = scriptTimer.track(staged.future_result)
+                staged.download_span = scriptTimer.track(
+                    script.download_file(
+                        PurePosixPath(f"/golem/output/{staged.stem}.xz"),
+                        staged.local_output_file,
+                    )
+                )
+                scriptTimer.track(script.run(*cleanup_command(staged.name)))
+
+            def stage_timings(staged, result_dict):
+                """return the timings of the stages of a part staged whose result is in
+
+                the xz walltime reported is placed before the run (or when pipelined the
+                wait on it) is known to be done, or after the upload if neither is.
+                """
+                timings = list(staged.timings)
+                upload_span = staged.upload_span()
+                if upload_span is not None:
+                    timings.append(("upload", *upload_span, staged.upload_length))
+                walltime = result_dict["walltime"].total_seconds()
+                run_span = staged.run_span() if staged.run_span is not None else None
+                if run_span is not None:
+                    # (xz does not begin before its part is uploaded)
+                    timings.append(
+                        (
+                            "xz",
+                            max(
+                                run_span[1] - walltime,
+                                upload_span[1] if upload_span else -float("inf"),
+                            ),
+                            run_span[1],
+                            staged.read_range[1] - staged.read_range[0],
+                        )
+                    )
+                elif upload_span is not None:
+                    timings.append(
+                        (
+                            "xz",
+                            upload_span[1],
+                            upload_span[1] + walltime,
+                            staged.read_range[1] - staged.read_range[0],
+                        )
+                    )
+                download_span = staged.download_span()
+                if download_span is not None:
+                    timings.append(
+                        ("download", *download_span, int(result_dict["checksum"]))
+                    )
+                return timings
+
+            def release_uploads(entry):
+                """free what was held locally to upload the parts of a pipeline entry"""
+                for staged in entry.staged.values():
+                    if staged.view_to_temporary_file is not None:
+                        entry.task.mainctx.release_view(staged.view_to_temporary_file)
+                        staged.view_to_temporary_file = None
+                    if staged.path_to_local_segment_file is not None:
+                        staged.path_to_local_segment_file.unlink(missing_ok=True)
+                        staged.path_to_local_segment_file = None
+
+            def parse_stdout(stdout, local_output_file):
+                """return the result dictionary of a part from the output of xz.sh"""
+                result_dict = {}
+                outputs = stdout.split("---")
+                outputs = list(
+                    map(lambda s: s.strip(), outputs),
+                )
+
+                model = outputs.pop(len(outputs) - 1)
+                ######################################################
+                # reduce consecutive spaces in model to single space #
+                # https://stackoverflow.com/a/30517392               #
+                ######################################################
+                model_spaces_split = model.split(" ")
+                model_cleaned = filter(None, model_spaces_split)
+                model = " ".join(model_cleaned)
+                g_logger.debug(outputs)
+
+                ####################################################
+                # store info from stdout into a dictionary result  #
+                ####################################################
+                result_dict["checksum"] = outputs[1]
+                result_dict["walltime"] = walltime_to_timedelta(outputs[2])
+                # images predating the digest report only length and walltime
+                result_dict["digest"] = outputs[3] if len(outputs) > 3 else None
+                result_dict["path"] = str(local_output_file.as_posix())
+                result_dict["model"] = model
+                return result_dict
+
+            async def accept_results(entry):
+                """check the results of the parts of an entry collected and settle its task
+
+                the parts won by this attempt are accepted together, the parts rejected of
+                a batch otherwise accepted are dispatched again on their own.
+                """
+                task = entry.task
+                loop = asyncio.get_running_loop()
+                # results by key of the parts won by this attempt
+                results = {}
+                # parts whose result was rejected
+                failed = []
+                for key, staged in entry.staged.items():
+                    local_output_file = staged.local_output_file
+                    stdout = staged.future_result.result().stdout
+                    if not stdout.startswith("OK"):
+                        record_failure()
+                        failed.append(key)
+                        print(
+                            f"\033[1mrejected a result {stdout} for {describe_part(key)}"
+                            f" and retrying\033[0m"
+                        )
+                        # try on deliberate rejection requires testing TODO
+                        continue
+                    result_dict = parse_stdout(stdout, local_output_file)
+                    if metrics is not None:
+                        metrics.downloaded(int(result_dict["checksum"]))
+                    result_dict["timings"] = stage_timings(staged, result_dict)
+                    result_dict["source"] = ctx.provider_name
+
+                    ############################################################
+                    # hash the download off the event loop to catch corruption #
+                    # while other parts are still in transit                   #
+                    ############################################################
+                    if result_dict["digest"] is not None:
+                        local_digest = await loop.run_in_executor(
+                            None, sha256_hash, local_output_file
+                        )
+                        if local_digest != result_dict["digest"]:
+                            record_failure()
+                            local_output_file.unlink(missing_ok=True)
+                            failed.append(key)
+                            print(
+                                f"\033[1mrejected a result for {describe_part(key)}"
+                                f" whose digest did not match and retrying\033[0m"
+                            )
+                            continue
+                    ###############################################
+                    # record the throughput of the provider (of   #
+                    # the target's bytes) for offers to come      #
+                    ###############################################
+                    if providerStats is not None:
+                        providerStats.record_part(
+                            ctx.provider_id,
+                            ctx.provider_name,
+                            staged.read_range[1] - staged.read_range[0],
+                            result_dict["walltime"].total_seconds(),
+                        )
+                    if speculation.claim(key, entry.attempts[key]):
+                        results[key] = result_dict
+                    else:
+                        # another attempt won the part meanwhile
+                        local_output_file.unlink(missing_ok=True)
+                if len(results) > 0:
+                    task.accept_result(result=results)
+                    if task.copy == 0:
+                        # parts rejected of a batch otherwise accepted are
+                        # dispatched again (a failed copy is left to the original)
+                        if len(failed) > 0:
+                            retry(task, failed)
+                elif len(failed) > 0:
+                    retry(task)
+                else:
+                    task.reject_result(retry=False)
+
+            def begin(task):
+                """return the pipeline entry of a task or None if its parts are all won"""
+                # the parts of the task not won meanwhile by a copy of them
+                keys = [key for key in task.data if not speculation.is_won(key)]
+                if len(keys) == 0:
+                    # a copy of a part won before this attempt at it began
+                    task.reject_result(retry=False)
+                    return None
+                return SimpleNamespace(
+                    task=task,
+                    keys=keys,
+                    attempts={
+                        key: speculation.started(key, task.copy, len(keys))
+                        for key in keys
+                    },
+                    staged={},
+                )
+
+            def end(entry):
+                """record that the attempts at the parts of an entry are over"""
+                for key in entry.keys:
+                    speculation.stopped(key, entry.attempts[key])
+                release_uploads(entry)
+
+            g_logger.debug(f"working: {ctx}")
+            nonlocal active_workers
+            active_workers += 1
+            #################################################################
+            # the entries (tasks) staged on the provider, oldest first. with #
+            # a depth of 1 a task is uploaded, run and downloaded in one     #
+            # script, otherwise up to depth tasks are staged at once and     #
+            # each is collected by a later script (see pipeline)             #
+            #################################################################
+            pipeline = deque()
+            # the next task being taken from tasks (not awaited while parts are staged)
+            next_task = None
+            exhausted = False
+            # the name of the part launched last on the provider, the next is run after it
+            launched_last = None
+            try:
+                while not exhausted or len(pipeline) > 0:
+                    entry = None
+                    if not exhausted and len(pipeline) < pipeline_depth:
+                        if next_task is None:
+                            next_task = asyncio.ensure_future(tasks.__anext__())
+                        if len(pipeline) == 0:
+                            # there is nothing to collect meanwhile
+                            await asyncio.wait([next_task])
+                        elif pendingParts.unclaimed_count > 0:
+                            # a task is on its way, unless taken meanwhile (e.g. locally)
+                            await asyncio.wait(
+                                [next_task], timeout=PIPELINE_TAKE_SECONDS
+                            )
+                        if next_task.done():
+                            try:
+                                task = next_task.result()
+                            except StopAsyncIteration:
+                                exhausted = True
+                            else:
+                                entry = begin(task)
+                            next_task = None
+                            if entry is None and not exhausted:
+                                continue
+                    # collect the oldest entry once the pipeline is full, or when no
+                    # other task is to be staged meanwhile
+                    collecting = None
+                    if len(pipeline) > 0 and (
+                        entry is None or len(pipeline) + 1 >= pipeline_depth
+                    ):
+                        collecting = pipeline.popleft()
+                    if entry is None and collecting is None:
+                        continue
+                    # the script does not block so the worker may give up on parts won
+                    # elsewhere, and is given as long as a task for each part it runs
+                    script = ctx.new_script(
+                        timeout=task_timeout
+                        * (
+                            (len(entry.keys) if entry is not None else 0)
+                            + (len(collecting.keys) if collecting is not None else 0)
+                        ),
+                        wait_for_results=False,
+                    )
+                    scriptTimer = ScriptTimer()
+                    try:
+                        if entry is not None:
+                            if pipelined:
+                                pipeline.append(entry)
+                            else:
+                                collecting = entry
+                            for key in entry.keys:
+                                entry.staged[key] = await add_part_to_script(
+                                    script,
+                                    scriptTimer,
+                                    entry.task.mainctx,
+                                    key,
+                                    entry.task.copy,
+                                    after=launched_last,
+                                )
+                                if pipelined:
+                                    launched_last = entry.staged[key].name
+                        if (
+                            pipelined
+                            and collecting is not None
+                            and collecting is not entry
+                        ):
+                            for staged in collecting.staged.values():
+                                collect_part(script, scriptTimer, staged)
+                        scriptTimer.sent()
+                        batch_results = yield script
+                        if collecting is not None:
+                            ##############################################################
+                            # wait on the batch unless other attempts win all the parts  #
+                            # collected meanwhile, in which case give up on the provider #
+                            ##############################################################
+                            won_elsewhere = asyncio.ensure_future(
+                                speculation.wait_won(*collecting.keys)
+                            )
+                            await asyncio.wait(
+                                [batch_results, won_elsewhere],
+                                return_when=asyncio.FIRST_COMPLETED,
+                            )
+                            won_elsewhere.cancel()
+                            if not batch_results.done():
+                                batch_results.cancel()
+                                raise SpeculationLost(
+                                    f"{describe_parts(collecting.keys)} won by other"
+                                    f" attempts"
+                                )
+                        await batch_results
+                        if entry is not None:
+                            # the parts of the entry have been uploaded
+                            release_uploads(entry)
+                        if collecting is not None:
+                            await accept_results(collecting)
+                            end(collecting)
+                            collecting = None
+                        if len(pipeline) == 0:
+                            # every part launched is collected, so the next part is
+                            # launched to run at once rather than after the last
+                            launched_last = None
+                    except BatchTimeoutError:
+                        for failing in [collecting, *pipeline]:
+                            if failing is None:
+                                continue
+                            print(
+                                f"{TEXT_COLOR_RED}"
+                                f"Task {failing.task} timed out on {ctx.provider_name},"
+                                f" time: {failing.task.running_time}"
+                                f"{TEXT_COLOR_DEFAULT}"
+                            )
+                        record_failure(timed_out=True)
+                        raise
+                    except SpeculationLost:
+                        print(
+                            f"{TEXT_COLOR_CYAN}"
+                            f"{describe_parts(collecting.keys)} won by other providers,"
+                            f" giving up on {ctx.provider_name}"
+                            f"{TEXT_COLOR_DEFAULT}"
+                        )
+                        collecting.task.reject_result(retry=False)
+                        end(collecting)
+                        collecting = None
+                        raise
+                    # TODO catch activity terminated by provider..
+                    except Exception as e:
+                        print(
+                            f"\033[1;33ma worker experienced an unhandled exception:\033[0m{e}"
+                        )
+                        record_failure()
+                        raise
+                    finally:
+                        if collecting is not None:
+                            # failed, the task is retried
+                            retry(collecting.task)  # testing
+                            end(collecting)
+                    if show_usage:
+                        raw_state = await ctx.get_raw_state()
+                        usage = format_usage(await ctx.get_usage())
+                        cost = await ctx.get_cost()
+                        print(
+                            f"{TEXT_COLOR_MAGENTA}"
+                            f" --- {ctx.provider_name} STATE: {raw_state}\n"
+                            f" --- {ctx.provider_name} USAGE: {usage}\n"
+                            f" --- {ctx.provider_name}  COST: {cost}"
+                            f"{TEXT_COLOR_DEFAULT}"
+                        )
+            finally:
+                active_workers -= 1
+                ##########################################################
+                # the tasks still staged (or taken) when the worker gives #
+                # up on the provider are retried                          #
+                ##########################################################
+                for staged_entry in pipeline:
+                    retry(staged_entry.task)
+                    end(staged_entry)
+                if next_task is not None:
+                    if not next_task.done():
+                        next_task.cancel()
+                    elif not next_task.cancelled() and next_task.exception() is None:
+                        retry(next_task.result())
+
+        # --------- pending_tasks() -------------
+        async def pending_tasks():
+            """feed execute_tasks with the parts not claimed by a local worker
+
+            ends once every part is completed, waiting meanwhile on parts in flight
+            locally that may yet be released to the providers. while waiting, copies
+            of parts straggling on a provider are fed (see speculation).
+            """
+            while not pendingParts.all_done():
+                key = pendingParts.claim()
+                if key is not None:
+                    ctx = ctxs[key[0]]
+                    if self.batch_size == AUTO:
+                        batch_size = auto_batch_size(
+                            ctx.part_size,
+                            pendingParts.unclaimed_count + 1,
+                            active_workers,
+                        )
+                    else:
+                        batch_size = self.batch_size
+                    # consecutive parts (of the same job) are claimed up to the batch
+                    # size, the batch ends at the first that is not the next pending
+                    keys = [key]
+                    while len(keys) < batch_size:
+                        key = pendingParts.claim(
+                            lambda key: key == (keys[-1][0], keys[-1][1] + 1)
+                        )
+                        if key is None:
+                            break
+                        keys.append(key)
+                    yield MyTask(ctx, tuple(keys))
+                    continue
+                straggler = speculation.next_straggler()
+                if straggler is not None:
+                    key, copy = straggler
+                    print(
+                        f"{TEXT_COLOR_CYAN}"
+                        f"{describe_part(key)} is straggling, dispatching copy {copy} of"
+                        f" it to another provider"
+                        f"{TEXT_COLOR_DEFAULT}"
+                    )
+                    yield MyTask(ctxs[key[0]], (key,), copy)
+                    continue
+                await pendingParts.wait_for_change(
+                    speculation.poll_seconds if speculation.enabled else None
+                )
+
+        # Worst-case overhead, in minutes, for initialization (negotiation, file transfer etc.)
+        init_overhead = 3
+        # Providers will not accept work if the timeout is outside of the [5 min, 30min] range.
+        # We increase the lower bound to 6 min to account for the time needed for our file to
+        # reach the providers.
+        min_timeout, max_timeout = task_timeout.total_seconds() / 60 * 3, 30
+        if pendingParts.open_ended:
+            # parts are yet to be added (see serve), which is closed before the end
+            timeout = timedelta(minutes=max_timeout)
+        else:
+            timeout = timedelta(
+                minutes=max(
+                    min(init_overhead + pendingParts.unclaimed_count * 2, max_timeout),
+                    min_timeout,
+                )
+            )
+        print(f"The job's max timeout has been set to {timeout}")
+        print(f"A task will be retried after a timeout of {task_timeout}\n")
+
+        completed_tasks = self.golem.execute_tasks(
+            worker,
+            pending_tasks(),
+            payload=package,
+            max_workers=self.max_workers or sum(ctx.part_count for ctx in ctxs),
+            timeout=timeout,
+        )
+        # submit and asynchronous wait on the completed tasks
+        # note, all tasks that have come back are expected to not be in rejected state
+        # i.e. the worker will retry and not return a bad one
+        async for task in completed_tasks:
+            # a result is yielded for each part of the batch won by the task
+            for key, result in task.result.items():
+                yield (
+                    key,
+                    result,
+                    f"Task computed: {task}"
+                    f"{f' (copy {task.copy})' if task.copy > 0 else ''}"
+                    f"{f' part {key[1]}' if len(task.data) > 1 else ''},"
+                    f" task: {str(task.running_time)[:-4]}",
+                )
+
+    def report(self):
+        if not self.speculation.enabled:
+            return []
+        return [
+            f"{self.speculation.launched} speculative cop"
+            f"{'ies' if self.speculation.launched != 1 else 'y'} launched,"
+            f" {self.speculation.won} won"
+        ]
@@ -8,123 +8,330 @@ the requestor agent provisioning segments of a file for providers on the network
 # license GPL 3.0
 # skeleton and utils adopted from Golem yapapi's code
 
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # extracting from, testing or decompressing a final file (or reporting on the
+    # timings of a job) is offline and takes arguments of its own, so it is dispatched
+    # before the modules of a run (or yapapi) are imported
+    if sys.argv[1] == "extract":
+        import xzindex
+
+        sys.exit(xzindex.main(sys.argv[2:]))
+    if sys.argv[1] in ("test", "decompress"):
+        import xzparallel
+
+        sys.exit(xzparallel.main(sys.argv[2:], sys.argv[1]))
+    if sys.argv[1] == "stats":
+        import timing
+
+        sys.exit(timing.main(sys.argv[2:]))
 
-MAX_PRICE_CPU_HR = "1.0446"
-MAX_PRICE_DUR_HR = "1.005"
-START_PRICE = "0.0"
 
 from datetime import datetime, timedelta
 
-MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE = 6
-MAX_TIMEOUT_FOR_TASK = timedelta(minutes=MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE)
+# most providers worked at once when serving a directory, as the parts are not known ahead
+DEFAULT_SERVE_MAX_WORKERS = 8
 
 import pathlib
-import sys
-from pathlib import Path, PurePosixPath
-from decimal import Decimal
-from lzma import LZMACompressor
+from pathlib import Path
+import asyncio
 import random
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 random.seed()
 from tempfile import gettempdir
 
-import yapapi
-from yapapi import (
-    Golem,
-    Task,
-    WorkContext,
-)
-from yapapi.payload import vm
-from yapapi.rest.activity import BatchTimeoutError
-
-
+# (yapapi is imported with GolemBackend, only when providers are to be tasked)
 from utils import (
     build_parser,
     TEXT_COLOR_CYAN,
     TEXT_COLOR_DEFAULT,
     TEXT_COLOR_RED,
-    TEXT_COLOR_MAGENTA,
-    format_usage,
     run_golem_example,
-    print_env_info,
 )
 from debug.mylogging import g_logger
 
 from workdirectoryinfo import WorkDirectoryInfo
 from ctx import CTX
+from xzindex import path_to_index
+from watcher import DirectoryWatcher
+from metrics import Metrics, start_http_server, DEFAULT_METRICS_INTERVAL
 from gs.playsound import play_sound
-from archive import archive
-
-try:
-    moduleFilterProviderMS = False
-    from gc__filterms import FilterProviderMS
-except ModuleNotFoundError:
-    pass
-else:
-    moduleFilterProviderMS = True
+from archive import archive, stream_archive, estimate_archive_length
+from precompress import create_precompress_pool
+from partsize import (
+    part_size_argument,
+    parse_size,
+    resolve_part_size,
+    batch_size_argument,
+    DEFAULT_TARGET_TASK_COUNT,
+    AUTO,
+)
+from pending import PendingParts
+from localcompress import local_worker, create_local_pool
+from backend import LocalBackend
+from pipeline import DEFAULT_PIPELINE_DEPTH
+from speculation import (
+    Speculation,
+    DEFAULT_SPECULATION_FACTOR,
+    DEFAULT_SPECULATION_MIN_SECONDS,
+    DEFAULT_SPECULATION_MAX_COPIES,
+)
 
 
 projectdir = Path(__file__).parent
 
 
-class MyTask(Task):
-    """Task class extended to store a reference to the caller (ctx)"""
+class Session:
+    """the jobs (targets) of a session whose parts are dispatched from one PendingParts
+
+    Attributes:
+        ctxs: the CTX of each job enrolled, the index of which keys its parts
+        remaining_counts: count of the parts yet to be recorded of each job
+        local_workers: count of local processes compressing parts alongside the backend
+        on_finished: callable(ctx) invoked as soon as every part of a job is recorded,
+            in a thread finalizing one job at a time off the event loop (the session no
+            longer touches the job, on_finished may close it)
+        finishing: the futures of the jobs being finalized (see wait_finished)
+        computed_by: source -> (count of parts, bytes of the target) computed by it
+        pendingParts: the PendingParts of the parts being dispatched (while running)
+        metrics: Metrics the parts recorded are counted in, or None
+    """
 
-    def __init__(self, mainctx, data):
-        self.mainctx = mainctx
-        super().__init__(data)
+    def __init__(self, local_workers=0, on_finished=None, metrics=None):
+        self.ctxs = []
+        self.remaining_counts = []
+        self.local_workers = local_workers
+        self.on_finished = on_finished
+        self.finishing = []
+        self._finishing_pool = None
+        self.computed_by = {}
+        self.pendingParts = None
+        self.metrics = metrics
+
+    def _finish(self, ctx):
+        """finalize a job (on_finished) in a thread while the session goes on"""
+        if self.on_finished is None:
+            return
+        if self._finishing_pool is None:
+            self._finishing_pool = ThreadPoolExecutor(max_workers=1)
+        # (jobs finalized without error are forgotten, e.g. over a long serve)
+        self.finishing = [
+            future
+            for future in self.finishing
+            if not future.done() or future.exception() is not None
+        ]
+        self.finishing.append(
+            asyncio.get_running_loop().run_in_executor(
+                self._finishing_pool, self.on_finished, ctx
+            )
+        )
 
+    async def wait_finished(self):
+        """wait on the jobs being finalized, raising the first exception of any"""
+        finishing, self.finishing = self.finishing, []
+        try:
+            await asyncio.gather(*finishing)
+        finally:
+            if self._finishing_pool is not None:
+                self._finishing_pool.shutdown()
+                self._finishing_pool = None
+
+    @staticmethod
+    def prepare(ctx):
+        """return the ids of the parts of a job to dispatch (not yet enrolled)
+
+        parts already compressed (by any job) are served from the part cache and parts
+        of identical content are dispatched only once. as this reads the target, it may
+        be called in a thread (e.g. while serving) and its result passed to enroll.
+        """
+        served_count = ctx.serve_from_part_cache()
+        if served_count > 0:
+            print(
+                f"{TEXT_COLOR_CYAN}{served_count} part{'s' if served_count > 1 else ''}"
+                f" of `{ctx.name_of_target}` served from the part cache"
+                f"{TEXT_COLOR_DEFAULT}"
+            )
+        return ctx.list_dispatch_ids()
 
-def find_optimal_xz_preset(file_length):
-    """map a file_length to the xz dictionary size that first does not exceed it
-    and return corresponding compression argument
+    def enroll(self, ctx, dispatch_ids=None):
+        """add a job returning the keys of its parts to dispatch
 
+        :param dispatch_ids: the ids returned by prepare for the job, None to prepare it
+
+        a job with no part to dispatch is finished at once.
+        """
+        if dispatch_ids is None:
+            dispatch_ids = self.prepare(ctx)
+        index = len(self.ctxs)
+        self.ctxs.append(ctx)
+        self.remaining_counts.append(len(dispatch_ids))
+        if len(dispatch_ids) == 0:
+            self._finish(ctx)
+        return [(index, partId) for partId in dispatch_ids]
+
+    def unfinished_keys(self):
+        """return the keys of the parts to dispatch again of jobs a run left unfinished"""
+        keys = []
+        for index, ctx in enumerate(self.ctxs):
+            if self.remaining_counts[index] == 0:
+                continue
+            dispatch_ids = ctx.list_dispatch_ids()
+            self.remaining_counts[index] = len(dispatch_ids)
+            if len(dispatch_ids) == 0:
+                self._finish(ctx)
+            keys += [(index, partId) for partId in dispatch_ids]
+        return keys
+
+    def announce(self, index):
+        """tell whether the (unfinished) job of index begins or resumes"""
+        ctx = self.ctxs[index]
+        if self.remaining_counts[index] == 0:
+            return
+        if ctx.whether_resuming:
+            pendingCount = len(ctx.list_pending_ids())
+            print(
+                f"\033[1mResuming an earlier session to compress `{ctx.name_of_target}` of which"
+                f" {pendingCount} part{'s' if pendingCount > 1 else ''}"
+                f" remain{'' if pendingCount > 1 else 's'} out of {ctx.part_count}.\033[0m"
+            )
+        else:
+            print(
+                "\033[1m"
+                f"Beginning new session and compressing `{ctx.name_of_target}`"
+                f" in {ctx.part_count} task parts."
+                "\033[0m"
+            )
 
-    :param file_length: length of the file (part) to compress
+    def record(self, key, result, description, source):
+        """print and record a result (from the backend or a local worker) in the model"""
+        ctx, partId = self.ctxs[key[0]], key[1]
+        if self.remaining_counts[key[0]] == 0:
+            # the job is finished (and being finalized), a late result is dropped
+            return
+        ctx.total_vm_run_time += result["walltime"]
+        g_logger.debug(result)
+        original_range = ctx.lookup_partition_range(partId)
+        original_length = original_range[1] - original_range[0]
+        original_length_mib = original_length / 2**20
+        compressed_length_mib = int(result["checksum"]) / 2**20
+        print(
+            f"{TEXT_COLOR_CYAN}"
+            f"{description},"
+            f"{f' {ctx.name_of_target},' if len(self.ctxs) > 1 else ''}"
+            f" {original_length_mib:,.{2}f}MiB \u2192 {compressed_length_mib:,.{2}f}MiB,"
+            f" xz: {str(result['walltime'])[:-4]},"
+            f" on an {result['model']}"
+            f"{TEXT_COLOR_DEFAULT}"
+        )
+        #########################################################
+        # record length (checksum), digest and path in model    #
+        # (and copy to any parts of identical content), along   #
+        # with the timings of the part's stages                 #
+        #########################################################
+        commit_start = time.time()
+        ctx.record_result(partId, result)
+        ctx.con.commit()
+        ctx.record_timings(
+            partId,
+            result.get("timings", []) + [("commit", commit_start, time.time(), None)],
+            result.get("source"),
+        )
+        if self.pendingParts.complete(key):
+            self.remaining_counts[key[0]] -= 1
+            if self.remaining_counts[key[0]] == 0:
+                # the job is done while the session goes on with the others
+                self._finish(ctx)
+        part_count, byte_count = self.computed_by.get(source, (0, 0))
+        self.computed_by[source] = (part_count + 1, byte_count + original_length)
+        if self.metrics is not None:
+            self.metrics.recorded(
+                result.get("source"),
+                original_length,
+                int(result["checksum"]),
+                result["walltime"].total_seconds(),
+            )
 
+    async def run(self, backend, pendingParts):
+        """dispatch the parts of pendingParts to the (entered) backend and any local
+        workers, recording the results until the backend makes no further progress"""
+        self.pendingParts = pendingParts
+        local_workers = self.local_workers
+
+        def record_local(key, result):
+            self.record(
+                key,
+                result,
+                f"Task computed locally: part {key[1]}",
+                f"{local_workers} local workers",
+            )
 
-    rationale: it is a waste of memory to use a dictionary size bigger than the
-    uncompressed file. this may imply less complexity depending on how xz implements.
-    """
+        local_worker_tasks = []
+        if local_workers > 0:
+            print(f"Compressing locally on {local_workers} processes as well")
+            local_pool = create_local_pool(local_workers)
+            local_worker_tasks = [
+                asyncio.create_task(
+                    local_worker(self.ctxs, pendingParts, local_pool, record_local)
+                )
+                for _ in range(local_workers)
+            ]
 
-    KiB = 2**10
-    MiB = 2**20
-
-    if file_length < 256 * KiB:
-        return "-0e"
-    elif file_length < 2 * MiB:
-        return "-1e"
-    elif file_length < 4 * MiB:
-        return "-2e"
-    elif file_length < 8 * MiB:
-        return "-4e"
-    elif file_length < 16 * MiB:
-        return "-6e"
-    elif file_length < 32 * MiB:
-        return "-7e"
-    elif file_length < 64 * MiB:
-        return "-8e"
-    else:
-        return "-9e"
+        # submit and asynchronous wait on the completed parts
+        # holding a reference to the database model with partition information
+        # and update the database with the result information about the download
+        try:
+            async for key, result, description in backend.execute(
+                self.ctxs, pendingParts
+            ):
+                self.record(key, result, description, backend.name)
+        finally:
+            for local_worker_task in local_worker_tasks:
+                local_worker_task.cancel()
+            if local_workers > 0:
+                await asyncio.gather(*local_worker_tasks, return_exceptions=True)
+                local_pool.shutdown(cancel_futures=True)
+
+    def report(self, backend, elapsed):
+        """print the parts computed and the throughput of each (backend, local workers)"""
+        computed_by = self.computed_by
+        print(
+            f"{TEXT_COLOR_CYAN}"
+            f"{sum(part_count for part_count, _ in computed_by.values())} tasks computed,"
+            f" total time: {elapsed}"
+            f"{TEXT_COLOR_DEFAULT}"
+        )
+        ######################################################
+        # throughput of each, of the target's bytes compressed #
+        # over the whole run, to compare backends              #
+        ######################################################
+        for source, (part_count, byte_count) in computed_by.items():
+            print(
+                f"{TEXT_COLOR_CYAN}"
+                f" {source}: {part_count} part{'s' if part_count > 1 else ''},"
+                f" {byte_count / 2**20:,.{2}f}MiB at"
+                f" {byte_count / 2**20 / max(elapsed.total_seconds(), 1e-6):,.{2}f}MiB/s"
+                f"{TEXT_COLOR_DEFAULT}"
+            )
+        for line in backend.report():
+            print(f"{TEXT_COLOR_CYAN} {line}{TEXT_COLOR_DEFAULT}")
 
 
-async def main(
-    ctx,
-    subnet_tag,
-    min_cpu_threads,
-    payment_driver,
-    payment_network,
-    show_usage,
-):
-    """partition input target file into segments of 64MiB and task to compress across golem nodes
+async def main(ctxs, backend, local_workers=0, on_finished=None, metrics=None):
+    """partition input target files into segments (64MiB by default) and dispatch them to be compressed
 
-    :param ctx: the class with contextual information useful to workers
-    :param subnet_tag: provided as a cli argument
-    :param min_cpu_threads: the thread count beneath which provider offers are rejected
-        which is provided as a cli argument (only useful to eliminate unwanted providers
-        but may important if segmentation is >=128 MiB per task in the future)
-    :param payment_network: provided as a cli argument
-    :param show_usage: provided as a cli argument
+    :param ctxs: the class with contextual information useful to workers, of each job
+        (target) to compress in the session
+    :param backend: the Backend compressing the parts, e.g. GolemBackend across golem nodes
+    :param local_workers: count of local processes compressing parts alongside the
+        backend (hybrid mode), 0 for none
+    :param on_finished: callable(ctx) invoked (e.g. to verify and concatenate) as soon as
+        every part of a job is recorded, in a thread off the event loop (see Session),
+        or None
+    :param metrics: Metrics published (see metrics) while the session runs, or None
 
     gompress partitions the target file into lengths of 64MiB sending each as a block
     for a distinct node to work on. min_cpu_threads may be used to select providers
@@ -133,341 +340,351 @@ async def main(
     otherwise geometrically rises per core without any additional benefit. therefore,
     gompress essentially improves xz by requiring less memory for parallel compression.
 
-    each task is given a shared context object and a unique part number representing
-    which sequential part of the whole file it shall work on.
-    """
-
-    # identify vm that tasked nodes are to use to process the payload/instructions
-    package = await vm.repo(
-        image_hash="8f2396e5a50c206e5eb671816f67976841007e6d759511cb552c4b3e",
-        # only run on provider nodes that have more than 1.0gb of RAM available
-        min_mem_gib=1.0,  # later set this to 1.5 when 128mb divisions allowed
-        # only run on provider nodes that have more than 2gb of storage space available
-        min_storage_gib=2.0,  # this is more than enough for a 64-128 mb segment
-        # since the work is mostly done in memory
-        # only run on provider nodes which a certain number of CPU threads (logical CPU cores) available
-        min_cpu_threads=min_cpu_threads,
-    )
-
-    async def worker(ctx: WorkContext, tasks):
-        """refers to the task data to lookup the range of bytes to work on
-
-        :param ctx: Provider node's work context (distinguised from gompress ctx)
-        :param tasks: iterable to pending work
-
-        a worker is associated with one and only one provider at a time via WorkContext
-        a worker that has gained access to a given node reads the range of bytes from
-        the file to compress given the part offset on the task's data property. it does
-        so via a query of the database table stored in the workdir.
-        a worker may compress the bytes in memory before uploaded as per client command
-        line arguments.
-        a remote script on the vm is invoked after the file has been uploaded to compress.
-        the worker downloads the result and places it in the local workdir.
-        the worker records the stdout to capture the checksum, which is the length of
-        the file by default. error checking is expected to occur on the transport level
-        so a successful transfer is one in which all expected bytes were received.
-        the worker then moves on to the next task (part of file needing compression) if any
-        not already assigned elsewhere.
-        a worker may disconnect from the provider if it is taking too long, as per the (global)
-        variable MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE. the executor then invokes worker on
-        the next available "worker" i.e. provider. note: max workers is computed per run
-        based on how many divisions of 64MiB there are.
-        """
-
-        def walltime_to_timedelta(walltime: str):
-            walltime_split_on_m = walltime.split("m")
-            minutes_str = walltime_split_on_m[0]
-            seconds_fract_str = walltime_split_on_m[1][:-1].strip()
-            return timedelta(minutes=int(minutes_str), seconds=float(seconds_fract_str))
-
-        g_logger.debug(f"working: {ctx}")
-        # Set timeout for the first script/task to be executed on the provider given
-        # the task iterator
-        # this can probably be moved to the head of async for below so as to not repeat it at loop end
-        script = ctx.new_script(timeout=MAX_TIMEOUT_FOR_TASK)
-
-        async for task in tasks:
-            partId = task.data  # subclassed Task with id attribute
-            # read range and write into temporary file
-            view_to_temporary_file = task.mainctx.view_to_temporary_file(
-                partId
-            )  # revise to conserve memory
-            # resolve to target
-            if task.mainctx.precompression_level >= 0:
-                path_to_remote_target = (
-                    PurePosixPath("/golem/workdir") / f"part_{partId}.xz"
-                )
-                lzmaCompressor = LZMACompressor(
-                    preset=task.mainctx.precompression_level
-                )
-                compressed_intermediate = lzmaCompressor.compress(
-                    view_to_temporary_file.tobytes()
-                )
-                compressed_intermediate = (
-                    compressed_intermediate + lzmaCompressor.flush()
-                )  # upload_bytes does not play well with lzmaCompressor (does not flush), so ...
-                # review, upload_bytes requires len() so intermediary may not make sense
-                script.upload_bytes(
-                    compressed_intermediate,
-                    path_to_remote_target,
-                )
-            else:
-                path_to_remote_target = (
-                    PurePosixPath("/golem/workdir") / f"part_{partId}"
-                )
-                script.upload_bytes(
-                    view_to_temporary_file.tobytes(), path_to_remote_target
-                )
-            # run script on uploaded target
-
-            optimal_compression_argument = find_optimal_xz_preset(
-                task.mainctx.path_to_target.stat().st_size
-            )
+    the parts of every job are dispatched in one session (the parts of the first job
+    first), so providers move from one target to the next without negotiating again.
 
-            # because we are partitioning according to the maximum dictionary size
-            # it would impose geometrically escalated memory requirements per thread
-            # without additional compression effectiveness to use more than one thread
-            # per 64 MiB (current segmentation as of this writing). Therefore, we
-            # pass -T1 to xz
-            future_result = script.run(
-                "/root/xz.sh",
-                path_to_remote_target.name,  # shell script is run from workdir, expects
-                # filename is local to workdir
-                f"-T1",  # in the future, for 128 parts
-                f"{optimal_compression_argument}",
-            )  # output is stored by same name
-            # resolve to processed target
-            path_to_processed_target = PurePosixPath(f"/golem/output/part_{partId}.xz")
-            local_output_file = (
-                task.mainctx.work_directory_info.path_to_parts_directory
-                / path_to_processed_target.name
+    the results are recorded in the model as they arrive whichever the backend, and the
+    throughput of each (backend, local workers) is shown once all are in.
+    """
+    session = Session(local_workers, on_finished, metrics)
+    list_pending_keys = []
+    for ctx in ctxs:
+        list_pending_keys += session.enroll(ctx)
+    g_logger.debug(
+        f"There are {len(list_pending_keys)} remaining partitions to work on"
+    )
+    if len(list_pending_keys) == 0:
+        await session.wait_finished()
+        return
+
+    publishing = None
+    if metrics is not None:
+        publishing = asyncio.create_task(metrics.publish(session))
+    try:
+        async with backend:
+            for index in range(len(ctxs)):
+                session.announce(index)
+            start_time = datetime.now()
+            await session.run(backend, PendingParts(list_pending_keys))
+            session.report(backend, datetime.now() - start_time)
+        # the jobs finished last may still be being finalized
+        await session.wait_finished()
+    finally:
+        # (after the backend exits, so the payments settled on exit are published)
+        if publishing is not None:
+            publishing.cancel()
+            await asyncio.gather(publishing, return_exceptions=True)
+
+
+async def serve(
+    directoryWatcher,
+    backend,
+    create_job,
+    on_finished,
+    local_workers=0,
+    poll_seconds=2.0,
+    linger_seconds=60.0,
+    admit_seconds=12 * 60.0,
+    metrics=None,
+):
+    """compress the files dropped in a watched directory as they arrive, in one session
+
+    :param directoryWatcher: the DirectoryWatcher of the directory files are dropped in
+    :param backend: the Backend compressing the parts, entered once for all the files
+    :param create_job: callable(Path) returning the CTX of a file dropped, or None if
+        it cannot be compressed (called in a thread, as it hashes the file)
+    :param on_finished: callable(ctx) invoked as soon as every part of a file is recorded
+        (in a thread, see Session), which is to close its job
+    :param local_workers: count of local processes compressing parts alongside the backend
+    :param poll_seconds: interval at which the directory is polled
+    :param linger_seconds: how long providers are kept waiting on files to arrive once
+        all parts are done, before they are let go
+    :param admit_seconds: how long the parts of files arriving are added to a run before
+        a new one is begun, so that a run ends within the (30 minute) timeout of its job
+    :param metrics: Metrics published (see metrics) for as long as the serve goes on, or
+        None
+
+    the engine (e.g. the Golem instance with its payment setup) is started once. a run
+    of the backend is begun as files arrive and its task source is kept open, so parts
+    of files arriving meanwhile are sent to providers already working for the session.
+    a run is closed once idle for linger_seconds (or after admit_seconds), the parts of
+    a file it did not finish are dispatched again by the next run. the job of a file is
+    created and prepared (hashing and reading the file) in a thread by watch, so that
+    a large file arriving does not hold up the providers working meanwhile.
+    """
+    session = Session(local_workers, on_finished, metrics)
+    # (ctx, ids of the parts to dispatch) of the jobs prepared, to be enrolled by admit
+    prepared = asyncio.Queue()
+
+    def prepare_job(path_to_file):
+        """(in a thread) create and prepare the job of a file complete in the directory
+        returning its CTX and the ids of its parts to dispatch, or None"""
+        ctx = create_job(path_to_file)
+        if ctx is None:
+            return None
+        try:
+            return ctx, session.prepare(ctx)
+        except Exception as e:
+            g_logger.debug(f"preparing {path_to_file} failed with {e!r}")
+            print(
+                f"{TEXT_COLOR_RED}could not prepare {path_to_file}: {e}"
+                f"{TEXT_COLOR_DEFAULT}"
             )
-            script.download_file(path_to_processed_target, local_output_file)
+            ctx.close()
+            directoryWatcher.failed(path_to_file)
+            return None
+
+    async def watch():
+        """prepare the jobs of the files arriving for admit, off the event loop"""
+        while True:
+            for path_to_file in directoryWatcher.poll():
+                job = await loop.run_in_executor(None, prepare_job, path_to_file)
+                if job is not None:
+                    prepared.put_nowait(job)
+            await asyncio.sleep(poll_seconds)
+
+    def admit():
+        """enroll the jobs prepared returning the keys of their parts"""
+        keys = []
+        while not prepared.empty():
+            ctx, dispatch_ids = prepared.get_nowait()
+            index = len(session.ctxs)
+            keys += session.enroll(ctx, dispatch_ids)
+            session.announce(index)
+        return keys
+
+    async def keep_admitting(pendingParts):
+        """add the parts of files arriving to a run until it idles (or admit_seconds)"""
+        start_time = loop.time()
+        idle_since = None
+        while loop.time() - start_time < admit_seconds:
+            await asyncio.sleep(poll_seconds)
+            keys = admit()
+            if len(keys) > 0:
+                pendingParts.add(keys)
+            if not pendingParts.idle():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = loop.time()
+            elif loop.time() - idle_since >= linger_seconds:
+                break
+        pendingParts.close()
+
+    async def serve_runs():
+        """begin a run of the backend whenever parts are to be dispatched"""
+        while True:
+            keys = session.unfinished_keys() + admit()
+            if len(keys) == 0:
+                await asyncio.sleep(poll_seconds)
+                continue
+            pendingParts = PendingParts(keys, open_ended=True)
+            admitting = asyncio.create_task(keep_admitting(pendingParts))
+            start_time = datetime.now()
             try:
-                yield script
-                result_dict = {}
-                stdout = future_result.result().stdout
-                if not stdout.startswith("OK"):
-                    task.reject_result(retry=True)
-                    print(f"\033[1mrejected a result {stdout} and retrying\033[0m")
-                    # try on deliberate rejection requires testing TODO
-                else:
-
-                    outputs = stdout.split("---")
-                    outputs = list(
-                        map(lambda s: s.strip(), outputs),
-                    )
-
-                    model = outputs.pop(len(outputs) - 1)
-                    ######################################################
-                    # reduce consecutive spaces in model to single space #
-                    # https://stackoverflow.com/a/30517392               #
-                    ######################################################
-                    model_spaces_split = model.split(" ")
-                    model_cleaned = filter(None, model_spaces_split)
-                    model = " ".join(model_cleaned)
-                    g_logger.debug(outputs)
-
-                    ####################################################
-                    # store info from stdout into a dictionary result  #
-                    ####################################################
-                    result_dict["checksum"] = outputs[1]
-                    result_dict["walltime"] = walltime_to_timedelta(outputs[2])
-                    result_dict["path"] = str(local_output_file.as_posix())
-                    result_dict["model"] = model
-                    task.accept_result(result=result_dict)
-            except BatchTimeoutError:
-                try:
-                    path_to_local_segment_file.unlink()
-                except:
-                    pass
-                print(
-                    f"{TEXT_COLOR_RED}"
-                    f"Task {task} timed out on {ctx.provider_name}, time: {task.running_time}"
-                    f"{TEXT_COLOR_DEFAULT}"
-                )
-                task.reject_result(retry=True)  # testing
-                raise
-            # TODO catch activity terminated by provider..
+                await session.run(backend, pendingParts)
             except Exception as e:
-                print(
-                    f"\033[1;33ma worker experienced an unhandled exception:\033[0m{e}"
-                )
-                task.reject_result(retry=True)  # testing
-                raise
-            # reinitialize the script for the next task if any (partition to compress)
-            script = ctx.new_script(
-                timeout=timedelta(minutes=MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE)
+                # e.g. the job timed out, what remains is dispatched by the next run
+                g_logger.debug(f"the run ended with {e!r}")
+                print(f"{TEXT_COLOR_RED}the run ended early: {e!r}{TEXT_COLOR_DEFAULT}")
+            finally:
+                admitting.cancel()
+                await asyncio.gather(admitting, return_exceptions=True)
+            session.report(backend, datetime.now() - start_time)
+            session.computed_by = {}
+            # parts a run failed on are not dispatched again at once
+            await asyncio.sleep(poll_seconds)
+
+    loop = asyncio.get_running_loop()
+    publishing = None
+    if metrics is not None:
+        publishing = asyncio.create_task(metrics.publish(session))
+    watching = asyncio.create_task(watch())
+    try:
+        async with backend:
+            print(
+                f"\033[1mWatching {directoryWatcher.path_to_directory} for files to"
+                f" compress, press ctrl-c to stop\033[0m"
             )
-            if show_usage:
-                raw_state = await ctx.get_raw_state()
-                usage = format_usage(await ctx.get_usage())
-                cost = await ctx.get_cost()
-                print(
-                    f"{TEXT_COLOR_MAGENTA}"
-                    f" --- {ctx.provider_name} STATE: {raw_state}\n"
-                    f" --- {ctx.provider_name} USAGE: {usage}\n"
-                    f" --- {ctx.provider_name}  COST: {cost}"
-                    f"{TEXT_COLOR_DEFAULT}"
-                )
-
-    list_pending_ids = ctx.list_pending_ids()
-    g_logger.debug(f"There are {len(list_pending_ids)} remaining partitions to work on")
-
-    # Worst-case overhead, in minutes, for initialization (negotiation, file transfer etc.)
-    init_overhead = 3
-    # Providers will not accept work if the timeout is outside of the [5 min, 30min] range.
-    # We increase the lower bound to 6 min to account for the time needed for our file to
-    # reach the providers.
-    min_timeout, max_timeout = MAX_MINUTES_UNTIL_TASK_IS_A_FAILURE * 3, 30
-    timeout = timedelta(
-        minutes=max(
-            min(init_overhead + len(list_pending_ids) * 2, max_timeout), min_timeout
+            await serve_runs()
+    finally:
+        # (the jobs unfinished are closed once no longer published, those finished are
+        # closed as they are delivered)
+        if publishing is not None:
+            publishing.cancel()
+            await asyncio.gather(publishing, return_exceptions=True)
+        watching.cancel()
+        await asyncio.gather(watching, return_exceptions=True)
+        try:
+            await session.wait_finished()
+        finally:
+            for ctx in session.ctxs:
+                ctx.close()
+            # (the jobs prepared but not enrolled)
+            while not prepared.empty():
+                prepared.get_nowait()[0].close()
+
+
+def read_manifest(path_to_manifest):
+    """return the targets listed in a manifest, one per line (skipping blanks and #)"""
+    with open(path_to_manifest) as manifest:
+        lines = [line.strip() for line in manifest]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def prepare_target(targets, args, data_dir):
+    """return the file compressed for targets, archiving them unless a single file
+
+    :param targets: list of the files and directories compressed together
+    :param args: the parsed command line arguments
+    :param data_dir: Path to the workdir (streamed archives are written under it)
+    :returns: (path to the target file or None, TempTar archive or None,
+        StreamedArchive or None)
+    """
+    if len(targets) == 1:
+        if not Path(targets[0]).is_dir() and "*" not in targets[0]:
+            return Path(targets[0]), None, None
+    if args.stream_archive:
+        # the archive is cut into parts as it is streamed, so the part size is
+        # settled beforehand (from the length the archive is estimated at)
+        part_size = resolve_part_size(
+            args.part_size,
+            estimate_archive_length(targets) if args.part_size == AUTO else None,
+            args.target_tasks,
         )
-    )
-    # sane defaults for cpu and dur per hr
-    if payment_network == "rinkeby":
-        max_price_for_cpu = Decimal("inf")
-        max_price_for_dur = Decimal("inf")
-    else:
-        max_price_for_cpu = Decimal(MAX_PRICE_CPU_HR)
-        max_price_for_dur = Decimal(MAX_PRICE_DUR_HR)
+        return None, None, stream_archive(targets, data_dir, part_size)
+    target_file_archive = archive(targets)
+    return target_file_archive.data, target_file_archive, None
 
-    strategy = yapapi.strategy.LeastExpensiveLinearPayuMS(
-        max_fixed_price=Decimal(START_PRICE),
-        max_price_for={
-            yapapi.props.com.Counter.CPU: max_price_for_cpu / Decimal("3600.0"),
-            yapapi.props.com.Counter.TIME: max_price_for_dur / Decimal("3600.0"),
-        },
-    )
 
-    # if gc__filterms has been successfully imported, wrap the strategy
-    if moduleFilterProviderMS:
-        strategy = FilterProviderMS(strategy)
+def finalize(ctx):
+    """verify and concatenate the parts of a job and report, returning whether it was
+    verified (the parts of a job not finished are left for a later run)"""
+    #####################
+    #       verify      #
+    #####################
+    if not ctx.verify():
+        return False
+    ######################
+    #    concatenate     #
+    ######################
+    ctx.concatenate_and_finalize()
+
+    #################
+    #    report     #
+    #################
+    original_mib = ctx.len_file(target=True) / 2**20
+    final_mib = ctx.len_file(target=False) / 2**20
+
+    def exclamation():
+        exclamations = ["wow!", "wowowowowow!", "w0w!", "w0w0w0w0w0w0w!"]
+        return random.choice(exclamations)
+
+    path_to_sound_file = Path(
+        projectdir / "gs" / "496702__dj-somar__chord-1-dj-somar.wav"
+    )
 
-    # ----------------------------------------------
-    # --------------- emitter() --------------------
-    def emitter(event):
-        """sniff events before they reach the SummaryLogger on Golem
+    day_has_passed = ctx.update_last_run()
+    if day_has_passed:
+        ssp = play_sound(path_to_sound_file)
 
-        :param event: see reference to common event attributes and event types
-        reference: https://github.com/golemfactory/yapapi/blob
-                         /a1-reputation-prototype/yapapi/events.py
-        """
+    print(
+        f"The run was a success! \033[1m{ctx.name_of_target}\033[0m has been compressed"
+        f" to {final_mib:,.{2}f}MiB from {original_mib:,.{2}f}MiB",
+        end="",
+    )
+    if original_mib > 0 and final_mib / original_mib < 0.330001:
+        print(",", exclamation())
+    else:
+        print(".")
 
-        # if isinstance(event, yapapi.events.ProposalReceived)
-        event_name = event.__class__.__name__
-        if "Proposal" not in event_name and "DebitNote" not in event_name:
-            # g_logger.debug(f"\t\t{event}")
-            try:
-                if "SendBytes" in event.commands:
-                    pass
-            except:
-                pass
-
-    # interface with the payload (package defined aboved) to partition work
-    # to providers
-    async with Golem(
-        budget=10.0,
-        subnet_tag=subnet_tag,
-        payment_driver=payment_driver,
-        payment_network=payment_network,
-        strategy=strategy,
-        event_consumer=yapapi.log.SummaryLogger(emitter).log,
-    ) as golem:
-
-        path_to_sound_file = Path(
-            projectdir / "gs" / "496703__dj-somar__chord-2-dj-somar.wav"
+    if not ctx.whether_resuming:
+        print(
+            f"The time spent on compressing the data with xz was clocked at"
+            f" {str(ctx.total_vm_run_time)[:-4]}."
         )
-        # play_sound(path_to_sound_file)
-        # show client the network options being used, e.g. subnet-tag
-        print_env_info(golem)
+    print(
+        f"You can find the compressed file at"
+        f" \033[1;33m{ctx.path_to_final_file}\033[0m"
+    )
+    return True
 
-        if payment_network != "rinkeby":
-            print(
-                f"Using max cpu/hr: \033[1;33m{MAX_PRICE_CPU_HR}\033[0m;"
-                f" max duration/hr: \033[1;33m{MAX_PRICE_DUR_HR}\033[0m;"
-                f" and fixed start rate: \033[1;33m{START_PRICE}\033[0m"
-                f" {'t' if payment_network == 'rinkeby' else ''}\033[1mGLM\033[0m"
-            )
 
-        print(f"The job's max timeout has been set to {timeout}")
-        print(f"A task will be retried after a timeout of {MAX_TIMEOUT_FOR_TASK}\n")
+def serve_directory(args, backend, local_workers, create_ctx, metrics=None):
+    """compress the files dropped in the --watch directory until interrupted (see serve)
 
-        if ctx.whether_resuming:
-            pendingCount = len(ctx.list_pending_ids())
+    the final file (and index) of each file is moved to the --output directory once
+    verified, and the file itself to the --done directory. the job is then closed and its
+    work directory removed, so that a long serve does not accumulate them (the work
+    directory of a job that failed is kept).
+    """
+    path_to_watched = Path(args.watch)
+    path_to_output = Path(args.output) if args.output else path_to_watched / "output"
+    path_to_done = Path(args.done) if args.done else path_to_watched / "done"
+    path_to_output.mkdir(parents=True, exist_ok=True)
+    directoryWatcher = DirectoryWatcher(
+        path_to_watched, path_to_done, args.settle_seconds
+    )
+    # the file dropped of each job not yet finished
+    paths_of_jobs = {}
+
+    def create_job(path_to_file):
+        try:
+            ctx = create_ctx(path_to_file)
+        except Exception as e:
             print(
-                f"\033[1mResuming an earlier session to compress `{ctx.path_to_target.name}` of which"
-                f" {pendingCount} part{'s' if pendingCount > 1 else ''}"
-                f" remain{'' if pendingCount > 1 else 's'} out of {ctx.part_count}.\033[0m"
+                f"{TEXT_COLOR_RED}could not take {path_to_file}: {e}{TEXT_COLOR_DEFAULT}"
             )
-        else:
-            print(
-                "\033[1m"
-                f"Beginning new session and compressing `{ctx.path_to_target.name}`"
-                f" in {ctx.part_count} task parts."
-                "\033[0m"
-            )
-
-        num_tasks = 0
-        start_time = datetime.now()
-
-        completed_tasks = golem.execute_tasks(
-            worker,
-            [MyTask(ctx, pending_id) for pending_id in list_pending_ids],
-            payload=package,
-            max_workers=ctx.part_count,
-            timeout=timeout,
-        )
-        # submit and asynchronous wait on the completed tasks
-        # holding a reference to the database model with partition information
-        # and update the database with the result information about the download
-        # note, all tasks that have come back are expected to not be in rejected state
-        # i.e. the worker will retry and not return a bad one
-        async for task in completed_tasks:
-            num_tasks += 1
-            ctx.total_vm_run_time += task.result["walltime"]
-            g_logger.debug(task.result)
-            original_range = ctx.lookup_partition_range(task.data)
-            original_length = original_range[1] - original_range[0]
-            original_length_mib = original_length / 2**20
-            compressed_length_mib = int(task.result["checksum"]) / 2**20
+            directoryWatcher.failed(path_to_file)
+            return None
+        paths_of_jobs[ctx] = path_to_file
+        return ctx
+
+    def deliver(ctx):
+        """finalize a job moving its final file to the output directory (in a thread of
+        the session) and close it"""
+        path_to_file = paths_of_jobs.pop(ctx)
+        try:
+            finalized = finalize(ctx)
+            if finalized:
+                for path_to_final in (
+                    ctx.path_to_final_file,
+                    path_to_index(ctx.path_to_final_file),
+                ):
+                    shutil.move(
+                        str(path_to_final), str(path_to_output / path_to_final.name)
+                    )
+                print(
+                    f"{TEXT_COLOR_CYAN}moved {ctx.name_of_final_file} to"
+                    f" {path_to_output}{TEXT_COLOR_DEFAULT}"
+                )
+                directoryWatcher.done(path_to_file)
+        except Exception as e:
+            g_logger.debug(f"finalizing {path_to_file} failed with {e!r}")
             print(
-                f"{TEXT_COLOR_CYAN}"
-                f"Task computed: {task},"
-                f" {original_length_mib:,.{2}f}MiB \u2192 {compressed_length_mib:,.{2}f}MiB,"
-                f" xz: {str(task.result['walltime'])[:-4]},"
-                f" task: {str(task.running_time)[:-4]},"
-                f" on an {task.result['model']}"
+                f"{TEXT_COLOR_RED}could not finalize {path_to_file}: {e}"
                 f"{TEXT_COLOR_DEFAULT}"
             )
-            #####################################
-            # record length (checksum) in model #
-            #####################################
-            ctx.con.execute(
-                "INSERT INTO Checksum(partId, hash) VALUES (?, ?)",
-                (
-                    task.data,
-                    task.result["checksum"],
-                ),
-            )
-            ###########################################
-            # record path to downloaded part in model #
-            ###########################################
-            ctx.con.execute(
-                "INSERT INTO OutputFile(partId, pathStr) VALUES (?, ?)",
-                (
-                    task.data,
-                    task.result["path"],
-                ),
+            finalized = False
+        ctx.close()
+        if finalized:
+            shutil.rmtree(
+                ctx.work_directory_info.path_to_target_wdir, ignore_errors=True
             )
+        else:
+            directoryWatcher.failed(path_to_file)
 
-            ctx.con.commit()
-        print(
-            f"{TEXT_COLOR_CYAN}"
-            f"{num_tasks} tasks computed, total time: {datetime.now() - start_time}"
-            f"{TEXT_COLOR_DEFAULT}"
-        )
+    run_golem_example(
+        serve(
+            directoryWatcher,
+            backend,
+            create_job,
+            deliver,
+            local_workers=local_workers,
+            linger_seconds=args.linger_seconds,
+            metrics=metrics,
+        ),
+        log_file=args.log_file if args.enable_logging else None,
+    )
 
 
 def add_arguments_to_command_line_parser():
@@ -483,7 +700,67 @@ def add_arguments_to_command_line_parser():
     parser.add_argument(
         "target",
         help="file or dir/files to compress or archive respectively",
-        nargs="+",
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "--each",
+        action="store_true",
+        default=False,
+        help="compress each target (file, or directory archived on its own) to a final"
+        " file of its own, all in one session, instead of archiving them together;"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="file listing targets one per line (blank lines and lines beginning with #"
+        " are skipped) to compress as with --each, after any given as arguments",
+    )
+
+    parser.add_argument(
+        "--watch",
+        default=None,
+        help="with serve, the directory to compress files from as they are dropped in it",
+    )
+
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="with serve, the directory the final files (and their indexes) are moved to;"
+        " default: the watched directory's output subdirectory",
+    )
+
+    parser.add_argument(
+        "--done",
+        default=None,
+        help="with serve, the directory files compressed are moved to; default: the"
+        " watched directory's done subdirectory",
+    )
+
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=5.0,
+        help="with serve, seconds a file must go unchanged to be taken as closed;"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--linger-seconds",
+        type=float,
+        default=60.0,
+        help="with serve, seconds providers are kept waiting for files once all parts are"
+        " done before they are let go; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="most providers worked at once; default: one per part, or with serve"
+        f" {DEFAULT_SERVE_MAX_WORKERS}",
     )
 
     parser.add_argument(
@@ -511,6 +788,156 @@ def add_arguments_to_command_line_parser():
         " --compresssion), negative value implies no pre-compression (default)",
     )
 
+    parser.add_argument(
+        "--spool-uploads",
+        action="store_true",
+        default=False,
+        help="write each (precompressed) part to a file in the workdir and upload the"
+        " file instead of holding the part in memory; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--stream-archive",
+        action="store_true",
+        default=False,
+        help="archive a directory or several files in-process straight into part-sized"
+        " chunks in the workdir, hashed as they are written, instead of to a temporary"
+        " tar that is then read again; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--part-size",
+        type=part_size_argument,
+        default=None,
+        help="length of the parts the target is divided into, e.g. 32M, or 'auto' to"
+        " choose from the target's length, --target-tasks and the xz dictionary size;"
+        " default: 64M or as recorded by the job being resumed",
+    )
+
+    parser.add_argument(
+        "--target-tasks",
+        type=int,
+        default=DEFAULT_TARGET_TASK_COUNT,
+        help="number of tasks aimed for with --part-size auto; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        type=batch_size_argument,
+        default=AUTO,
+        help="number of parts uploaded, compressed and downloaded in one script per"
+        " task, or 'auto' to batch parts shorter than 64M up to 64M while there are"
+        " enough parts left to keep every provider busy; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=DEFAULT_PIPELINE_DEPTH,
+        help="most tasks staged on a provider at once, above 1 the next part uploads and"
+        " the last downloads while xz runs in the background on the provider;"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--part-cache-size",
+        type=parse_size,
+        default=0,
+        help="budget, e.g. 4G, of the cache (in the workdir) of compressed parts shared by"
+        " all jobs, parts found in it are not dispatched again; 0 to not use the cache"
+        " (default)",
+    )
+
+    parser.add_argument(
+        "--backend",
+        choices=["golem", "local"],
+        default="golem",
+        help="where the parts are compressed, golem providers or local processes"
+        " (offline, no yagna needed); default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=0,
+        help="number of local processes compressing parts alongside the providers"
+        " (hybrid mode), or with --backend local the number of processes (default: one"
+        " per core); default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--speculate-after",
+        type=float,
+        default=DEFAULT_SPECULATION_FACTOR,
+        help="once no parts are left to dispatch, launch a copy of a part on another"
+        " provider when it has run this many times the median part time, the first to"
+        " finish wins; 0 to not speculate; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--speculate-min-seconds",
+        type=float,
+        default=DEFAULT_SPECULATION_MIN_SECONDS,
+        help="seconds a part must have run before a copy is launched; default:"
+        " %(default)s",
+    )
+
+    parser.add_argument(
+        "--speculate-copies",
+        type=int,
+        default=DEFAULT_SPECULATION_MAX_COPIES,
+        help="most copies launched of a part; default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--ignore-provider-history",
+        action="store_true",
+        default=False,
+        help="score offers by price alone instead of by the MiB per GLM expected from the"
+        " throughput, failures and timeouts recorded of their provider in earlier runs"
+        " (which are recorded regardless); default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--tree-hash",
+        action="store_true",
+        default=False,
+        help="identify the job by a tree of blake2b hashes taken of each part in parallel"
+        " instead of a sha1 hash of the whole target (jobs begun with one are not resumed"
+        " with the other); default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--precompress-workers",
+        type=int,
+        default=None,
+        help="number of local processes performing --xfer-compression-level"
+        " concurrently; default: one per core",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve the progress of the session (parts, bytes transferred, compression"
+        " ratio, throughput of each provider, retries, timeouts and GLM spent) as"
+        " OpenMetrics at http://127.0.0.1:PORT/metrics for prometheus to scrape",
+    )
+
+    parser.add_argument(
+        "--metrics-textfile",
+        default=None,
+        help="path to keep the progress of the session written to in the prometheus text"
+        " format, e.g. for the textfile collector of node_exporter",
+    )
+
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=DEFAULT_METRICS_INTERVAL,
+        help="seconds between updates of the metrics; default: %(default)s",
+    )
+
     return parser
 
 
@@ -519,110 +946,190 @@ if __name__ == "__main__":
     # parser.set_defaults(log_file=f"gompress-{now}.log")
     import os
 
-    if not os.environ.get("YAGNA_APPKEY", None):
+    # serving a watched directory takes the options of a run, bar the targets
+    serving = len(sys.argv) > 1 and sys.argv[1] == "serve"
+
+    parser = add_arguments_to_command_line_parser()
+    args = parser.parse_args(sys.argv[2:] if serving else None)
+    if serving and args.watch is None:
+        parser.error("serve needs a directory to --watch")
+    if not serving and args.watch is not None:
+        parser.error(
+            "a directory is watched by serve, e.g. gompress.py serve --watch DIR"
+        )
+
+    # the local backend runs offline, without a yagna daemon to authenticate to
+    if args.backend == "golem" and not os.environ.get("YAGNA_APPKEY", None):
         print(
             "whoa, hold on a minute, you haven't set YAGNA_APPKEY environment variable."
             " you can't run a requestor app without it!"
         )
         sys.exit(1)
 
-    parser = add_arguments_to_command_line_parser()
-    args = parser.parse_args()
-
-    target_file = None
-    target_file_archive = None
-
-    if len(args.target) == 1:
-        if not Path(args.target[0]).is_dir() and "*" not in args.target[0]:
-            target_file = Path(args.target[0])
-    if target_file is None:
-        target_file_archive = archive(args.target)
     data_dir = Path("./workdir")
     data_dir.mkdir(exist_ok=True)
 
+    ####################################################
+    # the targets, archived together unless each is    #
+    # to be compressed on its own (in the same session) #
+    ####################################################
+    targets = list(args.target)
+    if args.manifest is not None:
+        targets += read_manifest(args.manifest)
+    if serving:
+        if len(targets) > 0:
+            parser.error("serve takes its targets from the --watch directory")
+        target_groups = []
+    elif len(targets) == 0:
+        parser.error("a target (or a --manifest listing targets) is required")
+    elif args.each or args.manifest is not None:
+        target_groups = [[target] for target in targets]
+    else:
+        target_groups = [targets]
+
     ################################################
     # create object to store information about run #
+    # (of each job)                                #
     ################################################
-    ctx = CTX(
-        data_dir,
-        target_file if target_file is not None else target_file_archive.data,
-        args.xfer_compression_level,
-        args.min_cpu_threads,
-    )
+    precompress_pool = None
+    if (serving or len(target_groups) > 1) and args.xfer_compression_level >= 0:
+        # one pool precompresses for every job
+        precompress_pool = create_precompress_pool(args.precompress_workers)
+
+    def create_ctx(target_file, streamed_archive=None):
+        return CTX(
+            data_dir,
+            target_file,
+            args.xfer_compression_level,
+            args.min_cpu_threads,
+            args.precompress_workers,
+            args.spool_uploads,
+            args.tree_hash,
+            args.part_size,
+            args.target_tasks,
+            args.part_cache_size,
+            streamed_archive,
+            precompress_pool,
+            # a file dropped again is compressed again, no one answers a prompt
+            overwrite_final_in=serving,
+        )
+
+    ctxs = []
+    # the temporary tars and streamed archives to remove at the end
+    temporaries = []
+    for target_group in target_groups:
+        target_file, target_file_archive, streamed_archive = prepare_target(
+            target_group, args, data_dir
+        )
+        temporaries += [
+            temporary
+            for temporary in (target_file_archive, streamed_archive)
+            if temporary is not None
+        ]
+        ctxs.append(create_ctx(target_file, streamed_archive))
+
+    ##################################################
+    # the progress of the session, exported if asked #
+    ##################################################
+    metrics = None
+    metrics_server = None
+    if args.metrics_port is not None or args.metrics_textfile is not None:
+        metrics = Metrics(
+            Path(args.metrics_textfile) if args.metrics_textfile else None,
+            args.metrics_interval,
+        )
+        if args.metrics_port is not None:
+            metrics_server = start_http_server(metrics, args.metrics_port)
+            print(f"Serving metrics at http://127.0.0.1:{args.metrics_port}/metrics")
 
     #####################
     #      run          #
     #####################
-    run_golem_example(
-        main(
-            ctx,
+    if args.backend == "local":
+        # all of the compressing is local, --local-workers sizes the pool
+        backend = LocalBackend(max_workers=args.local_workers)
+        local_workers = 0
+    else:
+        # (yapapi is needed from here on only)
+        from golembackend import GolemBackend
+        from providerstats import ProviderStats
+
+        backend = GolemBackend(
             subnet_tag=args.subnet_tag,
             min_cpu_threads=args.min_cpu_threads,
             payment_driver=args.payment_driver,
             payment_network=args.payment_network,
             show_usage=args.show_usage,
+            speculation=Speculation(
+                args.speculate_after,
+                args.speculate_min_seconds,
+                args.speculate_copies,
+            ),
+            providerStats=ProviderStats(data_dir / "history.db"),
+            score_providers=not args.ignore_provider_history,
+            batch_size=args.batch_size,
+            pipeline_depth=args.pipeline_depth,
+            max_workers=args.max_workers
+            or (DEFAULT_SERVE_MAX_WORKERS if serving else None),
+            metrics=metrics,
+        )
+        local_workers = args.local_workers
+
+    if serving:
+        serve_directory(args, backend, local_workers, create_ctx, metrics)
+        if precompress_pool is not None:
+            precompress_pool.shutdown(cancel_futures=True)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        sys.exit(0)
+    # whether each job finished was verified and concatenated, each job is finalized
+    # as soon as its parts are all in
+    finalized = {}
+
+    def on_finished(ctx):
+        finalized[ctx] = finalize(ctx)
+        if finalized[ctx]:
+            # not held open for as long as the other jobs of the session run
+            ctx.close()
+
+    run_golem_example(
+        main(
+            ctxs,
+            backend,
+            local_workers=local_workers,
+            on_finished=on_finished,
+            metrics=metrics,
         ),
         log_file=args.log_file if args.enable_logging else None,
     )
 
-    #####################
-    #       verify      #
-    #####################
-    if ctx.verify():
-        ######################
-        #    concatenate     #
-        ######################
-        ctx.concatenate_and_finalize()
-
-        #################
-        #    report     #
-        #################
-        original_mib = ctx.len_file(target=True) / 2**20
-        final_mib = ctx.len_file(target=False) / 2**20
-
-        def exclamation():
-            exclamations = ["wow!", "wowowowowow!", "w0w!", "w0w0w0w0w0w0w!"]
-            return random.choice(exclamations)
-
-        path_to_sound_file = Path(
-            projectdir / "gs" / "496702__dj-somar__chord-1-dj-somar.wav"
-        )
-
-        day_has_passed = ctx.update_last_run()
-        if day_has_passed:
-            ssp = play_sound(path_to_sound_file)
-
-        print(
-            f"The run was a success! \033[1m{ctx.path_to_target.name}\033[0m has been compressed"
-            f" to {final_mib:,.{2}f}MiB from {original_mib:,.{2}f}MiB",
-            end="",
-        )
-        if final_mib / original_mib < 0.330001:
-            print(",", exclamation())
-        else:
-            print(".")
-
-        if not ctx.whether_resuming:
-            print(
-                f"The time spent on compressing the data with xz was clocked at"
-                f" {str(ctx.total_vm_run_time)[:-4]}."
-            )
+    for ctx in ctxs:
+        if ctx not in finalized:
+            # e.g. the session ended early, the parts recorded may yet all be in
+            finalized[ctx] = finalize(ctx)
+        if finalized[ctx]:
+            continue
+        countPending = len(ctx.list_pending_ids())
         print(
-            f"You can find the compressed file at"
-            f" \033[1;33m{ctx.path_to_final_file}\033[0m"
+            f"\033[1;31mthe run did not finish"
+            f"{f' `{ctx.name_of_target}`' if len(ctxs) > 1 else ''}, please re-run to"
+            f" compress the remaining {countPending} part{'s' if countPending > 1 else ''}."
+            f"\033[0m"
         )
+    finalized_count = sum(finalized.values())
+    if finalized_count > 0:
+        if len(ctxs) > 1:
+            print(f"{finalized_count} of {len(ctxs)} targets compressed")
         print(
             "\033[1m"
             "As always, on behalf on the golem community, thank you for your participation"
             "\033[0m"
         )
-    else:
-        countPending = len(ctx.list_pending_ids())
-        print(
-            f"\033[1;31mthe run did not finish, please re-run to compress the"
-            f" remaining {countPending} part{'s' if countPending > 1 else ''}.\033[0m"
-        )
-    ctx.target_open_file.close()
-    if target_file_archive is not None:
-        target_file_archive.tempDir.cleanup()
-        pass
+    for ctx in ctxs:
+        ctx.close()
+    if precompress_pool is not None:
+        precompress_pool.shutdown(cancel_futures=True)
+    for temporary in temporaries:
+        temporary.cleanup()
+    if metrics_server is not None:
+        metrics_server.shutdown()
@@ -0,0 +1,143 @@
+"""remember the hash identifying a job by the stat of the target so it need not be recomputed.
+
+hashing the whole target on each start, including on each resume, reads the entire file
+before any work is dispatched. the hash computed for a target is therefore stored in the
+history database of the main working directory keyed by the device, inode, size,
+modification time (ns) and path of the target. on the next start a target whose stat
+still matches is not read again.
+
+the method (e.g. "sha1") is part of the key so that differing hashes of the same target
+may be cached side by side. the hashes of the parts a tree hash was derived from may be
+stored alongside it.
+
+
+Typical usage example:
+
+hashCache = HashCache(Path("./workdir/history.db"))
+the_hash = hashCache.lookup(path_to_target)
+if the_hash is None:
+    the_hash = sha1_hash(path_to_target)
+    hashCache.store(path_to_target, the_hash)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import os
+import sqlite3
+from pathlib import Path
+from debug.mylogging import g_logger
+
+
+def _stat_key(path_to_target):
+    """return the tuple (device, inode, size, mtime_ns, path) identifying the target's state"""
+    path_to_target = Path(path_to_target).resolve()
+    stat_result = os.stat(path_to_target)
+    return (
+        stat_result.st_dev,
+        stat_result.st_ino,
+        stat_result.st_size,
+        stat_result.st_mtime_ns,
+        str(path_to_target),
+    )
+
+
+class HashCache:
+    """lookup or store the hash of a target keyed by its stat in the history database
+
+    Attributes:
+        con: connection to the history database (autocommit)
+    """
+
+    def __init__(self, path_to_history_db):
+        """connect to (creating if needed) the hashcache table of the history database"""
+        self.con = sqlite3.connect(str(path_to_history_db), isolation_level=None)
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS hashcache(
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                method TEXT NOT NULL,
+                job_hash TEXT NOT NULL,
+                part_hashes TEXT,
+                PRIMARY KEY (device, inode, size, mtime_ns, path, method)
+            )"""
+        )
+        columns = [row[1] for row in self.con.execute("PRAGMA table_info(hashcache)")]
+        if "part_hashes" not in columns:
+            self.con.execute("ALTER TABLE hashcache ADD COLUMN part_hashes TEXT")
+
+    def lookup(self, path_to_target, method="sha1"):
+        """return the hash stored for the target in its current state or None"""
+        row = self.con.execute(
+            "SELECT job_hash FROM hashcache WHERE device = ? AND inode = ? AND size = ?"
+            " AND mtime_ns = ? AND path = ? AND method = ?",
+            (*_stat_key(path_to_target), method),
+        ).fetchone()
+        if row is not None:
+            g_logger.debug(f"hash of {path_to_target} found in cache: {row[0]}")
+            return row[0]
+        return None
+
+    def lookup_methods(self, path_to_target, method_prefix):
+        """return the (method, hash) stored for the target in its current state of each
+        method beginning with method_prefix"""
+        return self.con.execute(
+            "SELECT method, job_hash FROM hashcache WHERE device = ? AND inode = ?"
+            " AND size = ? AND mtime_ns = ? AND path = ? AND method LIKE ?",
+            (*_stat_key(path_to_target), method_prefix + "%"),
+        ).fetchall()
+
+    def lookup_part_hashes(self, path_to_target, method):
+        """return the list of part hashes stored for the target in its current state or None"""
+        row = self.con.execute(
+            "SELECT part_hashes FROM hashcache WHERE device = ? AND inode = ?"
+            " AND size = ? AND mtime_ns = ? AND path = ? AND method = ?",
+            (*_stat_key(path_to_target), method),
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return row[0].split(",")
+
+    def store(
+        self, path_to_target, job_hash, method="sha1", stat_key=None, part_hashes=None
+    ):
+        """record the hash for the target in its current state replacing older records
+
+        Args:
+            path_to_target: Path to the target that has been hashed
+            job_hash: the hash computed
+            method: the name of the hashing method
+            stat_key: the key as taken before hashing (see stat_key()), if given and the
+                target has changed since, nothing is stored
+            part_hashes: optional list of hashes of each part of the target
+        """
+        current_key = _stat_key(path_to_target)
+        if stat_key is not None and stat_key != current_key:
+            g_logger.debug(f"{path_to_target} changed while hashing, not caching")
+            return
+        self.con.execute(
+            "DELETE FROM hashcache WHERE path = ? AND method = ?",
+            (current_key[4], method),
+        )
+        self.con.execute(
+            "INSERT INTO hashcache(device, inode, size, mtime_ns, path, method,"
+            " job_hash, part_hashes) VALUES (?,?,?,?,?,?,?,?)",
+            (
+                *current_key,
+                method,
+                job_hash,
+                ",".join(part_hashes) if part_hashes is not None else None,
+            ),
+        )
+
+    @staticmethod
+    def stat_key(path_to_target):
+        """return the key the target would be cached under in its current state"""
+        return _stat_key(path_to_target)
+
+    def close(self):
+        self.con.close()
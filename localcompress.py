@@ -0,0 +1,167 @@
+"""compress parts on the requestor's own cores alongside the golem providers.
+
+while execute_tasks runs the requestor is mostly idle. local workers take parts from the
+same PendingParts as the golem workers and compress them with liblzma (via the lzma
+module) in a pool of processes, using the same preset xz.sh would be given. the result
+is the dictionary a golem worker produces from xz.sh's output, so it is recorded the
+same way (CTX.record_result).
+
+
+Typical usage example:
+
+pool = create_local_pool(4)
+result = await loop.run_in_executor(
+    pool, compress_part_locally, "/target", 0, 2**26, ["-T1", "-9e"], "/workdir/<hash>/parts/part_1.xz"
+)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import asyncio
+import hashlib
+import lzma
+import multiprocessing
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from xzpreset import preset_level, xz_arguments
+from debug.mylogging import g_logger
+
+READ_CHUNK_SIZE = 2**20
+# attempts a local worker makes at a part before leaving it to the other workers
+LOCAL_ATTEMPTS_PER_PART = 2
+
+
+def cpu_model():
+    """return the model name of the local cpu as xz.sh would report it"""
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return " ".join(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def compress_part_locally(path_to_file, start, end, arguments, path_to_output):
+    """(runs in a pool process) compress [start, end) of a file as xz.sh would
+
+    the sha256 digest is taken of the stream as it is written.
+
+    Args:
+        path_to_file: path string to the file to read from
+        start: offset of the first byte of the range
+        end: offset one past the last byte of the range
+        arguments: the xz arguments (see xz_arguments), the preset is honored
+        path_to_output: path string to write the xz stream to
+
+    Returns:
+        a result dictionary of "checksum" (length), "digest", "walltime", "path" and "model"
+    """
+    preset = [argument for argument in arguments if argument.strip("-e").isdigit()][-1]
+    level = preset_level(preset)
+    if preset.endswith("e"):
+        level |= lzma.PRESET_EXTREME
+    start_time = time.perf_counter()
+    lzmaCompressor = lzma.LZMACompressor(
+        format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=level
+    )
+    sha256 = hashlib.sha256()
+    length = 0
+    buffer = memoryview(bytearray(READ_CHUNK_SIZE))
+    with open(path_to_file, "rb", buffering=0) as src, open(
+        path_to_output, "wb"
+    ) as dst:
+        src.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            count = src.readinto(buffer[: min(READ_CHUNK_SIZE, remaining)])
+            if not count:
+                break
+            remaining -= count
+            compressed = lzmaCompressor.compress(buffer[:count])
+            sha256.update(compressed)
+            length += dst.write(compressed)
+        compressed = lzmaCompressor.flush()
+        sha256.update(compressed)
+        length += dst.write(compressed)
+    return {
+        "checksum": str(length),
+        "digest": sha256.hexdigest(),
+        "walltime": timedelta(seconds=time.perf_counter() - start_time),
+        "path": str(Path(path_to_output).as_posix()),
+        "model": cpu_model(),
+    }
+
+
+def create_local_pool(max_workers):
+    """return a ProcessPoolExecutor of max_workers (spawned) processes to compress in"""
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+async def local_worker(ctxs, pendingParts, pool, on_result):
+    """claim parts from pendingParts and compress them in pool until all are done
+
+    :param ctxs: the CTX of each job of the session (indexed by the keys of the parts)
+    :param pendingParts: the PendingParts shared with the golem workers
+    :param pool: executor from create_local_pool
+    :param on_result: callable(key, result) recording a result
+
+    while no part is unclaimed the worker waits on the parts in flight, as those of a
+    failed task are released (e.g. by the golem workers at the tail of the job), and on
+    parts to be added while pendingParts is open ended. a part whose compression fails
+    is released after the others for another worker (e.g. on golem) and the worker
+    goes on, trying a part no more than LOCAL_ATTEMPTS_PER_PART times. the worker
+    stops once every part is done, or once none it may claim can be released to it.
+    """
+    loop = asyncio.get_running_loop()
+    # count of the failed attempts of the worker at each part
+    failures = {}
+    while True:
+        key = pendingParts.claim(
+            lambda key: failures.get(key, 0) < LOCAL_ATTEMPTS_PER_PART
+        )
+        if key is None:
+            if pendingParts.all_done():
+                return
+            if not pendingParts.open_ended and len(pendingParts.in_flight) == 0:
+                # the parts unclaimed were failed here, left to the other workers
+                return
+            await pendingParts.wait_for_change()
+            continue
+        ctx, partId = ctxs[key[0]], key[1]
+        read_range = ctx.lookup_partition_range(partId)
+        path_to_output = (
+            ctx.work_directory_info.path_to_parts_directory / f"part_{partId}.xz"
+        )
+        try:
+            start = time.time()
+            result = await loop.run_in_executor(
+                pool,
+                compress_part_locally,
+                *ctx.locate_part(partId),
+                xz_arguments(read_range[1] - read_range[0]),
+                str(path_to_output),
+            )
+            # the part is read from the target as it is compressed (see timing)
+            result["timings"] = [
+                ("xz", start, time.time(), read_range[1] - read_range[0])
+            ]
+            result["source"] = "local"
+        except Exception as e:
+            g_logger.debug(f"local compression of part {partId} failed: {e}")
+            print(
+                f"\033[1;33ma local worker failed on part {partId} of"
+                f" {ctx.name_of_target}:\033[0m {e}"
+            )
+            failures[key] = failures.get(key, 0) + 1
+            pendingParts.release(key, last=True)
+            continue
+        on_result(key, result)
@@ -0,0 +1,300 @@
+"""export the progress of a running session for prometheus to scrape (OpenMetrics).
+
+the workers and the loop recording the results only add to counters of a Metrics
+(on the event loop, so without locks). every interval seconds the event loop renders
+the counters, along with the parts of each job pending, in flight and completed (from
+CTX.list_pending_ids), into a snapshot. the snapshot is served over http from a thread
+of its own (--metrics-port) and/or written to a file (--metrics-textfile, e.g. for the
+textfile collector of node_exporter), so a scrape never waits on the workers nor they
+on it.
+
+exported:
+
+gompress_parts{job,state}                  parts pending, in_flight and completed
+gompress_uploaded_bytes_total              bytes uploaded to providers
+gompress_downloaded_bytes_total            bytes downloaded from providers
+gompress_original_bytes_total              bytes of the targets' parts recorded
+gompress_compressed_bytes_total            bytes the parts recorded were compressed to
+gompress_compression_ratio                 compressed over original bytes so far
+gompress_provider_parts_total{provider}    parts compressed by each provider (or local)
+gompress_provider_bytes_total{provider}    bytes of the target compressed by each
+gompress_provider_xz_seconds_total{provider}  seconds xz ran for each
+gompress_provider_throughput_bytes_per_second{provider}  bytes over xz seconds of each
+gompress_part_failures_total               results rejected and workers failed
+gompress_task_timeouts_total               tasks timed out
+gompress_retries_total                     parts dispatched again after a failure
+gompress_glm_spent                         GLM accepted in debit notes and invoices
+
+
+Typical usage example:
+
+metrics = Metrics(path_to_textfile=Path("/var/lib/node_exporter/gompress.prom"))
+server = start_http_server(metrics, 9464)
+asyncio.create_task(metrics.publish(session))
+...
+server.shutdown()
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import asyncio
+import os
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_INTERVAL = 5.0
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _escape(value):
+    """escape a label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+class Metrics:
+    """counters of a session, rendered into a snapshot to export
+
+    Attributes:
+        uploaded_bytes, downloaded_bytes: bytes sent to and fetched from providers
+        original_bytes, compressed_bytes: bytes of the parts recorded before and after
+        failures, timeouts, retries: counts of failed parts, timed out tasks and parts
+            dispatched again
+        providers: provider name -> [parts, bytes of the target, xz seconds]
+        payments: agreement id -> GLM last accepted (debit notes are cumulative and the
+            invoice settles the agreement)
+        path_to_textfile: Path the snapshot is also written to, or None
+        interval: seconds between renderings of the snapshot
+        snapshot: the last rendering (OpenMetrics text, bytes)
+    """
+
+    def __init__(self, path_to_textfile=None, interval=DEFAULT_METRICS_INTERVAL):
+        self.uploaded_bytes = 0
+        self.downloaded_bytes = 0
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.providers = {}
+        self.payments = {}
+        self.path_to_textfile = path_to_textfile
+        self.interval = interval
+        self.snapshot = b"# EOF\n"
+
+    ########################################
+    # updates (from the event loop)        #
+    ########################################
+    def uploaded(self, length):
+        self.uploaded_bytes += length
+
+    def downloaded(self, length):
+        self.downloaded_bytes += length
+
+    def failed(self, timed_out=False):
+        """count a part failed (or a task timed out)"""
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.failures += 1
+
+    def retried(self, count=1):
+        """count parts dispatched again"""
+        self.retries += count
+
+    def recorded(self, source, original_length, compressed_length, seconds):
+        """count a part recorded as compressed by source in seconds (of xz)"""
+        self.original_bytes += original_length
+        self.compressed_bytes += compressed_length
+        provider = self.providers.setdefault(source or "unknown", [0, 0, 0.0])
+        provider[0] += 1
+        provider[1] += original_length
+        provider[2] += seconds
+
+    def payment_accepted(self, agreement_id, amount):
+        """record the total accepted (by a debit note or invoice) of an agreement"""
+        self.payments[agreement_id] = Decimal(amount)
+
+    ########################################
+    # rendering                            #
+    ########################################
+    def _families(self, session):
+        """return (name, type, help, [(labels, value)]) of each metric"""
+        parts = []
+        if session is not None:
+            in_flight_counts = {}
+            if session.pendingParts is not None:
+                for key in session.pendingParts.in_flight:
+                    in_flight_counts[key[0]] = in_flight_counts.get(key[0], 0) + 1
+            for index, ctx in enumerate(session.ctxs):
+                if session.remaining_counts[index] == 0:
+                    pending_count = 0  # (the job may be closed)
+                else:
+                    pending_count = len(ctx.list_pending_ids())
+                in_flight_count = min(in_flight_counts.get(index, 0), pending_count)
+                job = {"job": ctx.name_of_target}
+                parts += [
+                    ({**job, "state": "pending"}, pending_count - in_flight_count),
+                    ({**job, "state": "in_flight"}, in_flight_count),
+                    ({**job, "state": "completed"}, ctx.part_count - pending_count),
+                ]
+        providers = sorted(self.providers.items())
+        return [
+            ("gompress_parts", "gauge", "parts of each job by state", parts),
+            (
+                "gompress_uploaded_bytes",
+                "counter",
+                "bytes uploaded to providers",
+                [({}, self.uploaded_bytes)],
+            ),
+            (
+                "gompress_downloaded_bytes",
+                "counter",
+                "bytes downloaded from providers",
+                [({}, self.downloaded_bytes)],
+            ),
+            (
+                "gompress_original_bytes",
+                "counter",
+                "bytes of the targets' parts recorded",
+                [({}, self.original_bytes)],
+            ),
+            (
+                "gompress_compressed_bytes",
+                "counter",
+                "bytes the parts recorded were compressed to",
+                [({}, self.compressed_bytes)],
+            ),
+            (
+                "gompress_compression_ratio",
+                "gauge",
+                "compressed over original bytes of the parts recorded",
+                [
+                    (
+                        {},
+                        self.compressed_bytes / self.original_bytes
+                        if self.original_bytes > 0
+                        else 0,
+                    )
+                ],
+            ),
+            (
+                "gompress_provider_parts",
+                "counter",
+                "parts compressed by each provider",
+                [({"provider": name}, value[0]) for name, value in providers],
+            ),
+            (
+                "gompress_provider_bytes",
+                "counter",
+                "bytes of the target compressed by each provider",
+                [({"provider": name}, value[1]) for name, value in providers],
+            ),
+            (
+                "gompress_provider_xz_seconds",
+                "counter",
+                "seconds xz ran on each provider",
+                [({"provider": name}, value[2]) for name, value in providers],
+            ),
+            (
+                "gompress_provider_throughput_bytes_per_second",
+                "gauge",
+                "bytes of the target compressed per second of xz by each provider",
+                [
+                    ({"provider": name}, value[1] / value[2] if value[2] > 0 else 0)
+                    for name, value in providers
+                ],
+            ),
+            (
+                "gompress_part_failures",
+                "counter",
+                "results rejected and workers failed",
+                [({}, self.failures)],
+            ),
+            (
+                "gompress_task_timeouts",
+                "counter",
+                "tasks timed out",
+                [({}, self.timeouts)],
+            ),
+            (
+                "gompress_retries",
+                "counter",
+                "parts dispatched again after a failure",
+                [({}, self.retries)],
+            ),
+            (
+                "gompress_glm_spent",
+                "gauge",
+                "GLM accepted in debit notes and invoices",
+                [({}, sum(self.payments.values(), Decimal(0)))],
+            ),
+        ]
+
+    def render(self, session=None, openmetrics=True):
+        """return the metrics as OpenMetrics text (or the prometheus text format, whose
+        counters are typed by the name of their sample, for the textfile collector)"""
+        lines = []
+        for name, kind, description, samples in self._families(session):
+            sample_name = f"{name}_total" if kind == "counter" else name
+            lines.append(f"# HELP {name if openmetrics else sample_name} {description}")
+            lines.append(f"# TYPE {name if openmetrics else sample_name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {value}")
+        if openmetrics:
+            lines.append("# EOF")
+        return ("\n".join(lines) + "\n").encode()
+
+    def refresh(self, session=None):
+        """render the snapshot (and write the textfile, replacing it at once)"""
+        self.snapshot = self.render(session)
+        if self.path_to_textfile is not None:
+            path_to_temporary = self.path_to_textfile.with_name(
+                self.path_to_textfile.name + ".tmp"
+            )
+            path_to_temporary.write_bytes(self.render(session, openmetrics=False))
+            os.replace(path_to_temporary, self.path_to_textfile)
+
+    async def publish(self, session=None):
+        """refresh every interval seconds until cancelled (refreshing a last time)"""
+        try:
+            while True:
+                self.refresh(session)
+                await asyncio.sleep(self.interval)
+        finally:
+            self.refresh(session)
+
+
+def start_http_server(metrics, port, address="127.0.0.1"):
+    """serve the snapshot of metrics at /metrics from a thread, returning the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.snapshot
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # scrapes are not logged to the console
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,164 @@
+"""keep compressed parts in a cache shared by all jobs, addressed by what was compressed.
+
+a part compressed by xz with the same arguments always yields the same stream, so the
+stream is stored under the hash of the part's content (Part.hash, see workdirectoryinfo)
+combined with the hash of the xz arguments. a part of any later job, or a part repeated
+within the same target, whose key is found is then served locally instead of being
+dispatched.
+
+the streams are stored as files in <workdir>/partcache and indexed in the partcache
+table of <workdir>/history.db along with their length, sha256 digest and the time they
+were last used. when the total length exceeds the budget the least recently used
+streams are evicted.
+
+streams are copied in and out of the cache (see filecopy, which shares extents where the
+filesystem allows) rather than linked since parts are appended to when finalized.
+
+
+Typical usage example:
+
+partCache = PartCache(Path("./workdir"), budget=2**30)
+key = partCache.make_key(part_hash, ["-T1", "-9e"])
+if not partCache.fetch(key, path_to_part):
+    ...
+    partCache.store(key, path_to_part, digest)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from filecopy import copy_range
+from debug.mylogging import g_logger
+
+
+def _copy_file(path_to_source, path_to_destination):
+    """copy a whole file returning the count of bytes copied"""
+    with open(path_to_source, "rb") as src, open(path_to_destination, "wb") as dst:
+        length = os.fstat(src.fileno()).st_size
+        copied, _ = copy_range(src.fileno(), dst.fileno(), length, 0, 0)
+    return copied
+
+
+class PartCache:
+    """lookup, store and evict compressed parts keyed by content hash and xz arguments
+
+    Attributes:
+        path_to_cache_directory: Path to the directory holding the cached streams
+        budget: the most bytes the cached streams may occupy
+        con: connection to the history database (autocommit)
+    """
+
+    def __init__(self, path_to_wdir_parent, budget):
+        """connect to the index in the history database and create the cache directory
+
+        Args:
+            path_to_wdir_parent: Path to the main working directory
+            budget: the most bytes the cache may occupy
+        """
+        self.path_to_cache_directory = Path(path_to_wdir_parent) / "partcache"
+        self.path_to_cache_directory.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        # (closed with its job, possibly by the thread finalizing it)
+        self.con = sqlite3.connect(
+            str(Path(path_to_wdir_parent) / "history.db"),
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS partcache(
+                key TEXT PRIMARY KEY NOT NULL,
+                size INTEGER NOT NULL,
+                digest TEXT,
+                last_used REAL NOT NULL
+            )"""
+        )
+
+    @staticmethod
+    def make_key(part_hash, xz_arguments):
+        """return the cache key for a part's content hash and the arguments passed to xz"""
+        arguments_hash = hashlib.blake2b(
+            " ".join(xz_arguments).encode(), digest_size=8
+        ).hexdigest()
+        return f"{part_hash}-{arguments_hash}"
+
+    def _path_to_entry(self, key):
+        return self.path_to_cache_directory / f"{key}.xz"
+
+    def lookup(self, key):
+        """return (size, digest) of a cached stream or None"""
+        row = self.con.execute(
+            "SELECT size, digest FROM partcache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not self._path_to_entry(key).exists():
+            self.con.execute("DELETE FROM partcache WHERE key = ?", (key,))
+            return None
+        return row
+
+    def fetch(self, key, path_to_destination):
+        """copy a cached stream to path_to_destination
+
+        Returns:
+            (size, digest) of the stream copied or None if the key is not cached
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        copied = _copy_file(self._path_to_entry(key), path_to_destination)
+        if copied != entry[0]:
+            g_logger.debug(f"cached part {key} is truncated, discarding")
+            self.discard(key)
+            Path(path_to_destination).unlink(missing_ok=True)
+            return None
+        self.con.execute(
+            "UPDATE partcache SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        return entry
+
+    def store(self, key, path_to_source, digest=None):
+        """copy a compressed stream into the cache then evict beyond the budget"""
+        size = Path(path_to_source).stat().st_size
+        if size > self.budget or self.lookup(key) is not None:
+            return
+        path_to_entry = self._path_to_entry(key)
+        path_to_partial = path_to_entry.with_suffix(".partial")
+        _copy_file(path_to_source, path_to_partial)
+        path_to_partial.replace(path_to_entry)
+        self.con.execute(
+            "INSERT OR REPLACE INTO partcache(key, size, digest, last_used)"
+            " VALUES (?,?,?,?)",
+            (key, size, digest, time.time()),
+        )
+        self.evict()
+
+    def discard(self, key):
+        """remove a stream from the cache"""
+        self._path_to_entry(key).unlink(missing_ok=True)
+        self.con.execute("DELETE FROM partcache WHERE key = ?", (key,))
+
+    def evict(self):
+        """remove the least recently used streams until the cache fits the budget"""
+        total = self.con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM partcache"
+        ).fetchone()[0]
+        if total <= self.budget:
+            return
+        for key, size in self.con.execute(
+            "SELECT key, size FROM partcache ORDER BY last_used"
+        ).fetchall():
+            g_logger.debug(f"evicting {key} from the part cache")
+            self.discard(key)
+            total -= size
+            if total <= self.budget:
+                break
+
+    def close(self):
+        self.con.close()
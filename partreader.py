@@ -0,0 +1,169 @@
+"""hand out the ranges (parts) of the target file as memoryviews without copying them.
+
+the target file is memory mapped read only so that a part is served straight from the
+page cache as a memoryview slice of the map. where the file cannot be mapped (e.g. it is
+empty or the platform refuses) the part is read into a bytearray drawn from a pool of
+reusable buffers so that subsequent parts do not allocate anew.
+
+a view that has been handed out should be given back via release() once the bytes are
+no longer needed (e.g. after they have been uploaded) so that the map can be closed and
+pooled buffers reused.
+
+ChunkedPartReader serves the parts of an archive streamed into chunk files (see
+archive.stream_archive) likewise, mapping the chunk holding a part while it is viewed.
+
+
+Typical usage example:
+
+partReader = PartReader(open("/target", "rb"))
+view = partReader.view(0, 2**20)
+...
+partReader.release(view)
+partReader.close()
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import mmap
+from debug.mylogging import g_logger
+
+
+class BufferPool:
+    """keep released bytearrays around to serve later requests of the same or lesser size.
+
+    Attributes:
+        max_buffers: the most buffers retained while not in use, beyond which released
+            buffers are left to the garbage collector
+    """
+
+    def __init__(self, max_buffers=4):
+        self.max_buffers = max_buffers
+        self._free = []
+        self._lent = set()
+
+    def acquire(self, size):
+        """return a memoryview of exactly size bytes over a pooled (or new) bytearray."""
+        for i, buffer in enumerate(self._free):
+            if len(buffer) >= size:
+                self._free.pop(i)
+                break
+        else:
+            buffer = bytearray(size)
+        self._lent.add(id(buffer))
+        return memoryview(buffer)[:size]
+
+    def owns(self, buffer):
+        """whether buffer is one lent out by this pool"""
+        return id(buffer) in self._lent
+
+    def release(self, buffer):
+        """return a bytearray obtained via acquire() to the pool"""
+        self._lent.discard(id(buffer))
+        if len(self._free) < self.max_buffers:
+            self._free.append(buffer)
+
+
+class PartReader:
+    """serve ranges of an open file as memoryviews, mapped where possible.
+
+    Attributes:
+        open_file: the file object (opened "rb") the ranges are read from
+        buffer_pool: BufferPool used when the file could not be mapped
+        mapped: whether views are served from a memory map
+    """
+
+    def __init__(self, open_file, buffer_pool=None):
+        """map open_file for reading, falling back to reads into pooled buffers"""
+        self.open_file = open_file
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+        try:
+            self._mmap = mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError) as e:
+            g_logger.debug(f"could not map {open_file.name}, reading into buffers: {e}")
+            self._mmap = None
+
+    @property
+    def mapped(self):
+        return self._mmap is not None
+
+    def view(self, start, end):
+        """return a memoryview of the range [start, end) of the file"""
+        if self._mmap is not None:
+            return memoryview(self._mmap)[start:end]
+
+        view = self.buffer_pool.acquire(end - start)
+        self.open_file.seek(start)
+        count = self.open_file.readinto(view)
+        return view[:count]
+
+    def release(self, view):
+        """release a view obtained from view() returning any pooled buffer"""
+        underlying = view.obj
+        try:
+            view.release()
+        except BufferError:
+            # still exported elsewhere, the garbage collector will release it
+            return
+        if self.buffer_pool.owns(underlying):
+            self.buffer_pool.release(underlying)
+
+    def close(self):
+        """unmap the file (the file object itself is left open)"""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                g_logger.debug("views to the target remain, leaving unmapping to exit")
+            self._mmap = None
+
+
+class ChunkedPartReader:
+    """serve ranges of a target held as consecutive chunk files, mapped where possible.
+
+    a range shall lie within a single chunk (the parts of a streamed archive are its
+    chunks). each view maps its chunk, the map is closed once the view is released.
+
+    Attributes:
+        streamed_archive: the StreamedArchive whose chunks are read
+        buffer_pool: BufferPool used when a chunk could not be mapped
+    """
+
+    def __init__(self, streamed_archive, buffer_pool=None):
+        self.streamed_archive = streamed_archive
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+
+    def view(self, start, end):
+        """return a memoryview of the range [start, end) of the target"""
+        index, offset = divmod(start, self.streamed_archive.chunk_size)
+        with open(self.streamed_archive.path_to_chunk(index), "rb") as open_file:
+            try:
+                chunk_map = mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError) as e:
+                g_logger.debug(
+                    f"could not map chunk {index}, reading into buffers: {e}"
+                )
+                view = self.buffer_pool.acquire(end - start)
+                open_file.seek(offset)
+                count = open_file.readinto(view)
+                return view[:count]
+        return memoryview(chunk_map)[offset : offset + end - start]
+
+    def release(self, view):
+        """release a view obtained from view() unmapping its chunk or returning its buffer"""
+        underlying = view.obj
+        try:
+            view.release()
+        except BufferError:
+            # still exported elsewhere, the garbage collector will release it
+            return
+        if isinstance(underlying, mmap.mmap):
+            try:
+                underlying.close()
+            except BufferError:
+                g_logger.debug("views to the chunk remain, leaving unmapping to exit")
+        elif self.buffer_pool.owns(underlying):
+            self.buffer_pool.release(underlying)
+
+    def close(self):
+        """nothing is held between views (each chunk is unmapped once released)"""
@@ -0,0 +1,148 @@
+"""choose the length of the parts a target is divided into.
+
+by default a target is divided into parts of 64MiB, the dictionary size of the
+strongest xz preset. a fixed size may be given instead, or the size may be chosen
+automatically from:
+
+    the length of the target    (divided by the number of tasks aimed for)
+    the target task count       (fewer, longer tasks amortize negotiation and script
+                                 overhead; more, shorter tasks spread over more providers)
+    the xz preset               (a part is rounded up so that it fills the dictionary of
+                                 the preset chosen for it, see xzpreset)
+
+the chosen size is recorded with the job (OriginalFile.part_size) so that a resumed job
+keeps the division it was begun with.
+
+parts shorter than the default may be batched, several to a task (one script of uploads,
+xz.sh runs and downloads), to amortize the round trips of a script. the batch size may be
+fixed or chosen automatically as each task is dispatched (see auto_batch_size).
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import argparse
+
+from xzpreset import MiB, DICTIONARY_SIZES, dictionary_size
+
+DEFAULT_PART_SIZE = 64 * MiB
+DEFAULT_TARGET_TASK_COUNT = 32
+MIN_AUTO_PART_SIZE = 2 * MiB
+MAX_AUTO_PART_SIZE = 128 * MiB
+AUTO = "auto"
+# bytes of the target a batch of parts is filled to in auto mode
+DEFAULT_BATCH_LENGTH = DEFAULT_PART_SIZE
+MAX_BATCH_SIZE = 64
+# workers assumed in auto mode at the least, e.g. before any provider is working
+MIN_AUTO_BATCH_WORKERS = 4
+
+_SIZE_SUFFIXES = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(size_str):
+    """return the number of bytes in a size string such as 1048576, 512K, 64M, 1G or 64MiB
+
+    Raises:
+        ValueError if the string is not a size
+    """
+    normalized = size_str.strip().upper()
+    for unit in ("IB", "B"):
+        if normalized.endswith(unit):
+            normalized = normalized[: -len(unit)]
+            break
+    suffix = normalized[-1:] if normalized[-1:] in _SIZE_SUFFIXES else ""
+    number = normalized[: len(normalized) - len(suffix)]
+    return int(float(number) * _SIZE_SUFFIXES[suffix])
+
+
+def part_size_argument(size_str):
+    """argparse type for --part-size: a positive size or 'auto'"""
+    if size_str.strip().lower() == AUTO:
+        return AUTO
+    try:
+        size = parse_size(size_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{size_str} is neither a size nor '{AUTO}'")
+    if size <= 0:
+        raise argparse.ArgumentTypeError("the part size must be positive")
+    return size
+
+
+def auto_part_size(target_length, target_task_count=DEFAULT_TARGET_TASK_COUNT):
+    """pick a part size for a target of target_length aiming at target_task_count tasks
+
+    Process:
+        divide target length by target task count
+        clamp within [MIN_AUTO_PART_SIZE, MAX_AUTO_PART_SIZE]
+        [ <= 64MiB ]
+        round up to the dictionary size of the preset (so the part fills it)
+
+        [ > 64MiB ]
+        round up to a multiple of the largest dictionary
+
+    Returns:
+        the part size in bytes
+    """
+    if target_task_count < 1:
+        target_task_count = 1
+    size = -(-target_length // target_task_count)
+    size = min(max(size, MIN_AUTO_PART_SIZE), MAX_AUTO_PART_SIZE)
+    largest_dictionary = max(DICTIONARY_SIZES.values())
+    if size > largest_dictionary:
+        return -(-size // largest_dictionary) * largest_dictionary
+    # a part exactly as long as a dictionary is given the preset with that dictionary
+    for dictionary in sorted(set(DICTIONARY_SIZES.values())):
+        if dictionary >= size and dictionary_size(dictionary) == dictionary:
+            return dictionary
+    return size
+
+
+def resolve_part_size(part_size, target_length, target_task_count=None):
+    """return the part size in bytes given the --part-size value
+
+    Args:
+        part_size: None (default size), AUTO or a number of bytes
+        target_length: the length of the target to divide
+        target_task_count: the task count aimed for in auto mode (None for default)
+    """
+    if part_size is None:
+        return DEFAULT_PART_SIZE
+    if part_size == AUTO:
+        if target_task_count is None:
+            target_task_count = DEFAULT_TARGET_TASK_COUNT
+        return auto_part_size(target_length, target_task_count)
+    return int(part_size)
+
+
+def batch_size_argument(size_str):
+    """argparse type for --batch-size: a positive count of parts or 'auto'"""
+    if size_str.strip().lower() == AUTO:
+        return AUTO
+    try:
+        size = int(size_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{size_str} is neither a count nor '{AUTO}'")
+    if size <= 0:
+        raise argparse.ArgumentTypeError("the batch size must be positive")
+    return size
+
+
+def auto_batch_size(part_size, unclaimed_count, worker_count):
+    """pick the count of parts to dispatch in the next task
+
+    Process:
+        fill the batch up to DEFAULT_BATCH_LENGTH of the target (so parts of the default
+        size are not batched)
+        [ fewer parts left than would keep every worker busy ]
+        shrink the batch to the parts left per worker (so the tail is spread), as if
+        there were at least MIN_AUTO_BATCH_WORKERS
+        clamp within [1, MAX_BATCH_SIZE]
+
+    Args:
+        part_size: the length of the parts
+        unclaimed_count: the count of parts not yet dispatched
+        worker_count: the count of workers (providers) taking tasks
+    """
+    size = DEFAULT_BATCH_LENGTH // max(part_size, 1)
+    size = min(size, -(-unclaimed_count // max(worker_count, MIN_AUTO_BATCH_WORKERS)))
+    return min(max(size, 1), MAX_BATCH_SIZE)
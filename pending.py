@@ -0,0 +1,118 @@
+"""track the parts of a job awaiting compression for the workers that take them.
+
+the golem workers (via the task source feeding execute_tasks) and any local workers
+take parts from the same PendingParts so that a part is compressed by whichever asks
+first. a part is claimed when taken, released if the worker taking it failed (so that
+another may claim it) and completed once its result is recorded.
+
+the parts of a session are identified by keys of (index of the job, part id), so that
+the parts of several targets compressed in one session are taken from one PendingParts,
+those of the first target first. an open ended PendingParts (of a session serving a
+watched directory) is not done when its parts are, as the parts of targets arriving
+later are added to it, until it is closed.
+
+
+Typical usage example:
+
+pendingParts = PendingParts([(0, partId) for partId in ctx.list_dispatch_ids()])
+key = pendingParts.claim()
+...
+pendingParts.complete(key)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import asyncio
+from collections import deque
+
+
+class PendingParts:
+    """the parts of a job not yet claimed, claimed (in flight) and completed
+
+    Attributes:
+        in_flight: set of part ids claimed but not completed
+        completed: set of part ids completed
+        open_ended: whether parts may yet be added (see add and close)
+    """
+
+    def __init__(self, part_ids, open_ended=False):
+        """begin with every part in part_ids unclaimed (in order)
+
+        :param open_ended: whether parts may be added later, until close is called
+        """
+        self._unclaimed = deque(part_ids)
+        self.in_flight = set()
+        self.completed = set()
+        self.open_ended = open_ended
+        self._changed = asyncio.Event()
+
+    def add(self, part_ids):
+        """add parts (e.g. of a target arriving) unclaimed after those already pending"""
+        self._unclaimed.extend(part_ids)
+        self._signal()
+
+    def close(self):
+        """stop adding parts so that the parts pending are all that remain to be done"""
+        self.open_ended = False
+        self._signal()
+
+    def claim(self, accept=None):
+        """return the next unclaimed part id marking it in flight, or None if there is none
+
+        :param accept: callable(partId) returning whether the next part may be claimed
+            (e.g. to batch only parts of one target), None to accept any
+        """
+        if len(self._unclaimed) == 0:
+            return None
+        if accept is not None and not accept(self._unclaimed[0]):
+            return None
+        partId = self._unclaimed.popleft()
+        self.in_flight.add(partId)
+        return partId
+
+    def release(self, partId, last=False):
+        """return a part claimed by a worker that failed so another may claim it next
+
+        :param last: whether the part is claimed after those pending instead, e.g. so
+            that the worker failing it goes on with the others
+        """
+        if partId in self.in_flight:
+            self.in_flight.discard(partId)
+            if last:
+                self._unclaimed.append(partId)
+            else:
+                self._unclaimed.appendleft(partId)
+            self._signal()
+
+    def complete(self, partId):
+        """mark a part as completed, returning whether it had not been already"""
+        self.in_flight.discard(partId)
+        if partId in self.completed:
+            return False
+        self.completed.add(partId)
+        self._signal()
+        return True
+
+    @property
+    def unclaimed_count(self):
+        return len(self._unclaimed)
+
+    def idle(self):
+        """whether every part added so far has been completed"""
+        return len(self._unclaimed) == 0 and len(self.in_flight) == 0
+
+    def all_done(self):
+        """whether every part has been completed and no more are to be added"""
+        return not self.open_ended and self.idle()
+
+    def _signal(self):
+        self._changed.set()
+
+    async def wait_for_change(self, timeout=None):
+        """wait until a part is added, released or completed (or timeout seconds pass)"""
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,161 @@
+"""the commands run on a provider to compress parts in the background of the transfers.
+
+a script runs its commands one after another, so a provider compressing a part in the
+foreground (xz.sh run directly) sits idle while the next part is uploaded and the last
+downloaded, as does the uplink while xz runs. with a pipeline depth above 1 a worker
+instead launches xz.sh on each part in the background, chained so that the provider
+compresses one part at a time, and collects the result in a later script once done:
+
+    script k:   upload part k, launch xz.sh on part k after part k-1 is done
+                wait for part k-1 to be done, download part k-1, remove its files
+
+so that part k uploads while part k-1 compresses, and part k-1 downloads while part k
+compresses. the background run writes what xz.sh prints to part_<k>.out and touches
+part_<k>.done once finished (whether or not xz.sh succeeded), and the wait prints the
+.out so that the result is parsed as from a foreground run.
+
+the chain runs on a marker of its own: a finished run also touches part_<k>.next, which
+the run of part k+1 waits on and removes as it begins. the files removed once part k is
+collected (.done included) are thus not what part k+1 waits on, however soon part k is
+downloaded and removed. a worker launches a part after no other (after=None) once its
+pipeline has drained, as the .next of the part launched last is then left unconsumed.
+
+the commands are run with /bin/sh of the (unchanged) image. parse_command recovers what
+a command does (e.g. for the simulator).
+
+
+Typical usage example:
+
+script.upload_bytes(data, PurePosixPath("/golem/workdir/part_1"))
+script.run(*launch_command("part_1", xz_arguments(len(data)), after="part_0"))
+future_result = script.run(*wait_command("part_0"))
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import re
+import shlex
+from pathlib import PurePosixPath
+
+DEFAULT_PIPELINE_DEPTH = 1
+PATH_TO_REMOTE_WORKDIR = PurePosixPath("/golem/workdir")
+PATH_TO_REMOTE_OUTPUT = PurePosixPath("/golem/output")
+# seconds between checks for a background run having finished
+POLL_SECONDS = 1
+
+_LAUNCH = re.compile(
+    r"^rm -f \S+; \( (?:while \[ ! -e (?P<after>\S+) \]; do sleep \d+; done;"
+    r" rm -f \S+; )?/root/xz\.sh (?P<name>\S+)(?P<arguments>(?: \S+)*?)"
+    r" > \S+\.out 2>&1;"
+)
+_WAIT = re.compile(
+    r"^while \[ ! -e (?P<done>\S+) \]; do sleep \d+; done; cat (?P<out>\S+)$"
+)
+
+
+def _stem(name):
+    return name[: -len(".xz")] if name.lower().endswith(".xz") else name
+
+
+def _path_to_done(stem):
+    return PATH_TO_REMOTE_OUTPUT / f"{stem}.done"
+
+
+def _path_to_out(stem):
+    return PATH_TO_REMOTE_OUTPUT / f"{stem}.out"
+
+
+def path_to_next(stem):
+    """return the path of the marker the run of stem leaves for the part launched after
+    it (not removed with the files of stem, see cleanup_command)"""
+    return PATH_TO_REMOTE_OUTPUT / f"{stem}.next"
+
+
+def launch_command(name, arguments, after=None):
+    """return the command running xz.sh on the uploaded name in the background
+
+    Args:
+        name: the file name (in the remote workdir) of the part uploaded
+        arguments: the arguments to xz
+        after: the name of the part launched before, whose marker (see path_to_next)
+            is waited on and consumed, or None to run at once
+
+    a marker left by an earlier run of name is removed before the run is launched.
+    """
+    stem = _stem(name)
+    path_to_previous = path_to_next(_stem(after)) if after is not None else None
+    wait_on_previous = (
+        f"while [ ! -e {path_to_previous} ]; do sleep {POLL_SECONDS}; done;"
+        f" rm -f {path_to_previous}; "
+        if after is not None
+        else ""
+    )
+    line = (
+        f"rm -f {path_to_next(stem)}; ( {wait_on_previous}/root/xz.sh {shlex.quote(name)}"
+        f"{''.join(' ' + shlex.quote(argument) for argument in arguments)}"
+        f" > {_path_to_out(stem)} 2>&1; touch {_path_to_done(stem)} {path_to_next(stem)} )"
+        f" > /dev/null 2>&1 < /dev/null &"
+    )
+    return "/bin/sh", "-c", line
+
+
+def wait_command(name):
+    """return the command waiting on the background run of name printing its output"""
+    stem = _stem(name)
+    return (
+        "/bin/sh",
+        "-c",
+        f"while [ ! -e {_path_to_done(stem)} ]; do sleep {POLL_SECONDS}; done;"
+        f" cat {_path_to_out(stem)}",
+    )
+
+
+def cleanup_command(name):
+    """return the command removing the files of name on the provider once collected
+
+    the marker of name is left for the part launched after it (see launch_command).
+    """
+    stem = _stem(name)
+    return (
+        "/bin/rm",
+        "-f",
+        str(PATH_TO_REMOTE_WORKDIR / name),
+        str(PATH_TO_REMOTE_OUTPUT / f"{stem}.xz"),
+        str(PATH_TO_REMOTE_OUTPUT / f"{stem}.tim"),
+        str(_path_to_out(stem)),
+        str(_path_to_done(stem)),
+    )
+
+
+def parse_command(cmd, args):
+    """return what a command run on the provider does as a tuple, one of
+
+    ("xz", name, arguments)             a foreground run of xz.sh
+    ("launch", name, arguments, after)  a background run of xz.sh after the run of the
+                                        stem after (None if run at once)
+    ("wait", stem)                      a wait on the background run of the stem
+    ("cleanup", name)                   the removal of the files of name
+    None                                anything else
+
+    the stem of a name is the name without its .xz suffix (as xz.sh names its output).
+    """
+    if cmd == "/root/xz.sh":
+        return ("xz", args[0], list(args[1:]))
+    if cmd == "/bin/rm":
+        return ("cleanup", PurePosixPath(args[1]).name)
+    if cmd != "/bin/sh" or len(args) != 2:
+        return None
+    match = _LAUNCH.match(args[1])
+    if match is not None:
+        after = match.group("after")
+        return (
+            "launch",
+            match.group("name"),
+            shlex.split(match.group("arguments")),
+            PurePosixPath(after).name[: -len(".next")] if after is not None else None,
+        )
+    match = _WAIT.match(args[1])
+    if match is not None:
+        return ("wait", PurePosixPath(match.group("done")).name[: -len(".done")])
+    return None
@@ -0,0 +1,70 @@
+"""compress ranges of the target in a pool of processes before they are uploaded.
+
+lzma compression of a whole part takes seconds. done inside a worker coroutine it would
+stall the event loop and with it every other upload, download and heartbeat, so the
+compression is submitted to a ProcessPoolExecutor instead. the child process reads the
+range from the file itself so that the part need not be pickled across, only the
+(smaller) compressed result is sent back.
+
+
+Typical usage example:
+
+pool = create_precompress_pool(4)
+compressed = await loop.run_in_executor(
+    pool, precompress_range, "/target", 0, 2**26, 1
+)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from lzma import LZMACompressor
+
+READ_CHUNK_SIZE = 2**20
+
+
+def precompress_range(path_to_file, start, end, preset):
+    """(runs in a pool process) compress the range [start, end) of a file into an xz stream
+
+    Args:
+        path_to_file: path string to the file to read from
+        start: offset of the first byte of the range
+        end: offset one past the last byte of the range
+        preset: lzma preset (0-9) to compress with
+
+    Returns:
+        bytes of the complete (flushed) xz stream
+    """
+    lzmaCompressor = LZMACompressor(preset=preset)
+    compressed_chunks = []
+    buffer = memoryview(bytearray(READ_CHUNK_SIZE))
+    with open(path_to_file, "rb", buffering=0) as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            count = f.readinto(buffer[: min(READ_CHUNK_SIZE, remaining)])
+            if not count:
+                break
+            compressed_chunks.append(lzmaCompressor.compress(buffer[:count]))
+            remaining -= count
+    compressed_chunks.append(lzmaCompressor.flush())
+    return b"".join(compressed_chunks)
+
+
+def create_precompress_pool(max_workers=None):
+    """return a ProcessPoolExecutor to run precompress_range on
+
+    Args:
+        max_workers: number of processes, None or less than 1 to use every local core
+
+    processes are spawned rather than forked since the pool is used from within a
+    running event loop whose threads should not be duplicated into the children.
+    """
+    if max_workers is None or max_workers < 1:
+        max_workers = os.cpu_count() or 1
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
@@ -0,0 +1,178 @@
+"""remember how providers performed across runs and score their offers by it.
+
+the walltime xz.sh reports for each part a provider compresses is recorded in the
+provider_stats table of the history database of the main working directory along with
+the length of the part (as read from the target), so that the throughput (MiB/s of
+input) of a provider is known on its next offer, in this or any later run. the parts a
+provider failed (a rejected result or an error) or timed out on are counted alongside.
+
+ProviderScoredMS wraps the market strategy (e.g. LeastExpensiveLinearPayuMS) so that,
+of the offers the wrapped strategy accepts, those expected to compress the most MiB per
+GLM are preferred over those that are merely cheapest: the cost of a part on an offer is
+estimated from the provider's throughput on record and inflated by its share of failed
+parts (which are paid for and retried). providers without a record are assumed to be as
+fast as the median provider on record, so that they are still tried in order of price.
+
+
+Typical usage example:
+
+providerStats = ProviderStats(Path("./workdir/history.db"))
+strategy = ProviderScoredMS(LeastExpensiveLinearPayuMS(), providerStats, 2**26)
+...
+providerStats.record_part(provider_id, provider_name, length, walltime.total_seconds())
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import sqlite3
+import statistics
+import time
+
+from yapapi.props import com
+from yapapi.strategy import SCORE_TRUSTED, WrappingMarketStrategy
+
+from partsize import DEFAULT_PART_SIZE
+from debug.mylogging import g_logger
+
+# MiB/s assumed of every provider while none are on record
+DEFAULT_THROUGHPUT = 1.0
+# GLM per second a part is expected to cost at the least, so that offers priced at (or
+# near) nothing are still told apart by the throughput of their provider
+NOMINAL_PRICE_PER_SECOND = 1e-9
+
+
+class ProviderStats:
+    """record and lookup the throughput, failures and timeouts of providers
+
+    Attributes:
+        con: connection to the history database (autocommit)
+    """
+
+    def __init__(self, path_to_history_db):
+        """connect to (creating if needed) the provider_stats table of the history database"""
+        self.con = sqlite3.connect(str(path_to_history_db), isolation_level=None)
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS provider_stats(
+                provider_id TEXT PRIMARY KEY NOT NULL,
+                name TEXT,
+                parts INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                timeouts INTEGER NOT NULL DEFAULT 0,
+                last_seen REAL
+            )"""
+        )
+
+    def _ensure_row(self, provider_id, name):
+        self.con.execute(
+            "INSERT OR IGNORE INTO provider_stats(provider_id) VALUES (?)",
+            (provider_id,),
+        )
+        self.con.execute(
+            "UPDATE provider_stats SET name = ?, last_seen = ? WHERE provider_id = ?",
+            (name, time.time(), provider_id),
+        )
+
+    def record_part(self, provider_id, name, length, seconds):
+        """record that the provider compressed length bytes (of input) in seconds"""
+        self._ensure_row(provider_id, name)
+        self.con.execute(
+            "UPDATE provider_stats SET parts = parts + 1, bytes = bytes + ?,"
+            " seconds = seconds + ? WHERE provider_id = ?",
+            (length, seconds, provider_id),
+        )
+
+    def record_failure(self, provider_id, name, timed_out=False):
+        """record that the provider failed a part, or timed out on it"""
+        self._ensure_row(provider_id, name)
+        column = "timeouts" if timed_out else "failures"
+        self.con.execute(
+            f"UPDATE provider_stats SET {column} = {column} + 1 WHERE provider_id = ?",
+            (provider_id,),
+        )
+
+    def lookup(self, provider_id):
+        """return (parts, bytes, seconds, failures, timeouts) of the provider or None"""
+        return self.con.execute(
+            "SELECT parts, bytes, seconds, failures, timeouts FROM provider_stats"
+            " WHERE provider_id = ?",
+            (provider_id,),
+        ).fetchone()
+
+    def throughput(self, provider_id):
+        """return the MiB/s of input the provider compressed at or None if unknown"""
+        row = self.lookup(provider_id)
+        if row is None or row[0] == 0 or row[2] <= 0:
+            return None
+        return row[1] / 2**20 / row[2]
+
+    def median_throughput(self):
+        """return the median MiB/s of the providers on record or None if there are none"""
+        throughputs = [
+            row[0] / 2**20 / row[1]
+            for row in self.con.execute(
+                "SELECT bytes, seconds FROM provider_stats WHERE parts > 0 AND seconds > 0"
+            )
+        ]
+        if len(throughputs) == 0:
+            return None
+        return statistics.median(throughputs)
+
+    def success_rate(self, provider_id):
+        """return the share of attempts at parts that the provider completed
+
+        a provider without a record (or failures) is given the benefit of the doubt (1.0).
+        """
+        row = self.lookup(provider_id)
+        if row is None:
+            return 1.0
+        parts, _, _, failures, timeouts = row
+        return (parts + 1) / (parts + failures + timeouts + 1)
+
+    def count(self):
+        """return the count of providers with a throughput on record"""
+        return self.con.execute(
+            "SELECT COUNT(*) FROM provider_stats WHERE parts > 0"
+        ).fetchone()[0]
+
+    def close(self):
+        self.con.close()
+
+
+class ProviderScoredMS(WrappingMarketStrategy):
+    """score the offers the wrapped strategy accepts by expected MiB compressed per GLM
+
+    Attributes:
+        providerStats: the ProviderStats the throughput of providers is looked up in
+        part_length: the length of the parts, the fixed price is spread over one part
+    """
+
+    def __init__(self, base_strategy, providerStats, part_length=DEFAULT_PART_SIZE):
+        super().__init__(base_strategy)
+        self.providerStats = providerStats
+        self.part_length = part_length
+
+    def expected_cost(self, offer):
+        """return the GLM a part is expected to cost on the offer, retries included"""
+        throughput = self.providerStats.throughput(offer.issuer)
+        if throughput is None:
+            throughput = self.providerStats.median_throughput() or DEFAULT_THROUGHPUT
+        seconds = self.part_length / 2**20 / throughput
+        linear = com.ComLinear.from_properties(offer.props)
+        # xz runs on a single thread, so cpu seconds are about the duration
+        cost = linear.calculate_cost([seconds] * len(linear.usage_vector))
+        cost = max(cost, seconds * NOMINAL_PRICE_PER_SECOND)
+        return cost / self.providerStats.success_rate(offer.issuer)
+
+    async def score_offer(self, offer):
+        """score the offer higher the fewer GLM per MiB are expected, unless rejected"""
+        score = await self.base_strategy.score_offer(offer)
+        if score < 0:
+            return score
+        glm_per_mib = self.expected_cost(offer) / (self.part_length / 2**20)
+        g_logger.debug(f"offer from {offer.issuer} expected at {glm_per_mib} GLM/MiB")
+        # as LeastExpensiveLinearPayuMS, always above 0 and below SCORE_TRUSTED
+        return SCORE_TRUSTED * 1.0 / (glm_per_mib + 1.01)
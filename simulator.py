@@ -0,0 +1,889 @@
+#!/usr/bin/env python3
+# simulator.py
+"""simulate a network of golem providers to benchmark the scheduling of a job offline.
+
+SimulatedGolem stands in for yapapi's Golem engine: execute_tasks runs the real worker
+of GolemBackend (uploads, the xz.sh run, downloads, digest checks, rejections and
+retries) against simulated providers, and the results are recorded, verified and
+concatenated by the real code (main, CTX) against real files. nothing is spent and no
+yagna daemon is needed.
+
+each provider has its own upload and download bandwidth, cpu speed (bytes of input
+compressed per second), latency of each script (round trips, which batching parts
+amortizes), negotiation delay before it takes its first task (and after each failure),
+a chance of failing midway through a task and a chance of stalling until the task times
+out. the part is really compressed (so the output verifies) but the time
+each step takes is simulated, and elapses scaled by --time-scale so that a job of hours
+runs in minutes.
+
+at the end the makespan (simulated), bytes moved, and counts of tasks, retries, timeouts
+and failures are reported, optionally as json, so that changes to the scheduling (e.g.
+the task timeout, max workers or retry logic) may be compared run against run.
+
+
+Typical usage example:
+
+$ python3 simulator.py --providers 16 --upload-bandwidth 2M --failure-rate 0.1 myfile.raw
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import argparse
+import asyncio
+import hashlib
+import json
+import lzma
+import math
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path, PurePosixPath
+from types import SimpleNamespace
+
+from yapapi.executor.task import TaskStatus
+from yapapi.rest.activity import BatchTimeoutError
+
+from gompress import main
+from golembackend import GolemBackend
+from ctx import CTX
+from partsize import (
+    part_size_argument,
+    parse_size,
+    batch_size_argument,
+    DEFAULT_TARGET_TASK_COUNT,
+    AUTO,
+)
+from xzpreset import preset_level, xz_arguments
+from pipeline import parse_command, path_to_next, POLL_SECONDS, DEFAULT_PIPELINE_DEPTH
+from speculation import (
+    Speculation,
+    SPECULATION_POLL_SECONDS,
+    DEFAULT_SPECULATION_FACTOR,
+    DEFAULT_SPECULATION_MIN_SECONDS,
+    DEFAULT_SPECULATION_MAX_COPIES,
+)
+from debug.mylogging import g_logger
+
+
+class SimulatedFailure(Exception):
+    """a provider failed (e.g. terminated the activity) midway through a task"""
+
+
+class SimulatedProvider:
+    """a provider node as seen by the requestor
+
+    Attributes:
+        name: the provider name shown by the worker
+        upload_bandwidth: bytes per second the provider receives at
+        download_bandwidth: bytes per second the provider sends at
+        cpu_speed: bytes of input per second the provider's xz compresses
+        negotiation_delay: seconds until an agreement is made with the provider
+        failure_rate: chance [0, 1] that the provider fails midway through a task
+        stall_rate: chance [0, 1] that the provider stalls until the task times out
+        script_latency: seconds of round trips (e.g. to start a batch and poll its
+            results) each script takes besides its commands
+        model: the cpu model reported
+        parts_computed: count of the parts whose result was accepted
+    """
+
+    def __init__(
+        self,
+        name,
+        upload_bandwidth,
+        download_bandwidth,
+        cpu_speed,
+        negotiation_delay=0.0,
+        failure_rate=0.0,
+        stall_rate=0.0,
+        script_latency=0.0,
+        model="Simulated CPU",
+    ):
+        self.name = name
+        self.upload_bandwidth = upload_bandwidth
+        self.download_bandwidth = download_bandwidth
+        self.cpu_speed = cpu_speed
+        self.negotiation_delay = negotiation_delay
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.script_latency = script_latency
+        self.model = model
+        self.parts_computed = 0
+
+
+def create_providers(
+    count,
+    upload_bandwidth,
+    download_bandwidth,
+    cpu_speed,
+    negotiation_delay,
+    failure_rate,
+    stall_rate,
+    spread=1.0,
+    rng=random,
+    script_latency=0.0,
+):
+    """return count providers whose rates vary by a factor up to spread either way"""
+
+    def vary(value):
+        return value * spread ** rng.uniform(-1.0, 1.0)
+
+    return [
+        SimulatedProvider(
+            name=f"sim-provider-{index}",
+            upload_bandwidth=vary(upload_bandwidth),
+            download_bandwidth=vary(download_bandwidth),
+            cpu_speed=vary(cpu_speed),
+            negotiation_delay=rng.uniform(0.0, negotiation_delay * 2),
+            failure_rate=failure_rate,
+            stall_rate=stall_rate,
+            script_latency=vary(script_latency),
+        )
+        for index in range(count)
+    ]
+
+
+class SimulationStats:
+    """what happened over a simulated run
+
+    Attributes:
+        makespan: simulated seconds from the first negotiation to the last result
+        bytes_uploaded, bytes_downloaded: bytes moved (including those of failed tasks)
+        tasks_started: count of the tasks given to a provider (including retries)
+        tasks_accepted: count of the tasks whose result was accepted
+        retries: count of the tasks rejected and queued again
+        discarded: count of the tasks rejected not to be retried (e.g. speculative
+            attempts at parts won by another)
+        timeouts: count of the tasks that timed out
+        failures: count of the tasks on which a provider failed
+        job_timed_out: whether the job timeout expired before all tasks were accepted
+    """
+
+    def __init__(self):
+        self.makespan = 0.0
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+        self.tasks_started = 0
+        self.tasks_accepted = 0
+        self.retries = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.job_timed_out = False
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class SimulatedClock:
+    """simulated seconds elapsing time_scale times as fast as real ones"""
+
+    def __init__(self, time_scale):
+        self.time_scale = time_scale
+        self._start = None
+
+    def start(self):
+        self._start = asyncio.get_running_loop().time()
+
+    def now(self):
+        """simulated seconds since start()"""
+        return (asyncio.get_running_loop().time() - self._start) / self.time_scale
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds * self.time_scale)
+
+
+class _SimulatedScript:
+    """records the commands of a worker's script as yapapi's Script would"""
+
+    def __init__(self, timeout=None, wait_for_results=True):
+        self.timeout = timeout
+        self.wait_for_results = wait_for_results
+        self.commands = []
+
+    def _add(self, *command):
+        future = asyncio.get_running_loop().create_future()
+        self.commands.append((*command, future))
+        return future
+
+    def upload_bytes(self, data, dst_path):
+        return self._add("upload_bytes", data, PurePosixPath(dst_path))
+
+    def upload_file(self, src_path, dst_path):
+        return self._add("upload_file", src_path, PurePosixPath(dst_path))
+
+    def run(self, cmd, *args):
+        return self._add("run", cmd, args)
+
+    def download_file(self, src_path, dst_path):
+        return self._add("download_file", PurePosixPath(src_path), Path(dst_path))
+
+
+class _SimulatedWorkContext:
+    """the WorkContext given to the worker for one agreement with a provider"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.provider_id = provider.name
+        self.provider_name = provider.name
+        # files on the provider by remote path
+        self.files = {}
+        # (simulated) time each part launched in the background is done, and what
+        # xz.sh printed, by the stem of its name
+        self.done_at = {}
+        self.printed = {}
+        # the (stem, simulated time) of the part to consume each marker it was launched
+        # after, by the path of the marker
+        self.consumed_at = {}
+
+    def new_script(self, timeout=None, wait_for_results=True):
+        return _SimulatedScript(timeout, wait_for_results)
+
+    async def get_raw_state(self):
+        return "Ready"
+
+    async def get_usage(self):
+        return SimpleNamespace(current_usage=None, timestamp=None)
+
+    async def get_cost(self):
+        return 0.0
+
+
+def _compress(data, arguments):
+    """compress data as xz.sh would given its arguments"""
+    preset = [argument for argument in arguments if argument.strip("-e").isdigit()][-1]
+    level = preset_level(preset)
+    if preset.endswith("e"):
+        level |= lzma.PRESET_EXTREME
+    return lzma.compress(
+        data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=level
+    )
+
+
+def _compress_range(path_to_file, start, end, arguments, path_to_output):
+    """(runs in a pool process) compress a range of a file to path_to_output
+
+    Returns:
+        the sha256 hex digest of the range compressed
+    """
+    with open(path_to_file, "rb") as src:
+        src.seek(start)
+        data = src.read(end - start)
+    Path(path_to_output).write_bytes(_compress(data, arguments))
+    return hashlib.sha256(data).hexdigest()
+
+
+def _run_xz_sh(data, name, arguments, outputs):
+    """(runs in a thread) return (output, length of input) as xz.sh would output
+
+    the output prepared for the input (see SimulatedGolem.prepare) is read if any.
+    """
+    if name.lower().endswith(".xz"):
+        data = lzma.decompress(data)
+    path_to_output = outputs.get(hashlib.sha256(data).hexdigest())
+    if path_to_output is not None:
+        return Path(path_to_output).read_bytes(), len(data)
+    return _compress(data, arguments), len(data)
+
+
+def _polled(started_at, appears_at):
+    """return when a loop on the provider polling from started_at (every POLL_SECONDS)
+    sees a file appearing at appears_at"""
+    if appears_at <= started_at or appears_at == float("inf"):
+        return max(started_at, appears_at)
+    return (
+        started_at + math.ceil((appears_at - started_at) / POLL_SECONDS) * POLL_SECONDS
+    )
+
+
+def _format_walltime(seconds):
+    """format seconds as xz.sh's walltime, e.g. 1m2.50s"""
+    return f"{int(seconds // 60)}m{seconds % 60:.3f}s"
+
+
+class SimulatedGolem:
+    """stand-in for yapapi.Golem executing tasks on simulated providers
+
+    Attributes:
+        providers: list of SimulatedProvider
+        clock: SimulatedClock
+        stats: SimulationStats of the run
+        subnet_tag, payment_driver, payment_network: shown by print_env_info
+    """
+
+    def __init__(self, providers, clock, seed=None):
+        self.providers = providers
+        self.clock = clock
+        self.stats = SimulationStats()
+        self.subnet_tag = "simulated"
+        self.payment_driver = "none"
+        self.payment_network = "simulated"
+        self._rng = random.Random(seed)
+        # paths to the outputs of xz prepared ahead by the digest of the input
+        self._outputs = {}
+
+    def prepare(self, ctx, path_to_directory, max_workers=None):
+        """compress the pending parts of ctx ahead into path_to_directory
+
+        compressing for real takes real time, which would otherwise be counted as
+        simulated time (stretched by 1/time_scale) while the providers "run".
+        """
+        Path(path_to_directory).mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = {}
+            for partId in ctx.list_pending_ids():
+                read_range = ctx.lookup_partition_range(partId)
+                path_to_output = Path(path_to_directory) / f"part_{partId}.xz"
+                futures[path_to_output] = pool.submit(
+                    _compress_range,
+                    *ctx.locate_part(partId),
+                    xz_arguments(read_range[1] - read_range[0]),
+                    str(path_to_output),
+                )
+            for path_to_output, future in futures.items():
+                self._outputs[future.result()] = path_to_output
+
+    async def __aenter__(self):
+        self.clock.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def _execute_script(self, workContext, script):
+        """simulate the commands of a script on the provider, resolving their futures
+
+        Raises:
+            SimulatedFailure: the provider failed midway
+            BatchTimeoutError: the script took longer than its timeout
+        """
+        provider = workContext.provider
+        loop = asyncio.get_running_loop()
+        started_at = self.clock.now()
+        elapsed = provider.script_latency
+        downloads = []
+        for command in script.commands:
+            kind, future = command[0], command[-1]
+            if kind == "upload_bytes":
+                data = bytes(command[1])
+                workContext.files[command[2]] = data
+                elapsed += len(data) / provider.upload_bandwidth
+                self.stats.bytes_uploaded += len(data)
+                future.set_result(None)
+            elif kind == "upload_file":
+                data = Path(command[1]).read_bytes()
+                workContext.files[command[2]] = data
+                elapsed += len(data) / provider.upload_bandwidth
+                self.stats.bytes_uploaded += len(data)
+                future.set_result(None)
+            elif kind == "run":
+                parsed = parse_command(command[1], command[2])
+                if parsed is None:
+                    future.set_result(SimpleNamespace(stdout=""))
+                    continue
+                if parsed[0] == "cleanup":
+                    for path in command[2][1:]:
+                        workContext.files.pop(PurePosixPath(path), None)
+                        # a marker removed before the part waiting on it saw it leaves
+                        # the part waiting forever
+                        consumer = workContext.consumed_at.pop(
+                            PurePosixPath(path), None
+                        )
+                        if consumer is not None and consumer[1] > started_at + elapsed:
+                            workContext.done_at[consumer[0]] = float("inf")
+                    future.set_result(SimpleNamespace(stdout=""))
+                    continue
+                if parsed[0] == "wait":
+                    # the script waits on the part compressing in the background
+                    elapsed = max(
+                        elapsed,
+                        _polled(started_at + elapsed, workContext.done_at[parsed[1]])
+                        - started_at,
+                    )
+                    future.set_result(
+                        SimpleNamespace(stdout=workContext.printed[parsed[1]])
+                    )
+                    continue
+                name, arguments = parsed[1], parsed[2]
+                path_to_input = PurePosixPath("/golem/workdir") / name
+                output, raw_length = await loop.run_in_executor(
+                    None,
+                    _run_xz_sh,
+                    workContext.files.pop(path_to_input),
+                    name,
+                    arguments,
+                    self._outputs,
+                )
+                compress_time = raw_length / provider.cpu_speed
+                stem = name[: -len(".xz")] if name.lower().endswith(".xz") else name
+                path_to_output = PurePosixPath("/golem/output") / f"{stem}.xz"
+                workContext.files[path_to_output] = output
+                digest = hashlib.sha256(output).hexdigest()
+                printed = (
+                    f"OK---{len(output)}---{_format_walltime(compress_time)}"
+                    f"---{digest}---{provider.model}\n"
+                )
+                if parsed[0] == "launch":
+                    # compressed once the part it runs after has left its marker (which
+                    # it consumes), while the script moves on to its next commands. a
+                    # marker missing is never left, so the part never runs and its
+                    # wait times out, as on a provider
+                    begins_at = started_at + elapsed
+                    workContext.files.pop(path_to_next(stem), None)
+                    after = parsed[3]
+                    if after is not None:
+                        path_to_marker = path_to_next(after)
+                        if workContext.files.pop(path_to_marker, None) is None:
+                            begins_at = float("inf")
+                        else:
+                            begins_at = _polled(begins_at, workContext.done_at[after])
+                            workContext.consumed_at[path_to_marker] = (stem, begins_at)
+                    workContext.done_at[stem] = begins_at + compress_time
+                    workContext.printed[stem] = printed
+                    workContext.files[path_to_next(stem)] = b""
+                    future.set_result(SimpleNamespace(stdout=""))
+                    continue
+                elapsed += compress_time
+                future.set_result(SimpleNamespace(stdout=printed))
+            elif kind == "download_file":
+                data = workContext.files.pop(command[1])
+                elapsed += len(data) / provider.download_bandwidth
+                self.stats.bytes_downloaded += len(data)
+                downloads.append((command[2], data, future))
+
+        timeout = script.timeout.total_seconds() if script.timeout else None
+        if self._rng.random() < provider.stall_rate:
+            elapsed = float("inf")
+        if timeout is not None and elapsed > timeout:
+            await self.clock.sleep(timeout)
+            self.stats.timeouts += 1
+            raise BatchTimeoutError(f"simulated batch on {provider.name} timed out")
+        if self._rng.random() < provider.failure_rate:
+            await self.clock.sleep(elapsed * self._rng.random())
+            self.stats.failures += 1
+            raise SimulatedFailure(f"{provider.name} failed midway through the task")
+        await self.clock.sleep(elapsed)
+        for path_to_local_file, data, future in downloads:
+            Path(path_to_local_file).write_bytes(data)
+            future.set_result(None)
+
+    async def execute_tasks(
+        self, worker, data, payload=None, max_workers=None, timeout=None
+    ):
+        """run worker on the providers with the tasks of data yielding accepted tasks
+
+        as yapapi does, one task at a time is taken from data ahead of the providers,
+        a rejected task (retry) is queued before the rest and a provider whose worker
+        raised is negotiated with again.
+        """
+        ready = deque()
+        changed = asyncio.Condition()
+        accepted = asyncio.Queue()
+        # the provider each task was last given to
+        owners = {}
+        state = SimpleNamespace(exhausted=False, in_flight=0, closing=False)
+        max_workers = max_workers or len(self.providers)
+        agreements = asyncio.Semaphore(max_workers)
+
+        async def notify():
+            async with changed:
+                changed.notify_all()
+
+        # the stopped tasks are given back (see Task._stop) as to yapapi's SmartQueue
+        async def reschedule(task):
+            """a task rejected to be retried"""
+            if state.closing:
+                # tasks cut short by the end of the job are not retried
+                return
+            state.in_flight -= 1
+            self.stats.retries += 1
+            ready.appendleft(task)
+            await notify()
+
+        async def mark_done(task):
+            """a task accepted or rejected not to be retried"""
+            if state.closing:
+                return
+            state.in_flight -= 1
+            if task._status == TaskStatus.ACCEPTED:
+                self.stats.tasks_accepted += 1
+                owners[id(task)].parts_computed += len(task.result)
+                accepted.put_nowait(task)
+            else:
+                self.stats.discarded += 1
+            await notify()
+
+        queue = SimpleNamespace(reschedule=reschedule, mark_done=mark_done)
+
+        async def feed():
+            """take one task ahead from data as yapapi's SmartQueue does"""
+            iterator = data.__aiter__() if hasattr(data, "__aiter__") else None
+            items = iter(data) if iterator is None else None
+            while True:
+                async with changed:
+                    await changed.wait_for(lambda: len(ready) == 0)
+                try:
+                    if iterator is not None:
+                        task = await iterator.__anext__()
+                    else:
+                        task = next(items)
+                except (StopAsyncIteration, StopIteration):
+                    state.exhausted = True
+                    await notify()
+                    return
+                ready.append(task)
+                await notify()
+
+        def finished():
+            return state.exhausted and len(ready) == 0 and state.in_flight == 0
+
+        async def take():
+            async with changed:
+                await changed.wait_for(lambda: len(ready) > 0 or finished())
+                if len(ready) == 0:
+                    return None
+                task = ready.popleft()
+                task._handle = (task, queue)
+                state.in_flight += 1
+                self.stats.tasks_started += 1
+            asyncio.get_running_loop().create_task(notify())
+            return task
+
+        async def run_provider(provider):
+            """negotiate with the provider and run worker on it until the work is done"""
+            while not finished():
+                await self.clock.sleep(provider.negotiation_delay)
+                async with agreements:
+                    if finished():
+                        return
+                    workContext = _SimulatedWorkContext(provider)
+                    taken = []
+
+                    async def task_generator():
+                        while True:
+                            task = await take()
+                            if task is None:
+                                return
+                            owners[id(task)] = provider
+                            task._start(lambda event_class, **kwargs: None)
+                            taken.append(task)
+                            yield task
+
+                    batch_generator = worker(workContext, task_generator())
+                    try:
+                        script = await batch_generator.__anext__()
+                        while True:
+                            if not script.wait_for_results:
+                                # the worker awaits (or cancels) the batch itself
+                                future_results = asyncio.get_running_loop().create_task(
+                                    self._execute_script(workContext, script)
+                                )
+                                script = await batch_generator.asend(future_results)
+                                continue
+                            try:
+                                await self._execute_script(workContext, script)
+                            except Exception:
+                                script = await batch_generator.athrow(*sys.exc_info())
+                                continue
+                            future_results = asyncio.get_running_loop().create_future()
+                            future_results.set_result([])
+                            script = await batch_generator.asend(future_results)
+                    except StopAsyncIteration:
+                        pass
+                    except Exception as e:
+                        g_logger.debug(
+                            f"simulated worker on {provider.name} raised: {e}"
+                        )
+                    finally:
+                        await batch_generator.aclose()
+                        # as yapapi reschedules the task a worker left unfinished
+                        for task in taken:
+                            if task._status == TaskStatus.RUNNING:
+                                task.reject_result(retry=True)
+
+        loop = asyncio.get_running_loop()
+        feeder = loop.create_task(feed())
+        runners = [
+            loop.create_task(run_provider(provider)) for provider in self.providers
+        ]
+        deadline = timeout.total_seconds() if timeout is not None else None
+        try:
+            while not finished() or not accepted.empty():
+                try:
+                    task = await asyncio.wait_for(
+                        accepted.get(), 1 * self.clock.time_scale
+                    )
+                except asyncio.TimeoutError:
+                    if deadline is not None and self.clock.now() > deadline:
+                        self.stats.job_timed_out = True
+                        self.stats.makespan = self.clock.now()
+                        print("\033[1;31mthe simulated job timed out\033[0m")
+                        return
+                    continue
+                self.stats.makespan = self.clock.now()
+                yield task
+        finally:
+            state.closing = True
+            for runner in [feeder, *runners]:
+                runner.cancel()
+            await asyncio.gather(feeder, *runners, return_exceptions=True)
+
+
+class SimulatedGolemBackend(GolemBackend):
+    """GolemBackend whose engine is a SimulatedGolem (no payload is resolved)"""
+
+    def __init__(
+        self,
+        simulatedGolem,
+        task_timeout,
+        max_workers=None,
+        speculation=None,
+        batch_size=AUTO,
+        pipeline_depth=DEFAULT_PIPELINE_DEPTH,
+    ):
+        super().__init__(
+            subnet_tag="simulated",
+            min_cpu_threads=1,
+            payment_driver="none",
+            payment_network="simulated",
+            show_usage=False,
+            task_timeout=task_timeout,
+            max_workers=max_workers,
+            speculation=speculation,
+            batch_size=batch_size,
+            pipeline_depth=pipeline_depth,
+        )
+        self.simulatedGolem = simulatedGolem
+
+    def create_golem(self, strategy, event_consumer):
+        return self.simulatedGolem
+
+    async def create_payload(self):
+        return None
+
+
+def add_arguments_to_command_line_parser():
+    """build command line parser arguments and parse the arguments returning parser object"""
+    parser = argparse.ArgumentParser(
+        description="simulate compressing a file across golem providers to benchmark scheduling"
+    )
+    parser.add_argument("target", help="file to compress")
+    parser.add_argument(
+        "--providers",
+        type=int,
+        default=8,
+        help="number of providers; default: %(default)s",
+    )
+    parser.add_argument(
+        "--upload-bandwidth",
+        type=parse_size,
+        default="4M",
+        help="bytes per second a provider receives at; default: %(default)s",
+    )
+    parser.add_argument(
+        "--download-bandwidth",
+        type=parse_size,
+        default="8M",
+        help="bytes per second a provider sends at; default: %(default)s",
+    )
+    parser.add_argument(
+        "--cpu-speed",
+        type=parse_size,
+        default="2M",
+        help="bytes of input per second a provider compresses; default: %(default)s",
+    )
+    parser.add_argument(
+        "--spread",
+        type=float,
+        default=2.0,
+        help="factor either way the rates of each provider vary by; default: %(default)s",
+    )
+    parser.add_argument(
+        "--negotiation-delay",
+        type=float,
+        default=20.0,
+        help="mean seconds until an agreement with a provider; default: %(default)s",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.05,
+        help="chance a provider fails midway through a task; default: %(default)s",
+    )
+    parser.add_argument(
+        "--stall-rate",
+        type=float,
+        default=0.02,
+        help="chance a provider stalls until the task times out; default: %(default)s",
+    )
+    parser.add_argument(
+        "--script-latency",
+        type=float,
+        default=2.0,
+        help="mean seconds of round trips a script takes besides its transfers and"
+        " compression; default: %(default)s",
+    )
+    parser.add_argument(
+        "--task-timeout",
+        type=float,
+        default=6.0,
+        help="minutes after which a task is a failure and retried; default: %(default)s",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="most providers worked at once; default: one per part",
+    )
+    parser.add_argument(
+        "--speculate-after",
+        type=float,
+        default=DEFAULT_SPECULATION_FACTOR,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--speculate-min-seconds",
+        type=float,
+        default=DEFAULT_SPECULATION_MIN_SECONDS,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--speculate-copies",
+        type=int,
+        default=DEFAULT_SPECULATION_MAX_COPIES,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=batch_size_argument,
+        default=AUTO,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=DEFAULT_PIPELINE_DEPTH,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.01,
+        help="real seconds per simulated second; default: %(default)s",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="seed for reproducible runs"
+    )
+    parser.add_argument(
+        "--xfer-compression-level",
+        type=int,
+        default=-1,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--part-size",
+        type=part_size_argument,
+        default=None,
+        help="as for gompress; default: 64M",
+    )
+    parser.add_argument(
+        "--target-tasks",
+        type=int,
+        default=DEFAULT_TARGET_TASK_COUNT,
+        help="as for gompress; default: %(default)s",
+    )
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="working directory of the simulated job; default: a temporary directory removed"
+        " afterwards",
+    )
+    parser.add_argument("--json", default=None, help="path to write the statistics to")
+    return parser
+
+
+if __name__ == "__main__":
+    args = add_arguments_to_command_line_parser().parse_args()
+
+    rng = random.Random(args.seed)
+    providers = create_providers(
+        args.providers,
+        args.upload_bandwidth,
+        args.download_bandwidth,
+        args.cpu_speed,
+        args.negotiation_delay,
+        args.failure_rate,
+        args.stall_rate,
+        args.spread,
+        rng,
+        args.script_latency,
+    )
+    simulatedGolem = SimulatedGolem(
+        providers, SimulatedClock(args.time_scale), seed=rng.random()
+    )
+    # stragglers are judged in simulated time, and checked for as often as they would be
+    speculation = Speculation(
+        args.speculate_after,
+        args.speculate_min_seconds,
+        args.speculate_copies,
+        clock=simulatedGolem.clock.now,
+        poll_seconds=SPECULATION_POLL_SECONDS * args.time_scale,
+    )
+    backend = SimulatedGolemBackend(
+        simulatedGolem,
+        timedelta(minutes=args.task_timeout),
+        args.max_workers,
+        speculation,
+        args.batch_size,
+        args.pipeline_depth,
+    )
+
+    data_dir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp())
+    data_dir.mkdir(exist_ok=True)
+    ctx = CTX(
+        data_dir,
+        Path(args.target),
+        args.xfer_compression_level,
+        1,
+        None,
+        False,
+        False,
+        args.part_size,
+        args.target_tasks,
+    )
+    try:
+        print("Compressing the parts ahead of the simulation")
+        simulatedGolem.prepare(ctx, data_dir / "simulated")
+        asyncio.run(main([ctx], backend))
+        verified = ctx.verify()
+        if verified:
+            ctx.concatenate_and_finalize()
+    finally:
+        ctx.close()
+        if args.workdir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    stats = simulatedGolem.stats.as_dict()
+    stats["verified"] = verified
+    stats["part_count"] = ctx.part_count
+    stats["parts_by_provider"] = {
+        provider.name: provider.parts_computed for provider in providers
+    }
+    print(
+        f"simulated makespan: {timedelta(seconds=round(stats['makespan']))},"
+        f" uploaded: {stats['bytes_uploaded'] / 2**20:,.{2}f}MiB,"
+        f" downloaded: {stats['bytes_downloaded'] / 2**20:,.{2}f}MiB,"
+        f" tasks: {stats['tasks_started']} started / {stats['tasks_accepted']} accepted,"
+        f" retries: {stats['retries']} ({stats['timeouts']} timeouts,"
+        f" {stats['failures']} failures), discarded: {stats['discarded']},"
+        f" {'verified' if verified else 'not verified'}"
+    )
+    if args.json:
+        Path(args.json).write_text(json.dumps(stats, indent=2))
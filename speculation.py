@@ -0,0 +1,173 @@
+"""speculatively re-execute parts straggling on a slow provider on another provider.
+
+a single slow provider would otherwise hold a job until its task times out and the part
+is retried. once no parts are left to dispatch and a part has been running on a provider
+for longer than a factor of the median time parts have taken (and a minimum time), a
+copy of the part is dispatched to the next provider asking for work. whichever attempt
+downloads its result first wins the part: the other attempts are cancelled (their
+worker gives up the provider, which stops the batch running on it) or, if they finished
+meanwhile, their download is discarded.
+
+each copy downloads to a path of its own (see path_to_download) so that attempts do
+not overwrite each other.
+
+
+Typical usage example:
+
+speculation = Speculation(factor=2.0, min_seconds=60, max_copies=1)
+attempt = speculation.started(partId)
+...
+if speculation.claim(partId, attempt):
+    task.accept_result(result)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import asyncio
+import statistics
+import time
+
+DEFAULT_SPECULATION_FACTOR = 2.0
+DEFAULT_SPECULATION_MIN_SECONDS = 60.0
+DEFAULT_SPECULATION_MAX_COPIES = 1
+# parts that must have completed before their median is trusted
+SPECULATION_MIN_SAMPLES = 3
+# seconds between checks for stragglers while no parts are left to dispatch
+SPECULATION_POLL_SECONDS = 5.0
+
+
+class SpeculationLost(Exception):
+    """the part an attempt was working on was won by another attempt"""
+
+
+def path_to_download(path_to_parts_directory, partId, copy):
+    """return the local path an attempt downloads a part to (copy 0 is the original)"""
+    if copy == 0:
+        return path_to_parts_directory / f"part_{partId}.xz"
+    return path_to_parts_directory / f"part_{partId}.copy{copy}.xz"
+
+
+def path_to_spool(path_to_spool_directory, name, copy):
+    """return the local path an attempt spools a part named name to before uploading it
+    (copy 0 is the original), so that attempts at the same part do not share a file"""
+    if copy == 0:
+        return path_to_spool_directory / name
+    return path_to_spool_directory / f"{name}.copy{copy}"
+
+
+class Speculation:
+    """track the running attempts of parts and the copies launched of stragglers
+
+    Attributes:
+        factor: a part is a straggler once running factor times the median part time
+        min_seconds: nor is it a straggler before running min_seconds
+        max_copies: the most copies launched of a part
+        launched: count of the copies launched
+        won: count of the parts won by a copy
+    """
+
+    def __init__(
+        self,
+        factor=DEFAULT_SPECULATION_FACTOR,
+        min_seconds=DEFAULT_SPECULATION_MIN_SECONDS,
+        max_copies=DEFAULT_SPECULATION_MAX_COPIES,
+        clock=time.monotonic,
+        poll_seconds=SPECULATION_POLL_SECONDS,
+    ):
+        """
+        :param clock: callable returning the time in seconds (e.g. simulated time)
+        :param poll_seconds: (real) seconds between checks for stragglers
+        """
+        self.factor = factor
+        self.min_seconds = min_seconds
+        self.max_copies = max_copies
+        self._clock = clock
+        self.poll_seconds = poll_seconds
+        self.launched = 0
+        self.won = 0
+        # partId -> {attempt: start time} of the attempts running
+        self._running = {}
+        # partId -> count of copies launched
+        self._copies = {}
+        # seconds taken by the attempts that won their part (per part of their batch)
+        self._durations = []
+        # partId -> Event set once the part is won
+        self._won = {}
+
+    @property
+    def enabled(self):
+        return self.factor > 0 and self.max_copies > 0
+
+    def _won_event(self, partId):
+        if partId not in self._won:
+            self._won[partId] = asyncio.Event()
+        return self._won[partId]
+
+    def started(self, partId, copy=0, batch_size=1):
+        """record that an attempt at a part has begun returning the attempt's token
+
+        :param batch_size: count of parts run one after another in the attempt's task,
+            its time is shared between them
+        """
+        attempt = (copy, self._clock(), batch_size)
+        self._running.setdefault(partId, {})[attempt] = attempt[1]
+        return attempt
+
+    def stopped(self, partId, attempt):
+        """record that an attempt has ended (won, lost or failed)"""
+        running = self._running.get(partId, {})
+        running.pop(attempt, None)
+        if len(running) == 0:
+            self._running.pop(partId, None)
+
+    def claim(self, partId, attempt):
+        """claim the part for an attempt returning whether it is the first to
+
+        the attempts still running on the part are signalled to give up.
+        """
+        won = self._won_event(partId)
+        if won.is_set():
+            return False
+        won.set()
+        self._durations.append((self._clock() - attempt[1]) / attempt[2])
+        if attempt[0] > 0:
+            self.won += 1
+        return True
+
+    def is_won(self, partId):
+        return partId in self._won and self._won[partId].is_set()
+
+    async def wait_won(self, *partIds):
+        """wait until every part given is won (by any attempt)"""
+        for partId in partIds:
+            await self._won_event(partId).wait()
+
+    def next_straggler(self):
+        """return (partId, copy) of the part to launch a copy of next or None
+
+        the straggler longest running is chosen among those running past the threshold
+        with fewer than max_copies copies launched.
+        """
+        if not self.enabled or len(self._durations) < SPECULATION_MIN_SAMPLES:
+            return None
+        threshold = max(
+            self.min_seconds, self.factor * statistics.median(self._durations)
+        )
+        now = self._clock()
+        stragglers = []
+        for partId, running in self._running.items():
+            if self.is_won(partId) or self._copies.get(partId, 0) >= self.max_copies:
+                continue
+            # the part is straggling only if no attempt at it is within the threshold
+            elapsed = min(
+                (now - start) / batch_size for _, start, batch_size in running
+            )
+            if elapsed > threshold:
+                stragglers.append((elapsed, partId))
+        if len(stragglers) == 0:
+            return None
+        partId = max(stragglers)[1]
+        self._copies[partId] = self._copies.get(partId, 0) + 1
+        self.launched += 1
+        return partId, self._copies[partId]
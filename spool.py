@@ -0,0 +1,66 @@
+"""spool a range of the target, raw or precompressed, to a file for upload_file.
+
+uploading a part via upload_bytes holds the whole part (or its precompressed stream) in
+memory until the provider has received it. spooling it into a file in the job's work
+directory instead bounds the memory held per part to a single chunk: the raw range is
+copied by the kernel (see filecopy) and a precompressed range is compressed chunk by
+chunk with each compressed piece written out as it is produced.
+
+both functions are meant to run off the event loop, spool_range in a thread and
+spool_precompressed_range in a pool process (see precompress).
+
+
+Typical usage example:
+
+length = spool_precompressed_range("/target", 0, 2**26, 1, "/workdir/<hash>/spool/part_1.xz")
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+from lzma import LZMACompressor
+from pathlib import Path
+
+from filecopy import copy_range
+
+SPOOL_CHUNK_SIZE = 2**20
+
+
+def spool_range(path_to_file, start, end, path_to_spool_file):
+    """copy the range [start, end) of a file into a spool file and return its length"""
+    Path(path_to_spool_file).parent.mkdir(exist_ok=True)
+    with open(path_to_file, "rb") as src, open(path_to_spool_file, "wb") as dst:
+        copied, _ = copy_range(src.fileno(), dst.fileno(), end - start, start, 0)
+    return copied
+
+
+def spool_precompressed_range(path_to_file, start, end, preset, path_to_spool_file):
+    """compress the range [start, end) of a file into an xz stream written to a spool file
+
+    Args:
+        path_to_file: path string to the file to read from
+        start: offset of the first byte of the range
+        end: offset one past the last byte of the range
+        preset: lzma preset (0-9) to compress with
+        path_to_spool_file: path string of the file to write the stream to (overwritten)
+
+    Returns:
+        the length of the spool file
+    """
+    Path(path_to_spool_file).parent.mkdir(exist_ok=True)
+    lzmaCompressor = LZMACompressor(preset=preset)
+    buffer = memoryview(bytearray(SPOOL_CHUNK_SIZE))
+    written = 0
+    with open(path_to_file, "rb", buffering=0) as src, open(
+        path_to_spool_file, "wb"
+    ) as dst:
+        src.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            count = src.readinto(buffer[: min(SPOOL_CHUNK_SIZE, remaining)])
+            if not count:
+                break
+            written += dst.write(lzmaCompressor.compress(buffer[:count]))
+            remaining -= count
+        written += dst.write(lzmaCompressor.flush())
+    return written
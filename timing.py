@@ -0,0 +1,313 @@
+"""time the stages each part goes through and report on them via gompress.py stats.
+
+each part compressed records when each of its stages began and ended (in unix time)
+in the PartTiming table of its job's work.db, along with the bytes the stage went
+through and the provider (or local) it was compressed by:
+
+read          the part is viewed or spooled from the target (a view is read lazily,
+              as it is uploaded)
+precompress   the part is read and compressed locally (--xfer-compression-level)
+upload        the part is sent to the provider
+xz            xz runs on the provider (the walltime reported, placed before the run,
+              or when pipelined the wait on it, is known to be done), or locally on
+              the part as read from the target
+download      the result is fetched from the provider
+commit        the result is recorded in work.db (and the part cache)
+
+the times of the commands of a script are those the requestor learns they are done,
+the commands of a script running one after another (see ScriptTimer).
+
+stats reports for the last session of a job (or each with --all-sessions) the parts
+and bytes through each stage, their throughput per part and over the span of the
+session, percentiles of the time each took and the critical path, the stages (and
+waits) of the part committed last, which bounds how soon the job was done. the share
+of the critical path each stage took tells whether the uplink, the providers' cpus or
+the local disks held up the job.
+
+
+Typical usage example:
+
+$ python3 gompress.py stats workdir/<hash>/final/myfile.raw.xz
+$ python3 timing.py workdir/<hash>/work.db --all-sessions --json stats.json
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+STAGES = ("read", "precompress", "upload", "xz", "download", "commit")
+
+# what each stage is held up by when it dominates the critical path
+RESOURCES = {
+    "read": "local I/O",
+    "precompress": "local cpu",
+    "upload": "uplink",
+    "xz": "provider cpu",
+    "download": "downlink",
+    "commit": "local I/O",
+}
+
+PERCENTILES = (50, 90, 99)
+# gaps between the stages of the critical path shorter than this are not shown as waits
+MIN_WAIT_SECONDS = 0.01
+
+
+class ScriptTimer:
+    """time the commands added to a script by when each is known to be done
+
+    a command begins when the one added before it is done (or when the script is sent
+    for the first), as the commands of a script run one after another.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.sent_time = None
+        self._done_times = []
+
+    def track(self, future):
+        """return a callable giving the (start, end) of the command of future once done
+
+        (None until it is done)
+        """
+        index = len(self._done_times)
+        self._done_times.append(None)
+
+        def on_done(_):
+            self._done_times[index] = self.clock()
+
+        future.add_done_callback(on_done)
+
+        def span():
+            end = self._done_times[index]
+            if end is None:
+                return None
+            start = self._done_times[index - 1] if index > 0 else self.sent_time
+            return (start if start is not None else end, end)
+
+        return span
+
+    def sent(self):
+        """mark the script as sent to the provider"""
+        self.sent_time = self.clock()
+
+
+def _path_to_work_db(path):
+    """return the work.db of a job given it, its directory or its final file"""
+    path = Path(path)
+    if path.is_dir():
+        return path / "work.db"
+    if path.name == "work.db":
+        return path
+    return path.parent.parent / "work.db"
+
+
+def percentile(values, p):
+    """return the p-th percentile (nearest rank) of sorted values"""
+    if len(values) == 0:
+        return None
+    rank = max(int(-(-p * len(values) // 100)), 1)
+    return values[min(rank, len(values)) - 1]
+
+
+def _union_length(intervals):
+    """return the time covered by any of intervals"""
+    covered = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                covered += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        covered += current_end - current_start
+    return covered
+
+
+def summarize_session(rows):
+    """return the statistics of the timings of one session
+
+    :param rows: (partId, source, stage, start, end, length) recorded in the session
+    """
+    session_start = min(row[3] for row in rows)
+    session_end = max(row[4] for row in rows)
+    makespan = session_end - session_start
+    stages = {}
+    for stage in STAGES:
+        stage_rows = [row for row in rows if row[2] == stage]
+        if len(stage_rows) == 0:
+            continue
+        durations = sorted(row[4] - row[3] for row in stage_rows)
+        busy = sum(durations)
+        byte_count = sum(row[5] or 0 for row in stage_rows)
+        wall = _union_length([(row[3], row[4]) for row in stage_rows])
+        stages[stage] = {
+            "parts": len({row[0] for row in stage_rows}),
+            "bytes": byte_count,
+            "busy_seconds": busy,
+            "wall_seconds": wall,
+            "mib_per_second_per_part": (
+                byte_count / 2**20 / busy if busy > 0 and byte_count > 0 else None
+            ),
+            "mib_per_second": (
+                byte_count / 2**20 / wall if wall > 0 and byte_count > 0 else None
+            ),
+            "share_of_makespan": wall / makespan if makespan > 0 else None,
+            "percentiles": {f"p{p}": percentile(durations, p) for p in PERCENTILES},
+            "max_seconds": durations[-1],
+        }
+
+    ##########################################################
+    # the critical path: the stages of the part committed    #
+    # last, the time between them being spent waiting (e.g.  #
+    # on a provider or behind other parts of its batch)      #
+    ##########################################################
+    last_row = max(rows, key=lambda row: row[4])
+    part_rows = sorted(
+        (row for row in rows if row[0] == last_row[0] and row[1] == last_row[1]),
+        key=lambda row: (row[3], STAGES.index(row[2]) if row[2] in STAGES else 0),
+    )
+    path = []
+    cursor = session_start
+    for row in part_rows:
+        if row[3] - cursor >= MIN_WAIT_SECONDS:
+            path.append(("wait", cursor - session_start, row[3] - session_start))
+        path.append((row[2], row[3] - session_start, row[4] - session_start))
+        cursor = max(cursor, row[4])
+    shares = {}
+    for stage, start, end in path:
+        shares[stage] = shares.get(stage, 0.0) + end - start
+    bottleneck = max(
+        (stage for stage in shares if stage != "wait"),
+        key=lambda stage: shares[stage],
+        default=None,
+    )
+    return {
+        "session": datetime.fromtimestamp(session_start).isoformat(
+            sep=" ", timespec="seconds"
+        ),
+        "parts": len({row[0] for row in rows}),
+        "makespan_seconds": makespan,
+        "stages": stages,
+        "critical_path": {
+            "part": last_row[0],
+            "source": last_row[1],
+            "steps": [
+                {"stage": stage, "start": start, "end": end}
+                for stage, start, end in path
+            ],
+            "bottleneck": bottleneck,
+            "bottleneck_resource": RESOURCES.get(bottleneck),
+        },
+    }
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:,.2f}"
+
+
+def print_summary(summary):
+    """print the statistics of a session as returned by summarize_session"""
+    print(
+        f"\033[1msession begun {summary['session']}: {summary['parts']} parts in"
+        f" {timedelta(seconds=round(summary['makespan_seconds'], 2))}\033[0m"
+    )
+    header = (
+        f"{'stage':<12}{'parts':>6}{'MiB':>10}{'MiB/s/part':>12}{'MiB/s':>10}"
+        f"{'span':>7}"
+        + "".join(f"{f'p{p} s':>9}" for p in PERCENTILES)
+        + f"{'max s':>9}"
+    )
+    print(header)
+    for stage, statistics in summary["stages"].items():
+        share = statistics["share_of_makespan"]
+        print(
+            f"{stage:<12}{statistics['parts']:>6}"
+            f"{statistics['bytes'] / 2**20:>10,.2f}"
+            f"{_seconds(statistics['mib_per_second_per_part']):>12}"
+            f"{_seconds(statistics['mib_per_second']):>10}"
+            f"{'-' if share is None else f'{share:.0%}':>7}"
+            + "".join(
+                f"{_seconds(statistics['percentiles'][f'p{p}']):>9}"
+                for p in PERCENTILES
+            )
+            + f"{_seconds(statistics['max_seconds']):>9}"
+        )
+    critical_path = summary["critical_path"]
+    print(
+        f"critical path, part {critical_path['part']} (committed last) by"
+        f" {critical_path['source'] or 'an unknown source'}:"
+    )
+    for step in critical_path["steps"]:
+        print(
+            f"  {step['stage']:<12} +{step['start']:,.2f}s to +{step['end']:,.2f}s"
+            f" ({step['end'] - step['start']:,.2f}s)"
+        )
+    if critical_path["bottleneck"] is not None:
+        print(
+            f"the critical path spent the most time in {critical_path['bottleneck']},"
+            f" held up by the {critical_path['bottleneck_resource']}"
+        )
+
+
+def main(argv=None):
+    """report on the stage timings of a job, returning the exit status"""
+    parser = argparse.ArgumentParser(
+        prog="gompress.py stats",
+        description="report the throughput, percentiles and critical path of the stages"
+        " the parts of a job went through",
+    )
+    parser.add_argument(
+        "job", help="the job's final file, its workdir/<hash> directory or its work.db"
+    )
+    parser.add_argument(
+        "--all-sessions",
+        action="store_true",
+        default=False,
+        help="report on every session of the job instead of the last",
+    )
+    parser.add_argument("--json", default=None, help="path to write the statistics to")
+    args = parser.parse_args(argv)
+
+    path_to_work_db = _path_to_work_db(args.job)
+    if not path_to_work_db.exists():
+        print(f"no work.db was found for {args.job}")
+        return 1
+    con = sqlite3.connect(f"file:{path_to_work_db}?mode=ro", uri=True)
+    try:
+        rows = con.execute(
+            "SELECT session, partId, source, stage, start, end, length FROM PartTiming"
+            " ORDER BY session, start"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # recorded before stages were timed
+    finally:
+        con.close()
+    if len(rows) == 0:
+        print(f"no stage timings are recorded in {path_to_work_db}")
+        return 1
+
+    sessions = {}
+    for row in rows:
+        sessions.setdefault(row[0], []).append(row[1:])
+    if not args.all_sessions:
+        sessions = {max(sessions): sessions[max(sessions)]}
+    summaries = [summarize_session(session_rows) for session_rows in sessions.values()]
+    for summary in summaries:
+        print_summary(summary)
+    if args.json is not None:
+        with open(args.json, "w") as json_file:
+            json.dump(summaries, json_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,15 +5,30 @@ from datetime import datetime, timezone
 from pathlib import Path
 import tempfile
 
-import colorama  # type: ignore
+try:
+    import colorama  # type: ignore
+except ModuleNotFoundError:
+    # (installed with yapapi, only needed for the colors on windows)
+    colorama = None
+
+try:
+    from yapapi import (
+        windows_event_loop_fix,
+        NoPaymentAccountError,
+        __version__ as yapapi_version,
+    )
+    from yapapi.log import enable_default_logger
+except ModuleNotFoundError:
+    # the local backend and the offline commands run without yapapi, which is only
+    # needed to task providers (see golembackend)
+    yapapi_version = None
+    enable_default_logger = None
+
+    class NoPaymentAccountError(Exception):
+        """stands in for yapapi's, which cannot be raised without it"""
 
-from yapapi import (
-    Golem,
-    windows_event_loop_fix,
-    NoPaymentAccountError,
-    __version__ as yapapi_version,
-)
-from yapapi.log import enable_default_logger
+    def windows_event_loop_fix():
+        pass
 
 
 TEXT_COLOR_RED = "\033[31;1m"
@@ -26,7 +41,8 @@ TEXT_COLOR_WHITE = "\033[37;1m"
 
 TEXT_COLOR_DEFAULT = "\033[0m"
 
-colorama.init()
+if colorama is not None:
+    colorama.init()
 
 
 def build_parser(description: str) -> argparse.ArgumentParser:
@@ -66,7 +82,7 @@ def format_usage(usage):
     }
 
 
-def print_env_info(golem: Golem):
+def print_env_info(golem):
     print(
         f"yapapi version: {TEXT_COLOR_YELLOW}{yapapi_version}{TEXT_COLOR_DEFAULT}\n"
         f"Using subnet: {TEXT_COLOR_YELLOW}{golem.subnet_tag}{TEXT_COLOR_DEFAULT}, "
@@ -79,7 +95,7 @@ def run_golem_example(example_main, log_file=None):
     # This is only required when running on Windows with Python prior to 3.8:
     windows_event_loop_fix()
 
-    if log_file:
+    if log_file and enable_default_logger is not None:
         enable_default_logger(
             log_file=log_file,
             debug_activity_api=True,
@@ -0,0 +1,108 @@
+"""find the files dropped in a directory watched by gompress serve once they are closed.
+
+a file is taken once its length and modification time have not changed for settle
+seconds, as the standard library offers no portable notification of a file being
+closed. files whose names begin with a dot are passed over, so a file may also be
+written under a hidden name and renamed when complete to be taken at once.
+
+a file compressed is moved to the done directory (so it is not taken again, even by a
+later serve), one that could not be compressed is passed over until it changes.
+
+
+Typical usage example:
+
+directoryWatcher = DirectoryWatcher(Path("incoming"), Path("incoming/done"))
+for path_to_file in directoryWatcher.poll():
+    ...
+    directoryWatcher.done(path_to_file)
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import shutil
+import time
+
+
+class DirectoryWatcher:
+    """poll a directory for the files dropped in it that are complete
+
+    Attributes:
+        path_to_directory: Path to the directory watched
+        path_to_done_directory: Path to the directory files compressed are moved to
+        settle_seconds: seconds a file must go unchanged to be taken
+    """
+
+    def __init__(self, path_to_directory, path_to_done_directory, settle_seconds=5.0):
+        self.path_to_directory = path_to_directory
+        self.path_to_done_directory = path_to_done_directory
+        self.settle_seconds = settle_seconds
+        # name -> (length, mtime) of a file last seen and the time it was first seen so
+        self._seen = {}
+        # names of the files taken and not yet done or failed
+        self._taken = set()
+        # name -> (length, mtime) of a file that failed, passed over while unchanged
+        self._failed = {}
+
+    def poll(self):
+        """return the Paths of the files complete since the last poll (oldest first)"""
+        now = time.monotonic()
+        settled = []
+        present = set()
+        for path_to_file in self.path_to_directory.iterdir():
+            name = path_to_file.name
+            if name.startswith(".") or name in self._taken:
+                continue
+            try:
+                stat_result = path_to_file.stat()
+            except FileNotFoundError:
+                continue  # removed since listed
+            if not path_to_file.is_file():
+                continue
+            present.add(name)
+            signature = (stat_result.st_size, stat_result.st_mtime_ns)
+            if self._failed.get(name) == signature:
+                continue
+            last_signature, since = self._seen.get(name, (None, now))
+            if last_signature != signature:
+                self._seen[name] = (signature, now)
+                continue
+            if now - since >= self.settle_seconds:
+                settled.append((stat_result.st_mtime_ns, path_to_file))
+        # forget files removed before they were taken
+        for name in list(self._seen):
+            if name not in present:
+                del self._seen[name]
+        for _, path_to_file in sorted(settled):
+            self._take(path_to_file)
+        return [path_to_file for _, path_to_file in sorted(settled)]
+
+    def _take(self, path_to_file):
+        self._taken.add(path_to_file.name)
+        self._seen.pop(path_to_file.name, None)
+        self._failed.pop(path_to_file.name, None)
+
+    def done(self, path_to_file):
+        """move a file taken (and compressed) to the done directory"""
+        self.path_to_done_directory.mkdir(parents=True, exist_ok=True)
+        shutil.move(
+            str(path_to_file), str(self.path_to_done_directory / path_to_file.name)
+        )
+        self._taken.discard(path_to_file.name)
+
+    def failed(self, path_to_file):
+        """return a file taken that was not compressed, passing over it until it changes
+
+        (the file is marked failed before it is no longer taken, so that a poll meanwhile,
+        e.g. while jobs are finalized in a thread, does not take it again)
+        """
+        try:
+            stat_result = path_to_file.stat()
+        except FileNotFoundError:
+            pass
+        else:
+            self._failed[path_to_file.name] = (
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+            )
+        self._taken.discard(path_to_file.name)
@@ -5,6 +5,12 @@ gompress creates a working subdirectory in a specified workdir named after the h
 of the file to compress. inside the subdirectory, parts and final subdirectories
 are created.
 
+the hash is either a sha1 hash of the whole file or, optionally, a tree hash: the root
+of blake2b hashes taken of each part (range) of the file in parallel. the latter hashes
+are kept (part_hashes) to be recorded with each part. for an archive streamed into chunks
+(see archive.stream_archive) both were taken as the archive was written and are not
+computed again.
+
 also provides a checksum method for general use that returns a length or sha1 hash
 of a file
 
@@ -16,22 +22,212 @@ workDirectoryInfo.create_skeleton()
 """
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
+import os
 from debug.mylogging import g_logger
+from hashcache import HashCache
+from _create_connection import _partitionRanges
+
+HASH_READ_SIZE = 2**20  # large reads keep the hash rate near the disk's
+TREE_HASH_DIGEST_SIZE = 20  # as long as sha1's so work directory names look alike
+
 
 def sha1_hash(path_to_target):
     """perform a sha1 hash on a target file and return."""
     sha1 = hashlib.sha1()
-    with open(path_to_target, "rb") as f:
+    buffer = memoryview(bytearray(HASH_READ_SIZE))
+    with open(path_to_target, "rb", buffering=0) as f:
         while True:
-            data = f.read(4096)
-            if not data:
+            count = f.readinto(buffer)
+            if not count:
                 break
-            sha1.update(data)
+            sha1.update(buffer[:count])
     the_hash = sha1.hexdigest()
     return the_hash
 
 
+def sha256_hash(path_to_target):
+    """perform a sha256 hash on a target file and return (the digest xz.sh reports)."""
+    sha256 = hashlib.sha256()
+    buffer = memoryview(bytearray(HASH_READ_SIZE))
+    with open(path_to_target, "rb", buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            sha256.update(buffer[:count])
+    return sha256.hexdigest()
+
+
+def _part_hash(path_to_target, start, end):
+    """perform a blake2b hash on the range [start, end) of a target file and return."""
+    blake2b = hashlib.blake2b(digest_size=TREE_HASH_DIGEST_SIZE)
+    buffer = memoryview(bytearray(HASH_READ_SIZE))
+    with open(path_to_target, "rb", buffering=0) as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            count = f.readinto(buffer[: min(HASH_READ_SIZE, remaining)])
+            if not count:
+                break
+            blake2b.update(buffer[:count])
+            remaining -= count
+    return blake2b.hexdigest()
+
+
+def part_hashes(path_to_target, ranges, max_workers=None):
+    """hash each range of a target file in parallel and return the list of hashes.
+
+    hashlib releases the GIL while digesting large buffers so a pool of threads hashes
+    as many ranges at once as there are cores (given the disk keeps up).
+
+    Args:
+        path_to_target: the Path to the file to hash
+        ranges: sequence of [start, end) pairs (e.g. from _partitionRanges)
+        max_workers: threads to hash with, None for one per core
+
+    Returns:
+        list of hex strings corresponding to ranges
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(
+            pool.map(lambda read_range: _part_hash(path_to_target, *read_range), ranges)
+        )
+
+
+def tree_hash(path_to_target, ranges, max_workers=None):
+    """hash each range of a target file in parallel and derive a root hash from them.
+
+    the root is the blake2b hash over each range's boundaries and hash in order, so it
+    differs when the same file is divided differently.
+
+    Args:
+        path_to_target: the Path to the file to hash
+        ranges: sequence of [start, end) pairs (e.g. from _partitionRanges)
+        max_workers: threads to hash with, None for one per core
+
+    Returns:
+        the root hash string and the list of hashes of the ranges
+    """
+    hashes = part_hashes(path_to_target, ranges, max_workers)
+    return tree_root(ranges, hashes), hashes
+
+
+def tree_root(ranges, hashes):
+    """derive the root hash of a tree hash from the ranges and their hashes (see tree_hash)"""
+    root = hashlib.blake2b(digest_size=TREE_HASH_DIGEST_SIZE)
+    for read_range, part_hash in zip(ranges, hashes):
+        root.update(f"{read_range[0]}-{read_range[1]}:".encode())
+        root.update(bytes.fromhex(part_hash))
+    return root.hexdigest()
+
+
+TREE_HASH_METHOD_PREFIX = "blake2b-tree:"
+
+
+def _tree_hash_method(ranges):
+    """name the tree hash method in the hash cache after the part length it was built on"""
+    return f"{TREE_HASH_METHOD_PREFIX}{ranges[0][1] - ranges[0][0]}"
+
+
+def recorded_tree_part_size(path_to_target, path_to_wdir_parent):
+    """return the part length of the job begun on the target with the tree hash, or None.
+
+    the tree hash (the job's identity) is built on the parts, so the part length a job
+    was begun with must be known before its work directory can be found. it is taken
+    from the tree hashes cached for the target in its current state whose work
+    directory holds a work.db (the most recently worked on if several).
+
+    Args:
+        path_to_target: the Path to the file of the job
+        path_to_wdir_parent: the Path to the main working directory
+
+    Returns:
+        the part length or None if no job on the target is found
+    """
+    path_to_history_db = path_to_wdir_parent / "history.db"
+    if not path_to_history_db.exists():
+        return None
+    hashCache = HashCache(path_to_history_db)
+    try:
+        rows = hashCache.lookup_methods(path_to_target, TREE_HASH_METHOD_PREFIX)
+    finally:
+        hashCache.close()
+    recorded = []
+    for method, the_hash in rows:
+        path_to_work_db = path_to_wdir_parent / the_hash / "work.db"
+        if path_to_work_db.exists():
+            recorded.append(
+                (
+                    path_to_work_db.stat().st_mtime_ns,
+                    int(method[len(TREE_HASH_METHOD_PREFIX) :]),
+                )
+            )
+    if len(recorded) == 0:
+        return None
+    return max(recorded)[1]
+
+
+def cached_sha1_hash(path_to_target, path_to_history_db):
+    """return the sha1 hash of the target, read from the hash cache if the target is unchanged.
+
+    Args:
+        path_to_target: the Path to the file to hash
+        path_to_history_db: the Path to the history database holding the cache, if its
+            directory does not exist (yet) the hash is computed without the cache
+
+    Returns:
+        the hash string
+    """
+    if not path_to_history_db.parent.exists():
+        return sha1_hash(path_to_target)
+
+    hashCache = HashCache(path_to_history_db)
+    try:
+        the_hash = hashCache.lookup(path_to_target)
+        if the_hash is None:
+            stat_key = hashCache.stat_key(path_to_target)
+            the_hash = sha1_hash(path_to_target)
+            hashCache.store(path_to_target, the_hash, stat_key=stat_key)
+    finally:
+        hashCache.close()
+    return the_hash
+
+
+def cached_tree_hash(path_to_target, ranges, path_to_history_db):
+    """return the tree hash and part hashes of the target, from the hash cache if unchanged.
+
+    Args:
+        path_to_target: the Path to the file to hash
+        ranges: sequence of [start, end) pairs the tree is built on
+        path_to_history_db: the Path to the history database holding the cache, if its
+            directory does not exist (yet) the hash is computed without the cache
+
+    Returns:
+        the root hash string and the list of hashes of the ranges
+    """
+    if not path_to_history_db.parent.exists():
+        return tree_hash(path_to_target, ranges)
+
+    method = _tree_hash_method(ranges)
+    hashCache = HashCache(path_to_history_db)
+    try:
+        the_hash = hashCache.lookup(path_to_target, method)
+        hashes = hashCache.lookup_part_hashes(path_to_target, method)
+        if the_hash is None or hashes is None:
+            stat_key = hashCache.stat_key(path_to_target)
+            the_hash, hashes = tree_hash(path_to_target, ranges)
+            hashCache.store(
+                path_to_target, the_hash, method, stat_key=stat_key, part_hashes=hashes
+            )
+    finally:
+        hashCache.close()
+    return the_hash, hashes
+
+
 def checksum(path_to_target, sha1=False):
     """perform a checksum on a target file to return the length or sha1 hash of a file.
 
@@ -64,15 +260,26 @@ class WorkDirectoryInfo:
         <workdir>/<hash>
         <workdir>/<hash>/parts
         <workdir>/<hash>/final
+        <workdir>/<hash>/spool
 
     Attributes:
         path_to_wdir_parent: Path to the parent or root working directory (for all targets) <workdir>
         path_to_target_wdir: Path to the workdir specific for the target <hash>
         path_to_parts_directory: Path to the parts subdirectory of workdir
         path_to_final_directory: Path to the final subdirectory of workdir
+        path_to_spool_directory: Path to the subdirectory of workdir holding parts to upload
+        part_hashes: list of hashes of each part if the tree hash was used or the target
+            is a streamed archive else None
     """
 
-    def __init__(self, path_to_wdir_parent_in, path_to_target_in):
+    def __init__(
+        self,
+        path_to_wdir_parent_in,
+        path_to_target_in,
+        tree_hash=False,
+        part_size=None,
+        streamed_archive=None,
+    ):
         """add directory information for compression work on a target without creating the directories.
 
         Args:
@@ -81,13 +288,41 @@ class WorkDirectoryInfo:
                 for specific jobs are created (like this one)
             path_to_target_in:
                 Path to the file for the job to be run (the file to be compressed)
+            tree_hash:
+                whether to identify the job by the tree hash of the parts instead of
+                the sha1 hash of the whole file
+            part_size:
+                the length of the parts the tree hash is built on (None for default)
+            streamed_archive:
+                the StreamedArchive the target is (path_to_target_in is then None),
+                whose hashes were taken as it was streamed
 
         Post: None
         """
         self.__path_to_wdir_parent = path_to_wdir_parent_in
         self._path_to_target = path_to_target_in
-        # hash path_to_target
-        the_hash = checksum(self._path_to_target, sha1=True)
+        self.part_hashes = None
+        # hash path_to_target (unless unchanged since last hashed)
+        path_to_history_db = self.path_to_wdir_parent / "history.db"
+        if streamed_archive is not None:
+            # the chunks of the archive are its parts
+            self.part_hashes = streamed_archive.chunk_hashes
+            if tree_hash:
+                the_hash = tree_root(
+                    _partitionRanges(streamed_archive.length, part_size),
+                    self.part_hashes,
+                )
+            else:
+                the_hash = streamed_archive.sha1
+        elif tree_hash:
+            ranges = _partitionRanges(
+                Path(self._path_to_target).stat().st_size, part_size
+            )
+            the_hash, self.part_hashes = cached_tree_hash(
+                self._path_to_target, ranges, path_to_history_db
+            )
+        else:
+            the_hash = cached_sha1_hash(self._path_to_target, path_to_history_db)
         # create abstract path to wdir from hash
         wdirname = the_hash
         self.__path_to_target_wdir = self.path_to_wdir_parent / the_hash
@@ -95,6 +330,8 @@ class WorkDirectoryInfo:
         self.__path_to_parts_directory = self.path_to_target_wdir / "parts"
         # create abstraction of final directory
         self.__path_to_final_directory = self.path_to_target_wdir / "final"
+        # create abstraction of spool directory
+        self.__path_to_spool_directory = self.path_to_target_wdir / "spool"
 
     @property
     def path_to_wdir_parent(self):
@@ -112,6 +349,10 @@ class WorkDirectoryInfo:
     def path_to_final_directory(self):
         return self.__path_to_final_directory
 
+    @property
+    def path_to_spool_directory(self):
+        return self.__path_to_spool_directory
+
     def create_skeleton(self):
         """initialize by creating empty subdirectories pertinent to the work.
 
@@ -121,6 +362,7 @@ class WorkDirectoryInfo:
         self.path_to_target_wdir.mkdir(exist_ok=True)
         self.path_to_parts_directory.mkdir(exist_ok=True)
         self.path_to_final_directory.mkdir(exist_ok=True)
+        self.path_to_spool_directory.mkdir(exist_ok=True)
 
     def __repr__(self):
         repr_str = f"""
@@ -128,5 +370,6 @@ class WorkDirectoryInfo:
     {self.path_to_target_wdir}
         {self.path_to_parts_directory}
         {self.path_to_final_directory}
+        {self.path_to_spool_directory}
 """
         return repr_str
@@ -0,0 +1,401 @@
+"""index where each xz stream of a final file begins and extract from it without
+decompressing the whole.
+
+the final file is the concatenation of the independent xz streams of the parts, so the
+range [start, end) of the target that a part covers is the decompression of its stream
+alone. once the final file is concatenated, gompress writes a sidecar index next to it
+(<final>.idx, an sqlite database) from the job's database:
+
+    Stream      the compressed range of each part's stream, the range of the target it
+                decompresses to and the part's hash if recorded (blake2b, as the tree
+                hash takes), in order
+    Member      the name, type and the offset and length of the data of each member of
+                the target when it is a tar (read from the headers of the uncompressed
+                target while it is still at hand)
+
+a range is extracted by seeking to the stream holding its start and decompressing from
+there, stream after stream, up to its end. a member is extracted as the range of its
+data. a member of a target that was not indexed (e.g. the index predates the member
+table) is found by walking the tar headers over the streams, where the streams holding
+only the data of members passed over are not decompressed.
+
+
+Typical usage example:
+
+write_index(path_to_index(path_to_final_file), streams, open_target)
+...
+$ python3 gompress.py extract workdir/<hash>/final/mydir.tar.xz --member mydir/notes.txt
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import argparse
+import bisect
+import io
+import lzma
+import sqlite3
+import sys
+import tarfile
+from functools import partial
+from pathlib import Path
+
+from debug.mylogging import g_logger
+from partsize import parse_size
+
+READ_SIZE = 2**20
+
+
+def path_to_index(path_to_final_file):
+    """return the Path to the sidecar index of a final file"""
+    return Path(f"{path_to_final_file}.idx")
+
+
+def write_index(path_to_index_file, streams, open_target=None):
+    """write the sidecar index of a final file
+
+    Args:
+        path_to_index_file: the Path to write the index to (replaced if it exists)
+        streams: sequence of (compressed start, compressed end, start, end, hash or
+            None) of each part in order
+        open_target: callable returning the uncompressed target opened for reading
+            (binary, seekable) to index its members if it is a tar, or None
+
+    Returns:
+        the count of members indexed
+    """
+    path_to_index_file.unlink(missing_ok=True)
+    con = sqlite3.connect(str(path_to_index_file))
+    try:
+        con.execute(
+            "CREATE TABLE Stream(compressed_start INTEGER NOT NULL, compressed_end"
+            " INTEGER NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL, hash TEXT)"
+        )
+        con.execute(
+            "CREATE TABLE Member(name TEXT NOT NULL, type TEXT NOT NULL, linkname TEXT,"
+            " offset_data INTEGER NOT NULL, size INTEGER NOT NULL)"
+        )
+        con.executemany("INSERT INTO Stream VALUES (?, ?, ?, ?, ?)", streams)
+        member_count = 0
+        if open_target is not None:
+            with open_target() as target:
+                member_count = _index_members(con, target)
+        con.execute("CREATE INDEX MemberName ON Member(name)")
+        con.commit()
+    finally:
+        con.close()
+    return member_count
+
+
+def _iter_members(fileobj):
+    """yield the TarInfo of each member of the tar read from fileobj (by its headers)"""
+    with tarfile.open(fileobj=fileobj, mode="r:") as tar:
+        while True:
+            tarinfo = tar.next()
+            if tarinfo is None:
+                break
+            # the members are not kept (a tar may have millions)
+            tar.members.clear()
+            yield tarinfo
+
+
+def _member_row(tarinfo):
+    """return the (name, type, linkname, offset of data, size) of a member"""
+    return (
+        tarinfo.name,
+        tarinfo.type.decode(),
+        tarinfo.linkname or None,
+        tarinfo.offset_data,
+        tarinfo.size if tarinfo.isreg() else 0,
+    )
+
+
+def _index_members(con, target):
+    """record the members of the target in the index if it is a tar"""
+    if not tarfile.is_tarfile(target):
+        return 0
+    target.seek(0)
+    member_count = 0
+    batch = []
+    for tarinfo in _iter_members(target):
+        batch.append(_member_row(tarinfo))
+        if len(batch) >= 10000:
+            con.executemany("INSERT INTO Member VALUES (?, ?, ?, ?, ?)", batch)
+            member_count += len(batch)
+            batch = []
+    con.executemany("INSERT INTO Member VALUES (?, ?, ?, ?, ?)", batch)
+    return member_count + len(batch)
+
+
+class IndexedXzReader(io.RawIOBase):
+    """read the decompressed final file at any offset, decompressing from the beginning
+    of the stream holding it
+
+    reading forward within a stream continues its decompression, reading elsewhere
+    starts on the stream holding the offset (so only the streams read are decompressed).
+    """
+
+    def __init__(self, path_to_final_file, streams):
+        """
+        Args:
+            path_to_final_file: the Path to the final (concatenated) xz file
+            streams: sequence of (compressed start, compressed end, start, end, ...) in
+                order
+        """
+        self._file = open(path_to_final_file, "rb")
+        self._streams = list(streams)
+        self._starts = [stream[2] for stream in self._streams]
+        self.length = self._streams[-1][3] if len(self._streams) > 0 else 0
+        self._position = 0
+        # the stream being decompressed, its decompressor, where its input was read up
+        # to and the offset of the target decompressed up to
+        self._stream_index = None
+        self._decompressor = None
+        self._compressed_position = 0
+        self._decompressed_position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.length
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return self._position
+
+    def _begin_stream(self, index):
+        self._stream_index = index
+        self._decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+        self._compressed_position = self._streams[index][0]
+        self._decompressed_position = self._streams[index][2]
+
+    def _decompress(self, max_length):
+        """return up to max_length decompressed bytes of the current stream (b"" at its end)"""
+        compressed_end = self._streams[self._stream_index][1]
+        while True:
+            data = b""
+            if self._decompressor.needs_input:
+                if self._compressed_position >= compressed_end:
+                    return b""
+                self._file.seek(self._compressed_position)
+                data = self._file.read(
+                    min(READ_SIZE, compressed_end - self._compressed_position)
+                )
+                if not data:
+                    raise EOFError("the final file ended within a stream")
+                self._compressed_position += len(data)
+            out = self._decompressor.decompress(data, max_length=max_length)
+            if self._decompressor.eof:
+                # a part may hold more than one stream (xz accepts concatenated ones)
+                unused_data = self._decompressor.unused_data
+                if not unused_data and self._compressed_position >= compressed_end:
+                    return out
+                self._decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+                self._compressed_position -= len(unused_data)
+            if out:
+                return out
+
+    def readinto(self, buffer):
+        if self._position >= self.length or len(buffer) == 0:
+            return 0
+        index = bisect.bisect_right(self._starts, self._position) - 1
+        if index != self._stream_index or self._decompressed_position > self._position:
+            self._begin_stream(index)
+        # decompress (and drop) up to the position
+        while self._decompressed_position < self._position:
+            skipped = self._decompress(
+                min(READ_SIZE, self._position - self._decompressed_position)
+            )
+            if not skipped:
+                raise EOFError(f"stream {index} ended before its range did")
+            self._decompressed_position += len(skipped)
+        data = self._decompress(len(buffer))
+        if not data:
+            raise EOFError(f"stream {index} ended before its range did")
+        buffer[: len(data)] = data
+        self._decompressed_position += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def read_streams(path_to_index_file):
+    """return the streams recorded in an index, in order"""
+    con = sqlite3.connect(str(path_to_index_file))
+    try:
+        return con.execute(
+            "SELECT compressed_start, compressed_end, start, end, hash FROM Stream"
+            " ORDER BY start"
+        ).fetchall()
+    finally:
+        con.close()
+
+
+def lookup_member(path_to_index_file, name):
+    """return (type, linkname, offset of data, size) of the last member of the name
+    recorded in an index, or None if the index records no such member"""
+    con = sqlite3.connect(str(path_to_index_file))
+    try:
+        return con.execute(
+            "SELECT type, linkname, offset_data, size FROM Member WHERE name = ?"
+            " ORDER BY rowid DESC LIMIT 1",
+            (name,),
+        ).fetchone()
+    finally:
+        con.close()
+
+
+def member_count(path_to_index_file):
+    """return the count of members recorded in an index"""
+    con = sqlite3.connect(str(path_to_index_file))
+    try:
+        return con.execute("SELECT COUNT(*) FROM Member").fetchone()[0]
+    finally:
+        con.close()
+
+
+def _walk_member(reader, name):
+    """find a member by walking the tar headers over the streams (see module doc)"""
+    found = None
+    reader.seek(0)
+    buffered = io.BufferedReader(reader, READ_SIZE)
+    try:
+        for tarinfo in _iter_members(buffered):
+            if tarinfo.name == name:
+                found = _member_row(tarinfo)[1:]
+    finally:
+        # the reader is left open for extracting
+        buffered.detach()
+    return found
+
+
+def find_member(path_to_index_file, reader, name):
+    """return (type, linkname, offset of data, size) of a member, that of the member
+    linked to if it is a hard link, or None if there is no such member
+
+    Args:
+        path_to_index_file: the Path to the index of the final file
+        reader: IndexedXzReader of the final file, to walk the headers with when the
+            index records no members
+        name: the name of the member
+    """
+    if member_count(path_to_index_file) > 0:
+        lookup = partial(lookup_member, path_to_index_file)
+    else:
+        g_logger.debug("no members indexed, walking the headers")
+        lookup = partial(_walk_member, reader)
+    member = lookup(name)
+    if member is not None and member[0] == tarfile.LNKTYPE.decode():
+        # a hard link, its data is that of the member it links to
+        member = lookup(member[1])
+    return member
+
+
+def extract_range(reader, start, end, output):
+    """write the range [start, end) of the decompressed final file to output
+
+    Returns:
+        the count of bytes written
+    """
+    end = min(end, reader.length)
+    reader.seek(start)
+    written = 0
+    buffer = memoryview(bytearray(READ_SIZE))
+    while start + written < end:
+        count = reader.readinto(buffer[: min(READ_SIZE, end - start - written)])
+        output.write(buffer[:count])
+        written += count
+    return written
+
+
+def _range_argument(range_str):
+    """argparse type for --range: START:END of sizes (e.g. 1G:2G), END may be omitted"""
+    start_str, separator, end_str = range_str.partition(":")
+    try:
+        start = parse_size(start_str) if start_str else 0
+        end = parse_size(end_str) if end_str else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{range_str} is not a range START:END")
+    if separator != ":" or (end is not None and end < start):
+        raise argparse.ArgumentTypeError(f"{range_str} is not a range START:END")
+    return start, end
+
+
+def main(argv=None):
+    """extract a range or a tar member from a final file via its index, return the
+    exit status"""
+    parser = argparse.ArgumentParser(
+        prog="gompress.py extract",
+        description="extract a range or a member from a final file compressed by"
+        " gompress, decompressing only the streams (parts) holding it",
+    )
+    parser.add_argument("final", help="the final .xz file (with its .idx beside it)")
+    what = parser.add_mutually_exclusive_group(required=True)
+    what.add_argument(
+        "--range",
+        type=_range_argument,
+        help="the range START:END of the uncompressed file, e.g. 1G:2G (END omitted for"
+        " the rest)",
+    )
+    what.add_argument("--member", help="the name of a member of a compressed tar")
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=None,
+        help="file to write to; default: stdout for a range, the member's name"
+        " (without its directories) for a member",
+    )
+    args = parser.parse_args(argv)
+
+    path_to_final_file = Path(args.final)
+    path_to_index_file = path_to_index(path_to_final_file)
+    if not path_to_index_file.exists():
+        print(f"there is no index at {path_to_index_file}", file=sys.stderr)
+        return 1
+    reader = IndexedXzReader(path_to_final_file, read_streams(path_to_index_file))
+    try:
+        if args.range is not None:
+            start, end = args.range
+            end = reader.length if end is None else end
+            path_to_output = args.output
+        else:
+            try:
+                member = find_member(path_to_index_file, reader, args.member)
+            except tarfile.ReadError:
+                print(f"{path_to_final_file} is not a compressed tar", file=sys.stderr)
+                return 1
+            if member is None:
+                print(f"there is no member {args.member}", file=sys.stderr)
+                return 1
+            if member[0] not in (tarfile.REGTYPE.decode(), tarfile.AREGTYPE.decode()):
+                print(f"{args.member} is not a regular file", file=sys.stderr)
+                return 1
+            start, end = member[2], member[2] + member[3]
+            path_to_output = args.output or Path(args.member).name
+        if path_to_output is None:
+            written = extract_range(reader, start, end, sys.stdout.buffer)
+        else:
+            with open(path_to_output, "wb") as output:
+                written = extract_range(reader, start, end, output)
+            print(f"extracted {written} bytes to {path_to_output}", file=sys.stderr)
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,438 @@
+"""test or decompress a final file on every core, one xz stream (part) per process.
+
+the final file is a series of independent xz streams, so unlike xz -d (which works
+through them one after another) each stream can be decoded in a process of its own. the
+boundaries of the streams are read from the index beside the final file (see xzindex),
+or found by scanning the file backward from its end: each stream ends in a footer naming
+the length of its index, and the index lists the length of each block, which leads to the
+header of the stream and to the footer of the stream before it.
+
+the streams are decoded in a pool of processes that read their range of the final file
+themselves, so only the decoded data (or, when testing, only its length and hash) is sent
+back. decoded data is written out in order, with no more streams decoded ahead than
+twice the count of processes. each stream's length is checked against the range it
+should decompress to and, where known, the blake2b hash of its data against the hash of
+the part it was compressed from, recorded by the job (in the index or the work database)
+or taken from the original file when it is given.
+
+
+Typical usage example:
+
+$ python3 gompress.py test workdir/<hash>/final/myfile.raw.xz --original myfile.raw
+$ python3 gompress.py decompress workdir/<hash>/final/myfile.raw.xz -o myfile.raw
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+import argparse
+import hashlib
+import lzma
+import os
+import sqlite3
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from debug.mylogging import g_logger
+from workdirectoryinfo import HASH_READ_SIZE, TREE_HASH_DIGEST_SIZE, _part_hash
+from xzindex import path_to_index, read_streams
+
+STREAM_HEADER_MAGIC = b"\xfd7zXZ\x00"
+STREAM_FOOTER_MAGIC = b"YZ"
+STREAM_HEADER_SIZE = 12
+STREAM_FOOTER_SIZE = 12
+
+
+class XzFormatError(Exception):
+    """the final file is not a series of xz streams"""
+
+
+def _read_exactly(f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) != length:
+        raise XzFormatError(f"the file ended reading {length} bytes at {offset}")
+    return data
+
+
+def _decode_varint(buffer, position):
+    """decode the xz multibyte integer at position, return it and the position after"""
+    value = 0
+    for i in range(9):
+        byte = buffer[position + i]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, position + i + 1
+    raise XzFormatError("a multibyte integer of the index is too long")
+
+
+def _round_up_4(length):
+    return -(-length // 4) * 4
+
+
+def scan_streams(path_to_final_file):
+    """find the xz streams of a file from their footers and indexes (see module doc)
+
+    Returns:
+        list of (compressed start, compressed end, start, end, None) in order, where
+        [start, end) is the range of the decompressed file the stream decompresses to
+    """
+    found = []
+    with open(path_to_final_file, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            # stream padding (null bytes in fours) may follow a stream
+            while position >= 4 and _read_exactly(f, position - 4, 4) == bytes(4):
+                position -= 4
+            if position < STREAM_HEADER_SIZE + STREAM_FOOTER_SIZE:
+                raise XzFormatError(f"no stream ends at {position}")
+            footer = _read_exactly(f, position - STREAM_FOOTER_SIZE, STREAM_FOOTER_SIZE)
+            if footer[10:12] != STREAM_FOOTER_MAGIC:
+                raise XzFormatError(f"no stream footer ends at {position}")
+            index_size = (struct.unpack_from("<I", footer, 4)[0] + 1) * 4
+            index_start = position - STREAM_FOOTER_SIZE - index_size
+            if index_start < STREAM_HEADER_SIZE:
+                raise XzFormatError(f"the index of the stream ending at {position}")
+            index = _read_exactly(f, index_start, index_size)
+            if index[0] != 0:
+                raise XzFormatError(f"no index begins at {index_start}")
+            record_count, cursor = _decode_varint(index, 1)
+            blocks_size = 0
+            uncompressed_size = 0
+            for _ in range(record_count):
+                unpadded_size, cursor = _decode_varint(index, cursor)
+                block_uncompressed_size, cursor = _decode_varint(index, cursor)
+                blocks_size += _round_up_4(unpadded_size)
+                uncompressed_size += block_uncompressed_size
+            stream_start = index_start - blocks_size - STREAM_HEADER_SIZE
+            if (
+                stream_start < 0
+                or _read_exactly(f, stream_start, len(STREAM_HEADER_MAGIC))
+                != STREAM_HEADER_MAGIC
+            ):
+                raise XzFormatError(f"no stream header at {stream_start}")
+            found.append((stream_start, position, uncompressed_size))
+            position = stream_start
+
+    streams = []
+    start = 0
+    for compressed_start, compressed_end, uncompressed_size in reversed(found):
+        streams.append(
+            (compressed_start, compressed_end, start, start + uncompressed_size, None)
+        )
+        start += uncompressed_size
+    return streams
+
+
+def _hashes_from_work_db(path_to_final_file, streams):
+    """fill in the hashes of the streams from the Part table of the job's work database
+    (workdir/<hash>/work.db beside the final directory) where the ranges match"""
+    path_to_work_db = Path(path_to_final_file).resolve().parent.parent / "work.db"
+    if not path_to_work_db.exists():
+        return streams
+    con = sqlite3.connect(str(path_to_work_db))
+    try:
+        part_hashes = {
+            (start, end): part_hash
+            for start, end, part_hash in con.execute(
+                "SELECT start, end, hash FROM Part WHERE hash IS NOT NULL"
+            )
+        }
+    except sqlite3.DatabaseError as e:
+        g_logger.debug(f"could not read part hashes from {path_to_work_db}: {e}")
+        return streams
+    finally:
+        con.close()
+    return [
+        (*stream[:4], part_hashes.get((stream[2], stream[3]))) for stream in streams
+    ]
+
+
+def locate_streams(path_to_final_file, scan=False):
+    """return the streams of a final file, from its index unless missing or scan is set
+
+    Returns:
+        list of (compressed start, compressed end, start, end, hash or None) in order
+    """
+    path_to_index_file = path_to_index(path_to_final_file)
+    if not scan and path_to_index_file.exists():
+        return read_streams(path_to_index_file)
+    g_logger.debug(f"scanning {path_to_final_file} for its streams")
+    return _hashes_from_work_db(path_to_final_file, scan_streams(path_to_final_file))
+
+
+def decode_range(
+    path_to_final_file,
+    compressed_start,
+    compressed_end,
+    keep_data,
+    path_to_original=None,
+    start=0,
+    end=0,
+):
+    """(runs in a pool process) decompress the streams of a range of the final file
+
+    Args:
+        path_to_final_file: path string to the final file
+        compressed_start: offset of the first stream
+        compressed_end: offset one past the last stream (and its padding)
+        keep_data: whether to return the decompressed data (else only test it)
+        path_to_original: path string to the original file to hash [start, end) of, or
+            None
+        start, end: the range of the original the streams decompress to
+
+    Returns:
+        (length decompressed, blake2b hash of it, hash of the original range or None,
+        the decompressed bytes or None)
+
+    Raises:
+        lzma.LZMAError: a stream is corrupt (e.g. its check does not match)
+        XzFormatError: the range ends within a stream
+    """
+    blake2b = hashlib.blake2b(digest_size=TREE_HASH_DIGEST_SIZE)
+    decompressed_chunks = [] if keep_data else None
+    length = 0
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    with open(path_to_final_file, "rb", buffering=0) as f:
+        f.seek(compressed_start)
+        remaining = compressed_end - compressed_start
+        data = b""
+        while remaining > 0 or data:
+            if not data:
+                data = f.read(min(HASH_READ_SIZE, remaining))
+                if not data:
+                    raise XzFormatError("the final file ended within a stream")
+                remaining -= len(data)
+            if decompressor.eof:
+                # the next stream of the range, past any padding
+                data = data.lstrip(b"\x00")
+                if not data:
+                    continue
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+            out = decompressor.decompress(data)
+            data = decompressor.unused_data if decompressor.eof else b""
+            blake2b.update(out)
+            length += len(out)
+            if keep_data:
+                decompressed_chunks.append(out)
+    if not decompressor.eof:
+        raise XzFormatError(
+            f"the range ending at {compressed_end} ends within a stream"
+        )
+    original_hash = None
+    if path_to_original is not None:
+        original_hash = _part_hash(path_to_original, start, end)
+    return (
+        length,
+        blake2b.hexdigest(),
+        original_hash,
+        b"".join(decompressed_chunks) if keep_data else None,
+    )
+
+
+def run(
+    path_to_final_file,
+    output=None,
+    max_workers=None,
+    scan=False,
+    path_to_original=None,
+    check_hashes=True,
+):
+    """decode the streams of a final file in parallel, writing them in order to output
+
+    Args:
+        path_to_final_file: the Path to the final file
+        output: binary file object to write the decompressed file to, None to test only
+        max_workers: processes to decode in, None for one per core
+        scan: whether to find the streams by scanning even if the index exists
+        path_to_original: Path to the original file to compare the hash of each range
+            with (instead of the hashes recorded by the job), or None
+        check_hashes: whether to compare hashes (recorded or of the original)
+
+    Returns:
+        whether every stream decoded to the length and (where known) hash expected
+    """
+    if max_workers is None or max_workers < 1:
+        max_workers = os.cpu_count() or 1
+    streams = locate_streams(path_to_final_file, scan)
+    verb = "testing" if output is None else "decompressing"
+    hashed_count = 0
+    OK = True
+    start_time = time.perf_counter()
+    # no event loop runs here, so the processes may be forked where the platform can
+    # (spawned ones would import gompress.py all over again)
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        in_flight = deque()
+        remaining_streams = iter(enumerate(streams))
+        status = ""
+        while True:
+            # keep up to two streams per process decoding ahead of the one written next
+            for i, stream in remaining_streams:
+                in_flight.append(
+                    (
+                        i,
+                        stream,
+                        pool.submit(
+                            decode_range,
+                            str(path_to_final_file),
+                            stream[0],
+                            stream[1],
+                            output is not None,
+                            str(path_to_original)
+                            if check_hashes and path_to_original is not None
+                            else None,
+                            stream[2],
+                            stream[3],
+                        ),
+                    )
+                )
+                if len(in_flight) >= 2 * max_workers:
+                    break
+            if len(in_flight) == 0:
+                break
+            i, stream, future = in_flight.popleft()
+            status = f"{verb} stream {i + 1} of {len(streams)}..."
+            print(status, end="\r", file=sys.stderr)
+            try:
+                length, stream_hash, original_hash, data = future.result()
+            except (lzma.LZMAError, XzFormatError) as e:
+                print(f"\nstream {i + 1} CORRUPT: {e}", file=sys.stderr)
+                OK = False
+                break
+            expected_hash = original_hash if path_to_original is not None else stream[4]
+            if length != stream[3] - stream[2]:
+                print(
+                    f"\nstream {i + 1} LENGTH MISMATCH: {length} for the range"
+                    f" [{stream[2]}, {stream[3]})",
+                    file=sys.stderr,
+                )
+                OK = False
+                break
+            if check_hashes and expected_hash is not None:
+                if stream_hash != expected_hash:
+                    print(f"\nstream {i + 1} HASH MISMATCH", file=sys.stderr)
+                    OK = False
+                    break
+                hashed_count += 1
+            if data is not None:
+                output.write(data)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    elapsed = time.perf_counter() - start_time
+
+    ###########################
+    # report the throughput   #
+    ###########################
+    if OK:
+        print(f"{status}\033[32m\u2713\033[0m", file=sys.stderr)
+        mib = (streams[-1][3] if len(streams) > 0 else 0) / 2**20
+        print(
+            f"{'tested' if output is None else 'decompressed'} {mib:,.{2}f}MiB from {len(streams)} streams in {elapsed:.{2}f}s"
+            f" ({mib / max(elapsed, 1e-6):,.{1}f}MiB/s on {max_workers} process{'es' if max_workers > 1 else ''}),"
+            f" {hashed_count} of {len(streams)} compared by hash",
+            file=sys.stderr,
+        )
+    return OK
+
+
+def main(argv=None, command="test"):
+    """test (command "test") or decompress (command "decompress") a final file, return
+    the exit status"""
+    decompress = command == "decompress"
+    parser = argparse.ArgumentParser(
+        prog=f"gompress.py {command}",
+        description=(
+            "decompress a final file compressed by gompress"
+            if decompress
+            else "test a final file compressed by gompress"
+        )
+        + ", decoding its streams (parts) in parallel",
+    )
+    parser.add_argument("final", help="the final .xz file")
+    if decompress:
+        parser.add_argument(
+            "--output",
+            "-o",
+            default=None,
+            help="file to write to, - for stdout; default: the final file's name"
+            " without .xz in the current directory",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="overwrite the output file if it exists",
+        )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes decoding streams; default: one per core",
+    )
+    parser.add_argument(
+        "--scan",
+        action="store_true",
+        help="find the streams by scanning the file even if its index exists",
+    )
+    parser.add_argument(
+        "--original",
+        default=None,
+        help="the original file, to compare each part with by hash (instead of the"
+        " hashes recorded by the job, if any)",
+    )
+    parser.add_argument(
+        "--no-hash-check",
+        action="store_true",
+        help="do not compare hashes, only decode and check lengths",
+    )
+    args = parser.parse_args(argv)
+
+    path_to_final_file = Path(args.final)
+    if not path_to_final_file.is_file():
+        print(f"there is no file {path_to_final_file}", file=sys.stderr)
+        return 1
+    path_to_original = Path(args.original) if args.original is not None else None
+    run_kwargs = dict(
+        max_workers=args.workers,
+        scan=args.scan,
+        path_to_original=path_to_original,
+        check_hashes=not args.no_hash_check,
+    )
+    try:
+        if not decompress:
+            OK = run(path_to_final_file, **run_kwargs)
+        elif args.output == "-":
+            OK = run(path_to_final_file, sys.stdout.buffer, **run_kwargs)
+        else:
+            path_to_output = Path(
+                args.output
+                if args.output is not None
+                else path_to_final_file.name.removesuffix(".xz")
+            )
+            if path_to_output.exists() and not args.force:
+                print(
+                    f"{path_to_output} exists, pass --force to overwrite it",
+                    file=sys.stderr,
+                )
+                return 1
+            with open(path_to_output, "wb") as output:
+                OK = run(path_to_final_file, output, **run_kwargs)
+            if not OK:
+                path_to_output.unlink()
+    except XzFormatError as e:
+        print(
+            f"{path_to_final_file} is not a series of xz streams: {e}", file=sys.stderr
+        )
+        return 1
+    return 0 if OK else 1
+
+
+if __name__ == "__main__":
+    # e.g. python3 xzparallel.py decompress final.xz, the command defaults to test
+    if len(sys.argv) > 1 and sys.argv[1] in ("test", "decompress"):
+        sys.exit(main(sys.argv[2:], sys.argv[1]))
+    sys.exit(main())
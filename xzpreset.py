@@ -0,0 +1,78 @@
+"""map the length of a part to the xz preset (and dictionary size) suited to it.
+
+xz allocates a dictionary of a size fixed by the preset regardless of the length of the
+input, so a part shorter than the dictionary wastes provider memory without improving
+compression. the preset chosen for a part is therefore the one whose dictionary first
+does not exceed the part.
+"""
+
+# authored by krunch3r (https://www.github.com/krunch3r76)
+# license GPL 3.0
+
+KiB = 2**10
+MiB = 2**20
+
+# dictionary size of each preset level (xz(1) "Compression presets")
+DICTIONARY_SIZES = {
+    0: 256 * KiB,
+    1: 1 * MiB,
+    2: 2 * MiB,
+    3: 4 * MiB,
+    4: 4 * MiB,
+    5: 8 * MiB,
+    6: 8 * MiB,
+    7: 16 * MiB,
+    8: 32 * MiB,
+    9: 64 * MiB,
+}
+
+
+def find_optimal_xz_preset(file_length):
+    """map a file_length to the xz dictionary size that first does not exceed it
+    and return corresponding compression argument
+
+
+    :param file_length: length of the file (part) to compress
+
+
+    rationale: it is a waste of memory to use a dictionary size bigger than the
+    uncompressed file. this may imply less complexity depending on how xz implements.
+    """
+
+    if file_length < 256 * KiB:
+        return "-0e"
+    elif file_length < 2 * MiB:
+        return "-1e"
+    elif file_length < 4 * MiB:
+        return "-2e"
+    elif file_length < 8 * MiB:
+        return "-4e"
+    elif file_length < 16 * MiB:
+        return "-6e"
+    elif file_length < 32 * MiB:
+        return "-7e"
+    elif file_length < 64 * MiB:
+        return "-8e"
+    else:
+        return "-9e"
+
+
+def preset_level(compression_argument):
+    """return the level (0-9) of a compression argument such as "-9e" """
+    return int(compression_argument.strip("-e"))
+
+
+def dictionary_size(file_length):
+    """return the dictionary size of the preset find_optimal_xz_preset picks for file_length"""
+    return DICTIONARY_SIZES[preset_level(find_optimal_xz_preset(file_length))]
+
+
+def xz_arguments(file_length):
+    """return the arguments passed to xz (via xz.sh) to compress a part of file_length
+
+    -T1 is passed: each task runs one xz thread and the parallelism comes from the
+    parts being compressed on many providers at once. more threads would multiply the
+    memory a provider needs (a dictionary per thread) and split a part into blocks
+    compressed independently, which compresses worse.
+    """
+    return ["-T1", find_optimal_xz_preset(file_length)]